@@ -0,0 +1,320 @@
+from __future__ import annotations
+
+import argparse
+import os
+import warnings
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.multioutput import MultiOutputRegressor
+
+from feature_store import FeatureStore, load_store
+from polynomial import fit_polynomial_model, predict_targets
+from xgb_pipeline import (
+    DATA_DIR,
+    EVAL_COLUMNS,
+    TRAIN_START,
+    YEAR_COL,
+    evaluate_predictions,
+    load_pkd_to_vars,
+    load_targets,
+    make_xgb_model,
+    prepare_pkd_dataset,
+    threads_per_job,
+    worker_pool,
+)
+
+
+BACKTEST_OUTPUT_PATH = DATA_DIR / "backtest_results.csv"
+BACKTEST_COLUMNS = ["model", "fold"] + EVAL_COLUMNS
+MODELS = ("polynomial", "xgb")
+DEFAULT_HORIZON = 2
+DEFAULT_MIN_TRAIN = 3
+POLY_DEGREE = 2
+
+# Set per worker process by `_init_worker`; jobs only ship (model, pkd, fold).
+_WORKER_DATA: dict = {}
+
+
+@dataclass
+class PKDMatrices:
+    """
+    One PKD's per-year design, built once and sliced by every fold.
+
+    Rows are the years where every target is known (the same rows the
+    single-split evaluation keeps), in ascending order.
+    """
+
+    pkd_code: str
+    years: np.ndarray
+    X: np.ndarray
+    Y: np.ndarray
+    feature_cols: list[str]
+    target_cols: list[str]
+    missing_features: list[str]
+
+    def fold(self, origin: int, horizon: int) -> tuple[np.ndarray, np.ndarray]:
+        """Row masks for training years <= origin and test years in (origin, origin + horizon]."""
+        train = self.years <= origin
+        test = (self.years > origin) & (self.years <= origin + horizon)
+        return train, test
+
+
+def build_matrices(
+    store: FeatureStore,
+    df_target: pd.DataFrame,
+    pkd_to_vars: dict[str, list[str]],
+    pkd_codes: list[str],
+    train_start: int = TRAIN_START,
+) -> dict[str, PKDMatrices]:
+    """Per-PKD feature/target matrices for every year from `train_start` on."""
+    matrices = {}
+    for pkd_code in pkd_codes:
+        df_merged, feature_cols, target_cols, missing_features = prepare_pkd_dataset(
+            pkd_code, store, df_target, pkd_to_vars
+        )
+        if df_merged is None:
+            continue
+        rows = (df_merged[YEAR_COL] >= train_start) & df_merged[target_cols].notna().all(axis=1)
+        df_merged = df_merged[rows]
+        matrices[pkd_code] = PKDMatrices(
+            pkd_code=pkd_code,
+            years=df_merged[YEAR_COL].to_numpy(),
+            X=df_merged[feature_cols].to_numpy(dtype=float),
+            Y=df_merged[target_cols].to_numpy(dtype=float),
+            feature_cols=feature_cols,
+            target_cols=target_cols,
+            missing_features=missing_features,
+        )
+    return matrices
+
+
+def default_origins(
+    matrices: dict[str, PKDMatrices],
+    horizon: int = DEFAULT_HORIZON,
+    min_train: int = DEFAULT_MIN_TRAIN,
+) -> list[int]:
+    """
+    Fold origins (last training year) with at least `min_train` training
+    rows in some PKD and a full `horizon` of later years in the data.
+    """
+    years = np.unique(np.concatenate([m.years for m in matrices.values()] or [np.array([])]))
+    if years.size == 0:
+        return []
+    last_year = int(years.max())
+    origins = []
+    for origin in range(int(years.min()), last_year - horizon + 1):
+        if any((m.years <= origin).sum() >= min_train for m in matrices.values()):
+            origins.append(origin)
+    return origins
+
+
+def _predict_polynomial(m: PKDMatrices, train: np.ndarray, test: np.ndarray) -> np.ndarray:
+    df = pd.DataFrame(m.Y[train], columns=m.target_cols)
+    df.insert(0, "year", m.years[train])
+    poly_reg, lambdas, constants, target_offsets = fit_polynomial_model(
+        df,
+        train_start_year=int(m.years[train].min()),
+        degree=POLY_DEGREE,
+        verbose=False,
+        extrapolate_to=m.years[test],
+    )
+    return predict_targets(
+        poly_reg, lambdas, constants, target_offsets, m.years[test]
+    ).to_numpy()
+
+
+def _predict_xgb(
+    m: PKDMatrices, train: np.ndarray, test: np.ndarray, n_jobs: int
+) -> np.ndarray:
+    model = MultiOutputRegressor(make_xgb_model(random_state=42, n_jobs=n_jobs))
+    model.fit(m.X[train], m.Y[train])
+    return model.predict(m.X[test])
+
+
+def evaluate_fold(
+    model_name: str,
+    m: PKDMatrices,
+    origin: int,
+    horizon: int = DEFAULT_HORIZON,
+    min_train: int = DEFAULT_MIN_TRAIN,
+    n_jobs: int = -1,
+) -> list[dict]:
+    """Metric rows for one (model, PKD, fold); empty if the fold is too small."""
+    train, test = m.fold(origin, horizon)
+    n_train, n_test = int(train.sum()), int(test.sum())
+    if n_train < min_train or n_test == 0:
+        return []
+
+    if model_name == "polynomial":
+        y_pred = _predict_polynomial(m, train, test)
+    elif model_name == "xgb":
+        y_pred = _predict_xgb(m, train, test, n_jobs)
+    else:
+        raise ValueError(f"Unknown model '{model_name}'; expected one of {MODELS}.")
+
+    # Polynomial forecasts past the Box–Cox domain are inf/NaN; their
+    # targets get NaN metrics for this fold.
+    finite = np.isfinite(y_pred).all(axis=0)
+    with warnings.catch_warnings():
+        # R^2 is undefined for single-year test windows; it is reported as NaN.
+        warnings.simplefilter("ignore")
+        results = evaluate_predictions(
+            pd.DataFrame(m.Y[test], columns=m.target_cols),
+            np.where(finite, y_pred, 0.0),
+            m.target_cols,
+        )
+    return [
+        {
+            "model": model_name,
+            "fold": origin,
+            "pkd_code": m.pkd_code,
+            "target": target_name,
+            "n_train": n_train,
+            "n_test": n_test,
+            "mae": mae if ok else np.nan,
+            "rmse": rmse if ok else np.nan,
+            "r2": r2 if ok else np.nan,
+            "n_features_used": len(m.feature_cols) if model_name == "xgb" else 0,
+            "missing_features": ";".join(m.missing_features) if model_name == "xgb" else "",
+        }
+        for (target_name, mae, rmse, r2), ok in zip(results, finite)
+    ]
+
+
+def _init_worker(matrices: dict[str, PKDMatrices], options: dict) -> None:
+    _WORKER_DATA.update(matrices=matrices, options=options)
+
+
+def _evaluate_in_worker(job: tuple[str, str, int]) -> list[dict]:
+    model_name, pkd_code, origin = job
+    m = _WORKER_DATA["matrices"][pkd_code]
+    return evaluate_fold(model_name, m, origin, **_WORKER_DATA["options"])
+
+
+def run_backtest(
+    pkd_codes: list[str] | None = None,
+    models: tuple[str, ...] = MODELS,
+    origins: list[int] | None = None,
+    horizon: int = DEFAULT_HORIZON,
+    min_train: int = DEFAULT_MIN_TRAIN,
+    workers: int | None = None,
+) -> pd.DataFrame:
+    """
+    Expanding-window backtest of the polynomial and XGB models.
+
+    Each fold trains on every complete year up to its origin and tests on
+    the next `horizon` years. Matrices are built once in the parent and
+    shared with the worker pool; every (model, PKD, fold) is one job.
+    """
+    pkd_to_vars = load_pkd_to_vars()
+    pkd_codes = sorted(pkd_codes if pkd_codes is not None else pkd_to_vars)
+    matrices = build_matrices(load_store(), load_targets(), pkd_to_vars, pkd_codes)
+    if origins is None:
+        origins = default_origins(matrices, horizon, min_train)
+
+    jobs = [
+        (model_name, pkd_code, origin)
+        for model_name in models
+        for pkd_code in matrices
+        for origin in origins
+    ]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(jobs) or 1))
+    options = {"horizon": horizon, "min_train": min_train, "n_jobs": threads_per_job(workers)}
+    print(
+        f"Backtesting {len(models)} models x {len(matrices)} PKD codes x "
+        f"{len(origins)} folds (origins {origins}) on {workers} workers."
+    )
+
+    if workers == 1:
+        _init_worker(matrices, options)
+        results = [_evaluate_in_worker(job) for job in jobs]
+    else:
+        with worker_pool(workers, options["n_jobs"], _init_worker, (matrices, options)) as pool:
+            # map() keeps job order, so the table comes out sorted by model, PKD, fold.
+            chunksize = max(1, len(jobs) // (4 * workers))
+            results = list(pool.map(_evaluate_in_worker, jobs, chunksize=chunksize))
+
+    rows = [row for job_rows in results for row in job_rows]
+    return pd.DataFrame(rows, columns=BACKTEST_COLUMNS)
+
+
+def summarize(results: pd.DataFrame) -> pd.DataFrame:
+    """Median MAE/RMSE/R^2 per model and fold, across PKD codes and targets."""
+    return results.groupby(["model", "fold"])[["mae", "rmse", "r2"]].median()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Rolling-origin backtest of the polynomial and XGB models per PKD."
+    )
+    parser.add_argument(
+        "--pkd",
+        nargs="+",
+        default=None,
+        help="PKD codes to backtest (default: every code in pkd_to_variables.json).",
+    )
+    parser.add_argument(
+        "--models",
+        nargs="+",
+        choices=MODELS,
+        default=list(MODELS),
+        help="Models to backtest.",
+    )
+    parser.add_argument(
+        "--origins",
+        nargs="+",
+        type=int,
+        default=None,
+        help="Last training year of each fold (default: every year with enough data).",
+    )
+    parser.add_argument(
+        "--horizon",
+        type=int,
+        default=DEFAULT_HORIZON,
+        help="Number of years tested after each origin.",
+    )
+    parser.add_argument(
+        "--min-train",
+        type=int,
+        default=DEFAULT_MIN_TRAIN,
+        help=f"Skip folds with fewer complete training years than this (more than {POLY_DEGREE}).",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Worker processes (default: one per core; 1 runs in-process).",
+    )
+    parser.add_argument(
+        "--output-path",
+        type=Path,
+        default=BACKTEST_OUTPUT_PATH,
+        help="Path where the backtest metrics CSV will be saved.",
+    )
+    args = parser.parse_args()
+    if args.min_train <= POLY_DEGREE:
+        parser.error(f"--min-train must exceed the polynomial degree ({POLY_DEGREE}).")
+    return args
+
+
+def main() -> None:
+    args = parse_args()
+    results = run_backtest(
+        pkd_codes=args.pkd,
+        models=tuple(args.models),
+        origins=args.origins,
+        horizon=args.horizon,
+        min_train=args.min_train,
+        workers=args.workers,
+    )
+    args.output_path.parent.mkdir(parents=True, exist_ok=True)
+    results.to_csv(args.output_path, index=False)
+    print(summarize(results))
+    print(f"Saved {len(results)} backtest rows to: {args.output_path.resolve()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from krz_cube import KRZCube
+from polynomial import fit_polynomial_model, forecast_future
+from prepare_dashboard_data import load_series_for_codes, normalize_series
+from sector_pie_chart import prepare_segments
+
+
+BASE_DIR = Path(__file__).parent
+BASELINE_PATH = BASE_DIR / "benchmark_baseline.json"
+LAST_YEAR = 2024
+DEFAULT_REPEAT = 5
+DEFAULT_TOLERANCE = 0.25
+SECTIONS = "ABCDEFGHIJKLMNOPQRS"
+
+
+@dataclass(frozen=True)
+class Size:
+    """Synthetic input scale: PKD groups, years of history, metrics per PKD."""
+
+    name: str
+    pkds: int
+    years: int
+    metrics: int
+
+
+SIZES = {
+    "small": Size("small", pkds=15, years=20, metrics=8),
+    "medium": Size("medium", pkds=150, years=30, metrics=8),
+    "large": Size("large", pkds=600, years=40, metrics=8),
+}
+
+
+def synthetic_groups(n: int) -> list[str]:
+    """`n` distinct dotted PKD group codes ('01.1', '01.2', ...), spread over divisions."""
+    return [f"{1 + i // 9:02d}.{1 + i % 9}" for i in range(n)]
+
+
+def _years(size: Size) -> list[int]:
+    return list(range(LAST_YEAR - size.years + 1, LAST_YEAR + 1))
+
+
+def synthetic_indicator_sheet(size: Size, rng: np.random.Generator, metric: str = "GS") -> pd.DataFrame:
+    """
+    A GS_filtered / NWC_filtered shaped sheet: one row per section,
+    division, group and class code ('SEK_A', '01.', '01.1', '01.11'), one
+    column per year, with a sprinkling of 'bd' (no data) cells.
+    """
+    groups = synthetic_groups(size.pkds)
+    codes = []
+    for group in groups:
+        division = group[:2]
+        section = f"SEK_{SECTIONS[int(division) % len(SECTIONS)]}"
+        for code in (section, f"{division}.", group, f"{group}1", f"{group}2"):
+            if not codes or code not in codes[-5:]:
+                codes.append(code)
+    years = _years(size)
+    level = rng.lognormal(8, 1.5, size=(len(codes), 1))
+    growth = np.cumprod(1 + rng.normal(0.03, 0.08, size=(len(codes), len(years))), axis=1)
+    values = pd.DataFrame(np.round(level * growth, 2), columns=years).astype(object)
+    values = values.mask(rng.random(values.shape) < 0.02, "bd")
+    sheet = pd.DataFrame(
+        {
+            "numer PKD": codes,
+            "nazwa PKD": [f"Sektor {c}" for c in codes],
+            "numer i nazwa PKD": [f"{c} Sektor {c}" for c in codes],
+            "wskaźnik": metric,
+        }
+    )
+    return pd.concat([sheet, values], axis=1)
+
+
+def synthetic_krz(size: Size, rng: np.random.Generator) -> pd.DataFrame:
+    """A krz_pkd.csv shaped table: (year, subclass code, bankruptcy count) rows."""
+    groups = synthetic_groups(size.pkds)
+    subclasses = [f"{g.replace('.', '')}{c}Z" for g in groups for c in (1, 2)]
+    years = _years(size)
+    rows = pd.MultiIndex.from_product([years, subclasses], names=["rok", "pkd"]).to_frame(index=False)
+    rows["liczba_upadlosci"] = rng.poisson(5, size=len(rows))
+    return rows[rows["liczba_upadlosci"] > 0].reset_index(drop=True)
+
+
+def synthetic_wide(size: Size, rng: np.random.Generator) -> pd.DataFrame:
+    """A df_pivot / DATA_PKD_SPECIFIC shaped frame: 'year' plus '<PKD>_<metric>' columns."""
+    columns = [f"{g}_M{m}" for g in synthetic_groups(size.pkds) for m in range(size.metrics)]
+    years = _years(size)
+    level = rng.lognormal(5, 1, size=(1, len(columns)))
+    trend = np.cumprod(1 + rng.normal(0.02, 0.05, size=(len(years), len(columns))), axis=0)
+    wide = pd.DataFrame(level * trend, columns=columns)
+    wide.insert(0, "year", years)
+    return wide
+
+
+def synthetic_shares(size: Size, rng: np.random.Generator) -> pd.DataFrame:
+    """A GS_filtered_xx.x shaped frame with a 'percentage in total' share per PKD."""
+    groups = synthetic_groups(size.pkds * 4)
+    share = rng.dirichlet(np.ones(len(groups))) * 100
+    return pd.DataFrame({"numer i nazwa PKD": [f"{g} Sektor {g}" for g in groups], "percentage in total": share})
+
+
+def _quiet(fn, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args, **kwargs)
+
+
+def cases(size: Size, seed: int = 0) -> dict[str, tuple]:
+    """
+    name -> (callable, items processed per call) for one size; inputs are
+    generated up front so only the function under test is timed.
+    """
+    rng = np.random.default_rng(seed)
+    gs = synthetic_indicator_sheet(size, rng)
+    groups = synthetic_groups(size.pkds)
+    wide = synthetic_wide(size, rng)
+    train_start = int(wide["year"].min())
+    fitted = fit_polynomial_model(wide, train_start_year=train_start, degree=2, verbose=False)
+    series = load_series_for_codes(gs, groups, "numer PKD")
+    krz = synthetic_krz(size, rng)
+    shares = synthetic_shares(size, rng)
+    targets = wide.shape[1] - 1
+    return {
+        "fit_polynomial_model": (
+            lambda: fit_polynomial_model(wide, train_start_year=train_start, degree=2, verbose=False),
+            targets * size.years,
+        ),
+        "forecast_future": (lambda: _quiet(forecast_future, wide, *fitted, horizon=3), targets * 3),
+        "load_series_for_codes": (lambda: load_series_for_codes(gs, groups, "numer PKD"), len(groups)),
+        "normalize_series": (lambda: normalize_series(series), len(series)),
+        "prepare_segments": (lambda: prepare_segments(shares, 15), len(shares)),
+        "KRZCube.build": (lambda: KRZCube.build(krz, {}), len(krz)),
+    }
+
+
+def measure(fn, items: int, repeat: int = DEFAULT_REPEAT) -> dict:
+    """Median/min seconds over `repeat` calls, throughput, and one traced allocation peak."""
+    fn()  # warm-up: imports, caches, first-call allocations
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    median = float(np.median(times))
+    return {
+        "median_s": median,
+        "min_s": float(min(times)),
+        "items": items,
+        "items_per_s": items / median if median else float("inf"),
+        "peak_alloc_mb": peak / 1024 / 1024,
+    }
+
+
+def run(sizes: list[Size], only: list[str] | None = None, repeat: int = DEFAULT_REPEAT) -> pd.DataFrame:
+    rows = []
+    for size in sizes:
+        for name, (fn, items) in cases(size).items():
+            if only and name not in only:
+                continue
+            result = measure(fn, items, repeat)
+            rows.append({"case": name, "size": size.name, "pkds": size.pkds, "years": size.years, **result})
+            print(
+                f"{name:<22} {size.name:<7} {result['median_s'] * 1e3:>10.2f} ms "
+                f"{result['items_per_s']:>14,.0f} items/s {result['peak_alloc_mb']:>8.2f} MB"
+            )
+    return pd.DataFrame(rows)
+
+
+def compare(results: pd.DataFrame, baseline: dict, tolerance: float = DEFAULT_TOLERANCE) -> pd.DataFrame:
+    """
+    Best-of-repeat time against the baseline per (case, size); the minimum
+    is far less sensitive to a busy machine than the median.
+    """
+    base = pd.DataFrame(baseline["results"])[["case", "size", "min_s"]]
+    merged = results.merge(base, on=["case", "size"], how="left", suffixes=("", "_baseline"))
+    merged["ratio"] = merged["min_s"] / merged["min_s_baseline"]
+    merged["regressed"] = merged["ratio"] > 1 + tolerance
+    return merged[["case", "size", "min_s", "min_s_baseline", "ratio", "regressed"]]
+
+
+def save_baseline(results: pd.DataFrame, path: Path) -> None:
+    payload = {
+        "machine": platform.platform(),
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "results": results.round(6).to_dict(orient="records"),
+    }
+    path.write_text(json.dumps(payload, indent=2) + "\n", encoding="utf-8")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the forecasting/dashboard hot paths on synthetic PKD-scale inputs."
+    )
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        choices=sorted(SIZES),
+        default=["small", "medium"],
+        help="Preset input sizes to run.",
+    )
+    parser.add_argument(
+        "--custom",
+        nargs=3,
+        type=int,
+        metavar=("PKDS", "YEARS", "METRICS"),
+        default=None,
+        help="Also run one custom size.",
+    )
+    parser.add_argument("--cases", nargs="+", default=None, help="Only run these cases.")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Timed calls per case.")
+    parser.add_argument(
+        "--baseline",
+        type=Path,
+        default=BASELINE_PATH,
+        help="Baseline JSON to compare against.",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help="Allowed slowdown vs baseline before a case counts as regressed (0.25 = 25%%).",
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Overwrite the baseline with this run instead of comparing.",
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Exit with status 1 if any case regressed.",
+    )
+    parser.add_argument("--output", type=Path, default=None, help="Also write this run's results to CSV.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    sizes = [SIZES[name] for name in args.sizes]
+    if args.custom:
+        sizes.append(Size("custom", *args.custom))
+    results = run(sizes, args.cases, args.repeat)
+    if args.output is not None:
+        results.to_csv(args.output, index=False)
+
+    if args.save_baseline:
+        save_baseline(results, args.baseline)
+        print(f"Saved baseline to: {args.baseline.resolve()}")
+        return
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one.")
+        return
+    comparison = compare(results, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance)
+    print(comparison.to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+    regressed = comparison[comparison["regressed"]]
+    if len(regressed):
+        print(f"{len(regressed)} case(s) slower than baseline by more than {args.tolerance:.0%}.")
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
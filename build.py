@@ -0,0 +1,489 @@
+from __future__ import annotations
+
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from data_cache import file_digest
+
+
+BASE_DIR = Path(__file__).parent
+STATE_PATH = BASE_DIR / ".cache" / "build_state.json"
+LOG_DIR = BASE_DIR / ".cache" / "build_logs"
+
+
+@dataclass(frozen=True)
+class Node:
+    """
+    One build step: a command run from the repo root that turns `inputs`
+    into `outputs` (paths relative to the repo root). Script nodes also
+    depend on the source of every local module the script imports.
+    Notebook nodes are only executed with `--notebooks`; otherwise a stale
+    notebook is reported and its checked-in outputs are used as they are.
+    """
+
+    name: str
+    command: tuple[str, ...]
+    inputs: tuple[str, ...]
+    outputs: tuple[str, ...]
+    notebook: bool = False
+    sources: tuple[str, ...] = field(default=(), compare=False)
+
+
+def script(name: str, path: str, inputs, outputs, args=()) -> Node:
+    return Node(
+        name=name,
+        command=("python", path, *args),
+        inputs=tuple(inputs),
+        outputs=tuple(outputs),
+        sources=local_modules(BASE_DIR / path),
+    )
+
+
+def notebook(name: str, path: str, inputs, outputs) -> Node:
+    return Node(
+        name=name,
+        command=("jupyter", "nbconvert", "--to", "notebook", "--execute", "--inplace", path),
+        inputs=(path, *inputs),
+        outputs=tuple(outputs),
+        notebook=True,
+    )
+
+
+def local_modules(path: Path) -> tuple[str, ...]:
+    """The script and every repo module it imports, transitively."""
+    seen: list[str] = []
+    todo = [path]
+    while todo:
+        current = todo.pop()
+        rel = current.relative_to(BASE_DIR).as_posix()
+        if rel in seen or not current.exists():
+            continue
+        seen.append(rel)
+        for node in ast.walk(ast.parse(current.read_text(encoding="utf-8"))):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                candidate = BASE_DIR / f"{name.split('.')[0]}.py"
+                if candidate.exists():
+                    todo.append(candidate)
+    return tuple(sorted(seen))
+
+
+NODES = [
+    notebook(
+        "ratios",
+        "data/add_cols.ipynb",
+        ["data/df_pivot_filtered_numbers.csv"],
+        ["data/df_ratios_finished_final_8_ratios_jig.csv"],
+    ),
+    script(
+        "polynomial",
+        "polynomial.py",
+        ["data/DATA_PKD_SPECIFIC.xlsx"],
+        ["data/polynomial_forecast_next3.csv"],
+    ),
+    script(
+        "features",
+        "feature_store.py",
+        ["data/COMMODITIES_FINAL.xlsx"],
+        [".cache/features/COMMODITIES_FINAL.parquet"],
+    ),
+    script(
+        "xgb",
+        "xgb_pipeline.py",
+        [
+            "pkd_to_variables.json",
+            # Read through the feature store, so the features node runs first.
+            ".cache/features/COMMODITIES_FINAL.parquet",
+            "data/df_pivot_filtered_numbers.csv",
+        ],
+        ["data/xgb_evaluation_results.csv", "data/xgb_forecasts_2025_2027.csv"],
+    ),
+    script(
+        "shap",
+        "xgb_shap.py",
+        [
+            "pkd_to_variables.json",
+            ".cache/features/COMMODITIES_FINAL.parquet",
+            "data/df_pivot_filtered_numbers.csv",
+            # Explains the models the xgb node fitted; runs after it.
+            "data/xgb_forecasts_2025_2027.csv",
+        ],
+        [
+            "data/xgb_shap.npz",
+            "data/xgb_shap_global.csv",
+            "data/xgb_shap_by_pkd.csv",
+            "data/xgb_shap_drivers.json",
+        ],
+    ),
+    script(
+        "backtest",
+        "backtest.py",
+        [
+            "pkd_to_variables.json",
+            ".cache/features/COMMODITIES_FINAL.parquet",
+            "data/df_pivot_filtered_numbers.csv",
+        ],
+        ["data/backtest_results.csv"],
+    ),
+    script(
+        "correlations",
+        "correlations.py",
+        [
+            "data/df_ratios_finished_final_8_ratios_jig.csv",
+            "data/df_pivot_filtered_numbers.csv",
+            "data/krz_pkd.csv",
+            "data/StrukturaPKD2025.xls",
+        ],
+        [
+            "data/corr_ratio_vs_upadlosci.csv",
+            "data/cs_corr_ratio_vs_upadlosci.csv",
+            "data/corr_ratio_vs_EN.csv",
+            "data/cs_corr_ratio_vs_EN.csv",
+        ],
+    ),
+    script(
+        "dashboard",
+        "prepare_dashboard_data.py",
+        [
+            "pkd_to_variables.json",
+            "data/GS_filtered.xlsx",
+            "data/NWC_filtered.xlsx",
+            "data/krz_pkd.csv",
+            "data/StrukturaPKD2025.xls",
+            "data/dane_export.xlsx",
+            "data/LICZBA UPADŁOŚCI %.csv",
+        ],
+        ["data/dashboard_data.json", "data/dashboard/index.json"],
+    ),
+    script(
+        "sector_pie",
+        "sector_pie_chart.py",
+        ["data/GS_filtered_xx.x.xlsx"],
+        ["charts/sector_percentage_pie.png", "charts/sector_top_values.xlsx"],
+    ),
+    script(
+        "charts",
+        "charts.py",
+        ["data/df_ratios_finished_final_8_ratios_jig.csv"],
+        # Hundreds of PNGs; the render manifest stands in for them.
+        [".cache/charts.json"],
+    ),
+    script(
+        "sector_quadrants",
+        "sector_quadrants.py",
+        ["data/df_ratios_finished_final_8_ratios_jig.csv", "data/xgb_forecasts_2025_2027.csv"],
+        ["pkd_groups_by_year.csv", "data/sector_quadrants.csv"],
+    ),
+    notebook(
+        "sector_clusters",
+        "Clustering_Index_i_iny_finalny_szajsik.ipynb",
+        [
+            "data/df_ratios_finished_final_8_ratios_jig.csv",
+            "data/xgb_forecasts_2025_2027.csv",
+            "data/DATA_PKD_SPECIFIC.xlsx",
+            "charts/sector_top_values.xlsx",
+        ],
+        [
+            "pkd_fpi_ranking_animated.html",
+            "pkd_fpi_trends.html",
+            "pkd_46.4_ikb_vs_fpi.html",
+            "FINAL PROJECT/index_branz_i_wskazniki.xlsx",
+        ],
+    ),
+]
+
+
+def dependencies(nodes: list[Node]) -> dict[str, set[str]]:
+    """Node name -> names of the nodes producing any of its inputs."""
+    producer = {}
+    for node in nodes:
+        for output in node.outputs:
+            if output in producer:
+                raise ValueError(f"'{output}' is produced by both {producer[output]} and {node.name}.")
+            producer[output] = node.name
+    return {
+        node.name: {producer[p] for p in node.inputs if p in producer and producer[p] != node.name}
+        for node in nodes
+    }
+
+
+def topological_order(nodes: list[Node], deps: dict[str, set[str]]) -> list[str]:
+    order, state = [], {}
+
+    def visit(name: str, path: tuple[str, ...]) -> None:
+        if state.get(name) == "done":
+            return
+        if state.get(name) == "visiting":
+            raise ValueError(f"Dependency cycle: {' -> '.join(path + (name,))}")
+        state[name] = "visiting"
+        for dep in sorted(deps[name]):
+            visit(dep, path + (name,))
+        state[name] = "done"
+        order.append(name)
+
+    for node in nodes:
+        visit(node.name, ())
+    return order
+
+
+def select(targets: list[str] | None, deps: dict[str, set[str]]) -> set[str]:
+    """The requested nodes and everything upstream of them (all nodes if None)."""
+    if not targets:
+        return set(deps)
+    unknown = sorted(set(targets) - set(deps))
+    if unknown:
+        raise ValueError(f"Unknown nodes {unknown}; expected some of {sorted(deps)}.")
+    selected, todo = set(), list(targets)
+    while todo:
+        name = todo.pop()
+        if name not in selected:
+            selected.add(name)
+            todo.extend(deps[name])
+    return selected
+
+
+class Digests:
+    """File digests memoized on (mtime, size) for the duration of one build."""
+
+    def __init__(self) -> None:
+        self._memo: dict[str, tuple[int, int, str]] = {}
+
+    def __call__(self, rel: str) -> str | None:
+        path = BASE_DIR / rel
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        cached = self._memo.get(rel)
+        if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+        digest = file_digest(path)
+        self._memo[rel] = (stat.st_mtime_ns, stat.st_size, digest)
+        return digest
+
+
+def load_state(path: Path = STATE_PATH) -> dict:
+    if not path.exists():
+        return {}
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except json.JSONDecodeError:
+        return {}
+
+
+def save_state(state: dict, path: Path = STATE_PATH) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def snapshot(node: Node, digests: Digests) -> dict:
+    return {
+        "command": list(node.command),
+        "inputs": {p: digests(p) for p in (*node.inputs, *node.sources)},
+        "outputs": {p: digests(p) for p in node.outputs},
+    }
+
+
+def stale_reason(node: Node, record: dict | None, digests: Digests) -> str | None:
+    """Why `node` must rebuild, or None if its recorded build is still current."""
+    missing = [p for p in node.outputs if digests(p) is None]
+    if missing:
+        return f"missing {missing[0]}"
+    if record is None:
+        return "never built"
+    current = snapshot(node, digests)
+    if current["command"] != record.get("command"):
+        return "command changed"
+    for kind in ("inputs", "outputs"):
+        recorded = record.get(kind, {})
+        changed = [p for p, d in current[kind].items() if recorded.get(p) != d]
+        if changed:
+            return f"{kind[:-1]} changed: {changed[0]}"
+    return None
+
+
+def run_node(node: Node) -> tuple[int, float, Path]:
+    """Run one node's command from the repo root; returns (exit code, seconds, log path)."""
+    LOG_DIR.mkdir(parents=True, exist_ok=True)
+    log_path = LOG_DIR / f"{node.name}.log"
+    command = list(node.command)
+    if command[0] == "python":
+        command[0] = sys.executable
+    elif command[0] == "jupyter":
+        command[:1] = [sys.executable, "-m", "jupyter"]
+    start = time.perf_counter()
+    with open(log_path, "w", encoding="utf-8") as log:
+        code = subprocess.call(command, cwd=BASE_DIR, stdout=log, stderr=subprocess.STDOUT)
+    return code, time.perf_counter() - start, log_path
+
+
+def build(
+    targets: list[str] | None = None,
+    jobs: int | None = None,
+    force: bool = False,
+    run_notebooks: bool = False,
+    dry_run: bool = False,
+    nodes: list[Node] = NODES,
+) -> dict[str, dict]:
+    """
+    Rebuild the stale nodes needed for `targets`, running independent nodes
+    in parallel. A node is stale when an output is missing or its command,
+    inputs, imported sources or outputs differ from the last recorded
+    build; it is checked only once its upstream nodes have finished.
+    Returns {node: {"status", "seconds", "reason"}}.
+    """
+    by_name = {node.name: node for node in nodes}
+    deps = dependencies(nodes)
+    wanted = select(targets, deps)
+    order = [name for name in topological_order(nodes, deps) if name in wanted]
+    forced = set(targets or wanted) if force else set()
+    state = load_state()
+    digests = Digests()
+    results: dict[str, dict] = {}
+    dirty: set[str] = set()  # nodes a dry run would rebuild
+    jobs = max(1, jobs or os.cpu_count() or 1)
+
+    def schedule(name: str) -> bool:
+        """Decide a ready node; returns True if it has to run."""
+        node = by_name[name]
+        if any(results[dep]["status"] in ("failed", "skipped") for dep in deps[name]):
+            results[name] = {"status": "skipped", "seconds": 0.0, "reason": "upstream failed"}
+            return False
+        reason = "forced" if name in forced else stale_reason(node, state.get(name), digests)
+        if reason is None and dry_run and dirty & deps[name]:
+            # A real run compares digests after upstream finishes; a dry run can only assume.
+            reason = "upstream would rebuild"
+        if reason is None:
+            results[name] = {"status": "fresh", "seconds": 0.0, "reason": ""}
+            return False
+        if node.notebook and not run_notebooks:
+            results[name] = {"status": "stale", "seconds": 0.0, "reason": f"{reason} (notebook)"}
+            return False
+        if dry_run:
+            results[name] = {"status": "would run", "seconds": 0.0, "reason": reason}
+            dirty.add(name)
+            return False
+        results[name] = {"status": "running", "seconds": 0.0, "reason": reason}
+        return True
+
+    pending = list(order)
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        running = {}
+        while pending or running:
+            for name in list(pending):
+                if all(dep in results and results[dep]["status"] != "running" for dep in deps[name]):
+                    pending.remove(name)
+                    if schedule(name):
+                        print(f"[build] {name}: {results[name]['reason']} -> running")
+                        running[pool.submit(run_node, by_name[name])] = name
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                code, seconds, log_path = future.result()
+                results[name].update(seconds=seconds)
+                if code == 0:
+                    results[name]["status"] = "built"
+                    state[name] = {**snapshot(by_name[name], digests), "seconds": round(seconds, 3)}
+                    save_state(state)
+                    print(f"[build] {name}: built in {seconds:.1f}s")
+                else:
+                    results[name]["status"] = "failed"
+                    tail = log_path.read_text(encoding="utf-8", errors="replace").splitlines()[-10:]
+                    print(f"[build] {name}: FAILED (exit {code}) after {seconds:.1f}s, log: {log_path}")
+                    print("\n".join(f"    {line}" for line in tail))
+    return {name: results[name] for name in order}
+
+
+def report(results: dict[str, dict]) -> None:
+    width = max((len(name) for name in results), default=4)
+    print(f"{'node':<{width}}  {'status':<9}  {'time':>7}  reason")
+    for name, result in results.items():
+        print(f"{name:<{width}}  {result['status']:<9}  {result['seconds']:>6.1f}s  {result['reason']}")
+    total = sum(result["seconds"] for result in results.values())
+    print(f"Total node time {total:.1f}s")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Rebuild stale pipeline artifacts in dependency order, in parallel."
+    )
+    parser.add_argument(
+        "targets",
+        nargs="*",
+        help="Nodes to bring up to date, with their upstream (default: all).",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=None,
+        help="Nodes run at once (default: one per core).",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Rebuild the named targets (or every node) even if up to date.",
+    )
+    parser.add_argument(
+        "--notebooks",
+        action="store_true",
+        help="Also execute stale notebook nodes via jupyter nbconvert.",
+    )
+    parser.add_argument(
+        "--dry-run",
+        "-n",
+        action="store_true",
+        help="Only report which nodes would rebuild.",
+    )
+    parser.add_argument(
+        "--list",
+        action="store_true",
+        help="Print the graph (nodes, upstream, outputs) and exit.",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    if args.list:
+        deps = dependencies(NODES)
+        for name in topological_order(NODES, deps):
+            node = next(n for n in NODES if n.name == name)
+            upstream = ", ".join(sorted(deps[name])) or "-"
+            print(f"{name} ({'notebook' if node.notebook else 'script'}) <- {upstream}")
+            for output in node.outputs:
+                print(f"    {output}")
+        return
+    start = time.perf_counter()
+    results = build(
+        targets=args.targets,
+        jobs=args.jobs,
+        force=args.force,
+        run_notebooks=args.notebooks,
+        dry_run=args.dry_run,
+    )
+    report(results)
+    print(f"Wall time {time.perf_counter() - start:.1f}s")
+    if any(result["status"] == "failed" for result in results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import matplotlib
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.ticker import MaxNLocator
+
+from data_cache import file_digest
+from panel import PKDPanel
+
+try:
+    import plotly
+    import plotly.io as pio
+except ImportError:  # HTML exports need plotly; the PNG charts do not
+    plotly = None
+    pio = None
+
+matplotlib.use("Agg")
+
+BASE_DIR = Path(__file__).parent
+CHARTS_DIR = BASE_DIR / "charts"
+# Digests of the charts this script renders. Manifests are rewritten
+# without a lock, so other scripts pass their own `manifest_path`.
+MANIFEST_PATH = BASE_DIR / ".cache" / "charts.json"
+RATIOS_PATH = BASE_DIR / "data" / "df_ratios_finished_final_8_ratios_jig.csv"
+PLOTLY_CDN = "cdn"
+DEFAULT_DPI = 150
+DEFAULT_YEAR_METRICS = ("GS_dyn",)
+
+# Editing a renderer changes how every chart looks, so it invalidates them all.
+_CODE_DIGEST = file_digest(Path(__file__))
+
+
+@dataclass
+class ChartSpec:
+    """
+    One chart to render: `kind` picks the renderer, `data` holds plain
+    lists/numbers and `style` the presentation options. Both are part of
+    the cache key, so an unchanged chart is never drawn twice.
+    """
+
+    kind: str
+    output: str
+    data: dict
+    style: dict = field(default_factory=dict)
+
+    def digest(self) -> str:
+        payload = json.dumps(
+            {"kind": self.kind, "data": self.data, "style": self.style, "code": _CODE_DIGEST},
+            sort_keys=True,
+            default=_jsonable,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _jsonable(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Cannot hash chart input of type {type(value).__name__}.")
+
+
+def _finite(values) -> list[float | None]:
+    """Floats with NaN/inf as None, so specs stay JSON-hashable."""
+    return [float(v) if np.isfinite(v) else None for v in np.asarray(values, dtype=float)]
+
+
+def _save(fig: Figure, spec: ChartSpec) -> None:
+    output = Path(spec.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    if spec.style.get("tight", True):
+        fig.tight_layout()
+    fig.savefig(output, dpi=spec.style.get("dpi", DEFAULT_DPI))
+
+
+def render_pie(spec: ChartSpec) -> None:
+    """Pie of `labels`/`values` with percentage labels."""
+    style = spec.style
+    fig = Figure(figsize=style.get("figsize", (10, 10)))
+    ax = fig.add_subplot()
+    ax.pie(
+        spec.data["values"],
+        labels=spec.data["labels"],
+        autopct=style.get("autopct", "%1.1f%%"),
+        startangle=style.get("startangle", 90),
+        pctdistance=style.get("pctdistance", 0.8),
+    )
+    if "title" in style:
+        ax.set_title(style["title"], pad=style.get("title_pad", 20))
+    _save(fig, spec)
+
+
+def render_lines(spec: ChartSpec) -> None:
+    """
+    One line per entry of `series` over `x`; with `panels` each series gets
+    its own axes (for metrics on different scales). `forecast_start` draws
+    a dashed divider between history and forecast.
+    """
+    style = spec.style
+    x = spec.data["x"]
+    series = spec.data["series"]
+    panels = style.get("panels", False)
+    ncols = style.get("ncols", 4) if panels else 1
+    nrows = -(-len(series) // ncols) if panels else 1
+    fig = Figure(figsize=style.get("figsize", (4 * ncols, 3 * nrows) if panels else (10, 5)))
+    axes = fig.subplots(nrows, ncols, squeeze=False).ravel()
+    forecast_start = style.get("forecast_start")
+    for i, (name, values) in enumerate(series.items()):
+        ax = axes[i] if panels else axes[0]
+        values = np.array([np.nan if v is None else v for v in values], dtype=float)
+        ax.plot(x, values, marker="o", markersize=3, label=name)
+        if panels:
+            ax.set_title(name, fontsize=9)
+            ax.tick_params(labelsize=7)
+    for ax in axes[: len(series) if panels else 1]:
+        if forecast_start is not None:
+            ax.axvline(forecast_start - 0.5, color="grey", linestyle="--", linewidth=0.8)
+        ax.xaxis.set_major_locator(MaxNLocator(integer=True))
+        ax.grid(alpha=0.3)
+    for ax in axes[len(series) if panels else 1 :]:
+        ax.set_visible(False)
+    if not panels and len(series) > 1:
+        axes[0].legend(fontsize=8)
+    if "ylabel" in style and not panels:
+        axes[0].set_ylabel(style["ylabel"])
+    if "title" in style:
+        fig.suptitle(style["title"])
+    _save(fig, spec)
+
+
+def render_bars(spec: ChartSpec) -> None:
+    """Horizontal bars of `values` per label, largest on top."""
+    style = spec.style
+    labels = np.asarray(spec.data["labels"], dtype=object)
+    values = np.array([np.nan if v is None else v for v in spec.data["values"]], dtype=float)
+    keep = ~np.isnan(values)
+    labels, values = labels[keep], values[keep]
+    order = np.argsort(values, kind="stable")
+    fig = Figure(figsize=style.get("figsize", (8, max(3, 0.3 * len(values) + 1))))
+    ax = fig.add_subplot()
+    ax.barh(labels[order].tolist(), values[order], color=style.get("color", "#3b82f6"))
+    ax.axvline(0, color="black", linewidth=0.6)
+    ax.grid(axis="x", alpha=0.3)
+    if "xlabel" in style:
+        ax.set_xlabel(style["xlabel"])
+    if "title" in style:
+        ax.set_title(style["title"])
+    _save(fig, spec)
+
+
+RENDERERS = {"pie": render_pie, "lines": render_lines, "bars": render_bars}
+
+
+def render(spec: ChartSpec) -> str:
+    """Draw one chart (in whichever process runs it); returns its output path."""
+    try:
+        renderer = RENDERERS[spec.kind]
+    except KeyError:
+        raise ValueError(f"Unknown chart kind '{spec.kind}'; expected one of {sorted(RENDERERS)}.") from None
+    renderer(spec)
+    return spec.output
+
+
+def load_manifest(path: Path = MANIFEST_PATH) -> dict[str, str]:
+    if not path.exists():
+        return {}
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(manifest: dict[str, str], path: Path = MANIFEST_PATH) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _manifest_key(output) -> str:
+    path = Path(output).resolve()
+    try:
+        return path.relative_to(BASE_DIR.resolve()).as_posix()
+    except ValueError:
+        return str(path)
+
+
+def render_all(
+    specs: list[ChartSpec],
+    workers: int | None = None,
+    force: bool = False,
+    manifest_path: Path = MANIFEST_PATH,
+) -> tuple[int, int]:
+    """
+    Render the specs whose data, style or renderer changed since the last
+    run (or whose file is missing), in a process pool when there is more
+    than one. Returns (rendered, up to date).
+    """
+    manifest = load_manifest(manifest_path)
+    digests = {spec.output: spec.digest() for spec in specs}
+    todo = [
+        spec
+        for spec in specs
+        if force
+        or manifest.get(_manifest_key(spec.output)) != digests[spec.output]
+        or not Path(spec.output).exists()
+    ]
+    workers = workers or os.cpu_count() or 1
+    if len(todo) > 1 and workers > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(todo))) as pool:
+            done = list(pool.map(render, todo, chunksize=max(1, len(todo) // (4 * workers))))
+    else:
+        done = [render(spec) for spec in todo]
+    for output in done:
+        manifest[_manifest_key(output)] = digests[output]
+    if done:
+        save_manifest(manifest, manifest_path)
+    return len(done), len(specs) - len(done)
+
+
+def write_plotly_html(
+    fig,
+    output: Path,
+    bundle: str = PLOTLY_CDN,
+    manifest_path: Path = MANIFEST_PATH,
+    force: bool = False,
+) -> bool:
+    """
+    Write a Plotly figure as HTML that loads plotly.js from `bundle`: the
+    CDN, or a directory where one shared `plotly-<version>.min.js` is kept
+    for offline use, instead of inlining ~4 MB per file. The div id is
+    derived from the figure so unchanged figures give identical files and
+    are skipped. Returns whether the file was written.
+    """
+    if pio is None:
+        raise ImportError("plotly is required for HTML chart exports (pip install plotly).")
+    output = Path(output)
+    figure_json = pio.to_json(fig, validate=False, pretty=False)
+    digest = hashlib.sha256(f"{bundle}\n{figure_json}".encode("utf-8")).hexdigest()
+    manifest = load_manifest(manifest_path)
+    key = _manifest_key(output)
+    if not force and manifest.get(key) == digest and output.exists():
+        return False
+
+    if bundle == PLOTLY_CDN:
+        include = "cdn"
+    else:
+        bundle_path = ensure_plotly_bundle(Path(bundle))
+        include = os.path.relpath(bundle_path, output.parent).replace(os.sep, "/")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    html = pio.to_html(
+        fig,
+        include_plotlyjs=include,
+        full_html=True,
+        div_id=f"plot-{digest[:12]}",
+        validate=False,
+    )
+    output.write_text(html, encoding="utf-8")
+    manifest[key] = digest
+    save_manifest(manifest, manifest_path)
+    return True
+
+
+def ensure_plotly_bundle(directory: Path) -> Path:
+    """The shared plotly.js for `directory`, written once per plotly version."""
+    path = directory / f"plotly-{plotly.__version__}.min.js"
+    if not path.exists():
+        from plotly.offline import get_plotlyjs
+
+        directory.mkdir(parents=True, exist_ok=True)
+        path.write_text(get_plotlyjs(), encoding="utf-8")
+    return path
+
+
+def pkd_ratio_specs(panel: PKDPanel, out_dir: Path, forecast_start: int | None = None) -> list[ChartSpec]:
+    """One small-multiples chart of every metric per PKD."""
+    x = panel.years.tolist()
+    specs = []
+    for pkd in panel.pkds:
+        frame = panel.pkd_frame(pkd)
+        series = {m: _finite(frame[m]) for m in panel.metrics if not frame[m].isna().all()}
+        if not series:
+            continue
+        specs.append(
+            ChartSpec(
+                "lines",
+                str(out_dir / f"{pkd}_ratios.png"),
+                {"x": x, "series": series},
+                {"panels": True, "title": f"PKD {pkd}", "forecast_start": forecast_start},
+            )
+        )
+    return specs
+
+
+def year_ranking_specs(panel: PKDPanel, metrics, out_dir: Path) -> list[ChartSpec]:
+    """One PKD ranking bar chart per (year, metric)."""
+    labels = panel.pkds.tolist()
+    specs = []
+    for metric in metrics:
+        frame = panel.metric_frame(metric)
+        for year, row in frame.iterrows():
+            if row.isna().all():
+                continue
+            specs.append(
+                ChartSpec(
+                    "bars",
+                    str(out_dir / f"{int(year)}_{metric}.png"),
+                    {"labels": labels, "values": _finite(row)},
+                    {"title": f"{metric} — ranking PKD {int(year)}", "xlabel": metric},
+                )
+            )
+    return specs
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Render per-PKD and per-year charts from the ratio table in a process pool, "
+        "skipping charts whose inputs did not change."
+    )
+    parser.add_argument("--ratios", type=Path, default=RATIOS_PATH, help="Wide '<PKD>_<ratio>' CSV.")
+    parser.add_argument("--out-dir", type=Path, default=CHARTS_DIR, help="Root directory for the charts.")
+    parser.add_argument(
+        "--metrics",
+        nargs="+",
+        default=list(DEFAULT_YEAR_METRICS),
+        help="Ratios to draw per-year PKD rankings for.",
+    )
+    parser.add_argument("--workers", type=int, default=None, help="Rendering processes (default: all cores).")
+    parser.add_argument("--force", action="store_true", help="Redraw every chart, ignoring the cache.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    start = time.perf_counter()
+    panel = PKDPanel.read_csv(args.ratios)
+    specs = pkd_ratio_specs(panel, args.out_dir / "pkd") + year_ranking_specs(
+        panel, args.metrics, args.out_dir / "years"
+    )
+    rendered, cached = render_all(specs, workers=args.workers, force=args.force)
+    print(
+        f"Rendered {rendered} chart(s), {cached} up to date, "
+        f"in {time.perf_counter() - start:.1f}s -> {args.out_dir.resolve()}"
+    )
+
+
+if __name__ == "__main__":
+    main()
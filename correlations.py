@@ -0,0 +1,305 @@
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.stats import rankdata
+
+from krz_cube import load_cube
+from panel import PKDPanel
+
+
+BASE_DIR = Path(__file__).parent
+DATA_DIR = BASE_DIR / "data"
+RATIOS_PATH = DATA_DIR / "df_ratios_finished_final_8_ratios_jig.csv"
+NUMBERS_PATH = DATA_DIR / "df_pivot_filtered_numbers.csv"
+KRZ_PKD_PATH = DATA_DIR / "krz_pkd.csv"
+
+METHODS = ("pearson", "spearman")
+MODES = ("pairwise", "listwise")
+DEFAULT_LAGS = (0, 1, 2, 3)
+HEATMAP_THRESHOLD = 0.4
+
+PRETTY_PL = {
+    "DEBT_to_GS": "Udział zadłużenia w przychodach",
+    "CF_to_TC": "Pokrycie kosztów przez cash flow",
+    "STL_to_GS": "Udział zobowiązań krótkoterminowych w przychodach",
+    "NP_to_TC": "Efektywność kosztowa netto",
+    "NP_to_GS": "Marża netto",
+    "GS_dyn": "Dynamika przychodów",
+    "CF_dyn": "Dynamika cash flow",
+    "NP_dyn": "Dynamika zysku netto",
+}
+
+
+def load_ratio_panel(path: Path = RATIOS_PATH) -> PKDPanel:
+    """
+    The '<PKD>_<ratio>' table as a (year x pkd x ratio) panel, kept in
+    float64 (it is small) so correlations match pandas to rounding.
+    """
+    return PKDPanel.read_csv(path, dtype=np.float64)
+
+
+def load_bankruptcies(path: Path = KRZ_PKD_PATH) -> pd.DataFrame:
+    """Bankruptcy counts from KRZ summed to PKD groups, as a year x pkd frame."""
+    return load_cube(krz_path=path).level_frame("group", missing_as_nan=True)
+
+
+def load_en(path: Path = NUMBERS_PATH) -> pd.DataFrame:
+    """The EN metric of every PKD as a year x pkd frame."""
+    return PKDPanel.read_csv(path).metric_frame("EN").astype(float)
+
+
+def _rank(values: np.ndarray, mask: np.ndarray, axis: int) -> np.ndarray:
+    """Average ranks along `axis` over the masked-in cells only."""
+    return rankdata(np.where(mask, values, np.nan), axis=axis, nan_policy="omit")
+
+
+def masked_corr(
+    x: np.ndarray,
+    y: np.ndarray,
+    mask: np.ndarray,
+    axis: int,
+    method: str = "pearson",
+    min_periods: int = 2,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Correlation of x and y along `axis` using only cells where `mask` is
+    True, for every other index at once. Returns (r, n); r is NaN where
+    fewer than `min_periods` pairs remain or either side is constant.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown method '{method}'; expected one of {METHODS}.")
+    x, y = np.broadcast_arrays(x, y)
+    mask = np.broadcast_to(mask, x.shape)
+    if method == "spearman":
+        x, y = _rank(x, mask, axis), _rank(y, mask, axis)
+
+    n = mask.sum(axis=axis)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_mean = np.where(mask, x, 0.0).sum(axis=axis, keepdims=True) / np.expand_dims(n, axis)
+        y_mean = np.where(mask, y, 0.0).sum(axis=axis, keepdims=True) / np.expand_dims(n, axis)
+        dx = np.where(mask, x - x_mean, 0.0)
+        dy = np.where(mask, y - y_mean, 0.0)
+        r = (dx * dy).sum(axis=axis) / np.sqrt((dx * dx).sum(axis=axis) * (dy * dy).sum(axis=axis))
+    r = np.clip(r, -1.0, 1.0)
+    r[(n < max(2, min_periods)) | ~np.isfinite(r)] = np.nan
+    return r, n
+
+
+def _lagged_targets(target: pd.DataFrame, panel: PKDPanel, lags) -> np.ndarray:
+    """
+    Target aligned to the panel for every lag: out[l, t, p] is the target of
+    PKD p in year panel.years[t] + lags[l]. Only panel years are used, so a
+    lag never reaches past the ratio data.
+    """
+    target = target.reindex(index=panel.years, columns=panel.pkds).astype(float)
+    return np.stack([target.reindex(panel.years + lag).to_numpy() for lag in lags])
+
+
+def _pair_mask(x: np.ndarray, y: np.ndarray, present: np.ndarray, mode: str) -> np.ndarray:
+    """
+    Valid (lag, year, pkd, ratio) pairs. 'pairwise' keeps every year where
+    both sides are known; 'listwise' keeps a (PKD, year) only if the target
+    and all of that PKD's ratios are known, like `df.dropna()` per PKD.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode '{mode}'; expected one of {MODES}.")
+    x_ok = ~np.isnan(x)
+    y_ok = ~np.isnan(y)
+    if mode == "pairwise":
+        return x_ok & y_ok
+    # Ratios a PKD has no column for do not count against it.
+    row_ok = (x_ok | ~present).all(axis=-1, keepdims=True)
+    return row_ok & y_ok & x_ok
+
+
+def lagged_correlations(
+    panel: PKDPanel,
+    target: pd.DataFrame,
+    lags=DEFAULT_LAGS,
+    method: str = "pearson",
+    mode: str = "pairwise",
+    min_periods: int = 2,
+) -> pd.DataFrame:
+    """
+    Per-PKD time-series correlation of every ratio at t with the target at
+    t + lag, for all PKDs, ratios and lags in one pass.
+
+    `target` is a year x pkd frame (e.g. `load_bankruptcies()`). Returns a
+    tidy frame with columns pkd, ratio, lag, n, r.
+    """
+    lags = [int(lag) for lag in lags]
+    x = panel.values.astype(float)[None]  # (1, year, pkd, ratio)
+    y = _lagged_targets(target, panel, lags)[..., None]  # (lag, year, pkd, 1)
+    mask = _pair_mask(x, y, panel.present, mode)
+    r, n = masked_corr(x, y, mask, axis=1, method=method, min_periods=min_periods)
+
+    lag_idx, pkd_idx, ratio_idx = np.indices(r.shape).reshape(3, -1)
+    keep = panel.present[pkd_idx, ratio_idx]
+    return pd.DataFrame(
+        {
+            "pkd": panel.pkds[pkd_idx[keep]],
+            "ratio": panel.metrics[ratio_idx[keep]],
+            "lag": np.asarray(lags)[lag_idx[keep]],
+            "n": n.reshape(-1)[keep],
+            "r": r.reshape(-1)[keep],
+        }
+    )
+
+
+def cross_sectional_correlations(
+    panel: PKDPanel,
+    target: pd.DataFrame,
+    lags=DEFAULT_LAGS,
+    method: str = "pearson",
+    min_periods: int = 2,
+) -> pd.DataFrame:
+    """
+    Correlation across PKDs, per year and ratio, of the ratio at t with the
+    target at t + lag. Returns a tidy frame with columns year, ratio, lag, n, r.
+    """
+    lags = [int(lag) for lag in lags]
+    x = panel.values.astype(float)[None]
+    y = _lagged_targets(target, panel, lags)[..., None]
+    mask = ~np.isnan(x) & ~np.isnan(y)
+    r, n = masked_corr(x, y, mask, axis=2, method=method, min_periods=min_periods)
+
+    lag_idx, year_idx, ratio_idx = np.indices(r.shape).reshape(3, -1)
+    return pd.DataFrame(
+        {
+            "year": panel.years[year_idx],
+            "ratio": panel.metrics[ratio_idx],
+            "lag": np.asarray(lags)[lag_idx],
+            "n": n.reshape(-1),
+            "r": r.reshape(-1),
+        }
+    )
+
+
+def summarize_cross_sectional(cs: pd.DataFrame) -> pd.DataFrame:
+    """Mean/median/count of the yearly cross-sectional r per ratio and lag."""
+    return (
+        cs.dropna(subset=["r"])
+        .groupby(["lag", "ratio"])["r"]
+        .agg(mean="mean", median="median", count="count")
+        .sort_values(["lag", "mean"])
+    )
+
+
+def heatmap_matrix(result: pd.DataFrame, lag: int = 1) -> pd.DataFrame:
+    """
+    PKD x ratio matrix of r for one lag, rows and columns ordered by mean
+    |r| as in the correlation heatmaps.
+    """
+    matrix = result[result["lag"] == lag].pivot(index="pkd", columns="ratio", values="r")
+    matrix.index.name = None
+    matrix.columns.name = None
+    rows = matrix.abs().mean(axis=1).sort_values(ascending=False).index
+    cols = matrix.abs().mean(axis=0).sort_values(ascending=False).index
+    return matrix.loc[rows, cols]
+
+
+def plot_heatmap(
+    matrix: pd.DataFrame,
+    output_path: Path,
+    title: str,
+    threshold: float = HEATMAP_THRESHOLD,
+    annot_size: int = 10,
+) -> None:
+    """Blue-white-red heatmap annotated where |r| >= threshold."""
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import LinearSegmentedColormap
+
+    cmap = LinearSegmentedColormap.from_list("blue_white_red", ["#1f3099", "#ffffff", "#ed0000"])
+    cmap.set_bad("white")
+    labels = [PRETTY_PL.get(c, c) for c in matrix.columns]
+    values = matrix.to_numpy(dtype=float)
+
+    fig, ax = plt.subplots(figsize=(16, 9), dpi=120)
+    image = ax.imshow(np.ma.masked_invalid(values), cmap=cmap, vmin=-1, vmax=1, aspect="auto")
+    for i, j in zip(*np.nonzero(np.abs(np.nan_to_num(values)) >= threshold)):
+        ax.text(j, i, f"{values[i, j]:.2f}", ha="center", va="center", fontsize=annot_size)
+    ax.set_xticks(range(len(labels)), labels, rotation=25, ha="right")
+    ax.set_yticks(range(len(matrix.index)), matrix.index, fontsize=9)
+    fig.colorbar(image, ax=ax, label="Współczynnik korelacji Pearsona r")
+    ax.set_title(title, pad=12)
+    ax.set_xlabel("Wskaźniki finansowe")
+    ax.set_ylabel("Sektor PKD")
+
+    fig.tight_layout()
+    fig.savefig(output_path, dpi=300, bbox_inches="tight", facecolor="white")
+    plt.close(fig)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Lagged correlations of PKD ratios with bankruptcies and EN."
+    )
+    parser.add_argument(
+        "--lags",
+        nargs="+",
+        type=int,
+        default=list(DEFAULT_LAGS),
+        help="Lags (in years) of the target relative to the ratios.",
+    )
+    parser.add_argument(
+        "--method",
+        choices=METHODS,
+        default="pearson",
+        help="Correlation coefficient.",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=MODES,
+        default="pairwise",
+        help="Missing-data handling for the per-PKD correlations.",
+    )
+    parser.add_argument(
+        "--output-dir",
+        type=Path,
+        default=DATA_DIR,
+        help="Directory for the tidy correlation CSVs.",
+    )
+    parser.add_argument(
+        "--plot-dir",
+        type=Path,
+        default=None,
+        help="If set, also render the t+1 heatmaps into this directory.",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    panel = load_ratio_panel()
+    targets = {"upadlosci": load_bankruptcies(), "EN": load_en()}
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+
+    for name, target in targets.items():
+        per_pkd = lagged_correlations(panel, target, args.lags, args.method, args.mode)
+        cs = cross_sectional_correlations(panel, target, args.lags, args.method)
+        per_pkd.to_csv(args.output_dir / f"corr_ratio_vs_{name}.csv", index=False)
+        cs.to_csv(args.output_dir / f"cs_corr_ratio_vs_{name}.csv", index=False)
+        print(f"Ratios vs {name}: {len(per_pkd)} per-PKD and {len(cs)} cross-sectional rows.")
+        print(summarize_cross_sectional(cs))
+
+        if args.plot_dir is not None and 1 in args.lags:
+            args.plot_dir.mkdir(parents=True, exist_ok=True)
+            suffix = "upadlosci_t1" if name == "upadlosci" else "EN_t1"
+            label = "liczba upadłości" if name == "upadlosci" else "Default"
+            plot_heatmap(
+                heatmap_matrix(per_pkd, lag=1),
+                args.plot_dir / f"corr_heatmap_{suffix}_thresholded.png",
+                f"Korelacja sektorowa: wskaźniki w t vs {label} w t+1",
+            )
+    print(f"Saved correlation tables to: {args.output_dir.resolve()}")
+
+
+if __name__ == "__main__":
+    main()
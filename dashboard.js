@@ -8,7 +8,12 @@
 class PKODashboard {
   constructor(options = {}) {
     this.options = {
+      indexUrl: "data/dashboard/index.json",
       dataUrl: "data/dashboard_data.json",
+      // TreeSHAP driver rankings written by xgb_shap.py; the static driver list is the fallback.
+      driversUrl: "data/xgb_shap_drivers.json",
+      // Base URL of score_server.py (e.g. "http://127.0.0.1:8001") for live what-if weights.
+      scoreUrl: null,
       ...options
     };
 
@@ -27,6 +32,13 @@ class PKODashboard {
 
     this.model = null;
     this.matrixFrame = null;
+    // Sector shards fetched so far (or in flight), keyed by sector id.
+    this.shards = new Map();
+    // Overview request of the sharded layout, once started.
+    this.overview = null;
+    this.overviewUrl = null;
+    // { global, sectors: { pkd: [{ feature, importance }] } } once loaded.
+    this.driverAttributions = null;
 
     this.scatterPoints = [];
     this.coverageRegions = [];
@@ -168,6 +180,11 @@ class PKODashboard {
   async init() {
     await this.loadData();
     this.syncInitialState();
+    await Promise.all([
+      this.loadOverview(),
+      this.loadSector(this.state.selected),
+      this.loadDriverAttributions()
+    ]);
     this.renderAll();
     // Ensure matrix suite paints even if initial width calculations happened pre-layout.
     this.queueMatrixSuite();
@@ -204,18 +221,54 @@ class PKODashboard {
     this.renderMatrixSuite();
   }
 
+  async applyWeights(weights, { years = null, tiers = null } = {}) {
+    // Re-score every sector through score_server.py, e.g. applyWeights({ growth: 0.5, risk: 0.2 }).
+    if (!this.options.scoreUrl || !this.model) return false;
+    const params = new URLSearchParams({
+      weights: Object.entries(weights).map(([k, v]) => `${k}:${v}`).join(",")
+    });
+    if (years) params.set("years", years.join(","));
+    if (tiers) params.set("tiers", Object.entries(tiers).map(([k, v]) => `${k}:${v}`).join(","));
+    try {
+      const res = await fetch(`${this.options.scoreUrl}/score?${params}`);
+      const result = await res.json();
+      if (!res.ok) throw new Error(result.error ?? res.statusText);
+      const yearIdx = result.years.map(y => this.model.years.indexOf(y));
+      const byId = new Map(result.sectors.map(s => [s.id, s]));
+      this.model.sectors.forEach(sector => {
+        const scored = byId.get(sector.id);
+        if (!scored) return;
+        const score = [...(sector.score ?? [])];
+        yearIdx.forEach((idx, i) => { if (idx >= 0) score[idx] = scored.score[i]; });
+        sector.score = score;
+        sector.tier = scored.tier;
+      });
+      this.renderAll();
+      return true;
+    } catch (err) {
+      console.error("Nie udało się przeliczyć wyników", err);
+      return false;
+    }
+  }
+
   selectSector(id) {
     this.state.selected = id;
     if (this.sectorPicker) this.sectorPicker.value = id;
     this.renderDetail();
+    this.renderDrivers();
     this.renderTable();
     this.renderCoverageChart();
     this.renderMatrixSuite(); // highlights in GP/IKB
+    // Hydrate the full record on first open, then repaint the detail card.
+    this.loadSector(id).then(() => {
+      if (this.state.selected === id) this.renderDetail();
+    });
   }
 
   /* ---------------- Data ---------------- */
 
   async loadData() {
+    if (await this.loadIndex()) return;
     try {
       const [resJson, resLu] = await Promise.all([
         fetch(this.options.dataUrl),
@@ -236,6 +289,79 @@ class PKODashboard {
     }
   }
 
+  async loadIndex() {
+    // Sharded layout: a small index up front, per-sector shards on demand.
+    try {
+      const res = await fetch(this.options.indexUrl);
+      if (!res.ok) return false;
+      const index = await res.json();
+      this.model = {
+        years: index.years,
+        forecast_start: index.forecast_start,
+        drivers: index.drivers,
+        metrics: index.metrics,
+        sectors: index.sectors.map(entry => ({ ...entry }))
+      };
+      this.overviewUrl = index.overview ?? null;
+      this.indexBase = new URL(this.options.indexUrl, window.location.href);
+      return true;
+    } catch (err) {
+      console.warn("Brak indeksu dashboardu, wczytuję pełny plik danych", err);
+      return false;
+    }
+  }
+
+  loadOverview() {
+    // Per-year score/growth/risk/debt/export of every sector, for the cross-sector charts.
+    if (!this.overviewUrl) return Promise.resolve(this.model);
+    if (!this.overview) {
+      this.overview = fetch(new URL(this.overviewUrl, this.indexBase))
+        .then(res => (res.ok ? res.json() : Promise.reject(new Error(res.statusText))))
+        .then(overview => {
+          this.model.sectors.forEach((sector, i) => {
+            Object.keys(overview).forEach(field => { sector[field] = overview[field][i]; });
+          });
+          return this.model;
+        })
+        .catch(err => {
+          console.error("Nie udało się wczytać przeglądu sektorów", err);
+          this.overview = null;
+          return this.model;
+        });
+    }
+    return this.overview;
+  }
+
+  async loadDriverAttributions() {
+    if (!this.options.driversUrl) return;
+    try {
+      const res = await fetch(this.options.driversUrl);
+      if (res.ok) this.driverAttributions = await res.json();
+    } catch (err) {
+      console.warn("Brak rankingu determinant (xgb_shap.py), pokazuję listę zmiennych", err);
+    }
+  }
+
+  loadSector(id) {
+    const sector = this.model?.sectors?.find(s => s.id === id);
+    if (!sector?.shard) return Promise.resolve(sector);
+    if (!this.shards.has(id)) {
+      const request = fetch(new URL(sector.shard, this.indexBase))
+        .then(res => (res.ok ? res.json() : Promise.reject(new Error(res.statusText))))
+        .then(full => {
+          Object.assign(sector, full);
+          return sector;
+        })
+        .catch(err => {
+          console.error(`Nie udało się wczytać sektora ${id}`, err);
+          this.shards.delete(id);
+          return sector;
+        });
+      this.shards.set(id, request);
+    }
+    return this.shards.get(id);
+  }
+
   syncInitialState() {
     if (!this.model?.years?.length) return;
 
@@ -457,8 +583,25 @@ class PKODashboard {
     `).join("");
   }
 
+  rankedDrivers() {
+    // The selected sector's SHAP ranking, else the cross-sector one.
+    const shap = this.driverAttributions;
+    if (!shap) return null;
+    const id = this.state.selected;
+    const sector = shap.sectors?.[id] ?? shap.sectors?.[id?.toUpperCase()];
+    return sector?.length ? sector : (shap.global?.length ? shap.global : null);
+  }
+
   renderDrivers() {
-    if (!this.model?.drivers || !this.driversList) return;
+    if (!this.driversList) return;
+    const ranked = this.rankedDrivers();
+    if (ranked) {
+      this.driversList.innerHTML = ranked
+        .map(d => `<span title="Udział w średnim |SHAP| modelu XGB">${d.feature} · ${(d.importance * 100).toFixed(0)}%</span>`)
+        .join("");
+      return;
+    }
+    if (!this.model?.drivers) return;
     const maxShow = 20;
     const drivers = this.model.drivers.slice(0, maxShow);
     const more = this.model.drivers.length - drivers.length;
@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import pandas as pd
+
+
+BASE_DIR = Path(__file__).parent
+CACHE_DIR = BASE_DIR / ".cache" / "snapshots"
+TEXT_SUFFIX = "__text"
+
+# Every workbook/CSV the pipeline scripts read, with the reader options they use.
+SOURCES = [
+    (BASE_DIR / "data" / "GS_filtered.xlsx", "excel", {"sheet_name": 0}),
+    (BASE_DIR / "data" / "NWC_filtered.xlsx", "excel", {"sheet_name": 0}),
+    (BASE_DIR / "data" / "dane_export.xlsx", "excel", {"sheet_name": 0}),
+    (BASE_DIR / "data" / "krz_pkd.csv", "csv", {"sep": ";"}),
+    (BASE_DIR / "data" / "DATA_PKD_SPECIFIC.xlsx", "excel", {"sheet_name": "Arkusz1"}),
+    (BASE_DIR / "data" / "GS_filtered_xx.x.xlsx", "excel", {"sheet_name": 0}),
+    (BASE_DIR / "data" / "wsk_fin.xlsx", "excel", {"sheet_name": 0}),
+]
+
+
+def file_digest(path: Path, chunk_size: int = 1 << 20) -> str:
+    """Return the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _snapshot_key(path: Path, reader: str, options: dict) -> str:
+    """Stable key for (source path, sheet/reader options)."""
+    payload = json.dumps(
+        [str(path.resolve()), reader, options], sort_keys=True, default=str
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _parse_source(path: Path, reader: str, options: dict) -> pd.DataFrame:
+    if reader == "excel":
+        return pd.read_excel(path, **options)
+    if reader == "csv":
+        return pd.read_csv(path, **options)
+    raise ValueError(f"Unknown reader '{reader}'; expected 'excel' or 'csv'.")
+
+
+def _is_mixed_text(series: pd.Series) -> bool:
+    """True for object columns holding only numbers, strings and missing cells."""
+    if series.dtype != object:
+        return False
+    allowed = (str, int, float, type(None))
+    return all(isinstance(v, allowed) and not isinstance(v, bool) for v in series)
+
+
+def _encode_columnar(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Make a frame Arrow-friendly: string column labels, and object columns that
+    mix numbers with markers like 'bd' split into a float column plus a
+    '<col>__text' column holding the non-numeric cells.
+    """
+    encoded = {}
+    for label in df.columns:
+        name = str(label)
+        series = df[label]
+        if _is_mixed_text(series):
+            is_text = series.map(lambda v: isinstance(v, str))
+            encoded[name] = pd.to_numeric(series.where(~is_text), errors="coerce").astype(
+                "float64"
+            )
+            encoded[name + TEXT_SUFFIX] = series.where(is_text).astype("string")
+        else:
+            encoded[name] = series
+    return pd.DataFrame(encoded, index=df.index)
+
+
+def _decode_columnar(encoded: pd.DataFrame, labels: list) -> pd.DataFrame:
+    """Inverse of `_encode_columnar`, restoring original labels and mixed columns."""
+    decoded = {}
+    for label in labels:
+        name = str(label)
+        text_name = name + TEXT_SUFFIX
+        if text_name in encoded.columns:
+            values = encoded[name].astype(object)
+            text = encoded[text_name]
+            has_text = text.notna().to_numpy()
+            values[has_text] = text[has_text].astype(object)
+            decoded[label] = values
+        else:
+            decoded[label] = encoded[name]
+    return pd.DataFrame(decoded, index=encoded.index)
+
+
+def _write_snapshot(df: pd.DataFrame, key: str) -> tuple[Path, str]:
+    """Persist a snapshot atomically; returns (snapshot path, format)."""
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    labels_unique = len({str(c) for c in df.columns}) == len(df.columns)
+    if labels_unique:
+        target = CACHE_DIR / f"{key}.parquet"
+        tmp = target.with_suffix(f".parquet.{os.getpid()}.tmp")
+        try:
+            _encode_columnar(df).to_parquet(tmp)
+            os.replace(tmp, target)
+            return target, "parquet"
+        except (ImportError, TypeError, ValueError):
+            # No Arrow engine, or a column Arrow cannot represent: fall back below.
+            tmp.unlink(missing_ok=True)
+    target = CACHE_DIR / f"{key}.pkl"
+    tmp = target.with_suffix(f".pkl.{os.getpid()}.tmp")
+    df.to_pickle(tmp)
+    os.replace(tmp, target)
+    return target, "pickle"
+
+
+def _read_snapshot(meta: dict) -> pd.DataFrame:
+    snapshot = CACHE_DIR / meta["snapshot"]
+    if meta["format"] == "parquet":
+        return _decode_columnar(pd.read_parquet(snapshot), meta["columns"])
+    return pd.read_pickle(snapshot)
+
+
+def _load_meta(key: str) -> dict | None:
+    meta_path = CACHE_DIR / f"{key}.json"
+    if not meta_path.exists():
+        return None
+    try:
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    except json.JSONDecodeError:
+        return None
+    if not (CACHE_DIR / meta.get("snapshot", "")).is_file():
+        return None
+    return meta
+
+
+def _store_meta(key: str, meta: dict) -> None:
+    meta_path = CACHE_DIR / f"{key}.json"
+    tmp = meta_path.with_suffix(f".json.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(meta, ensure_ascii=False, indent=2, default=str), encoding="utf-8")
+    os.replace(tmp, meta_path)
+
+
+def _fresh_meta(path: Path, key: str) -> dict | None:
+    """
+    Return the snapshot metadata if it still matches the source file.
+
+    A matching (mtime, size) pair is trusted as-is; otherwise the content hash
+    decides, so a touched-but-unchanged file does not trigger a re-parse.
+    """
+    meta = _load_meta(key)
+    if meta is None:
+        return None
+    stat = path.stat()
+    if meta["mtime_ns"] == stat.st_mtime_ns and meta["size"] == stat.st_size:
+        return meta
+    if meta["sha256"] != file_digest(path):
+        return None
+    meta.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+    _store_meta(key, meta)
+    return meta
+
+
+def build_snapshot(path: Path, reader: str, options: dict) -> dict:
+    """Parse a source file and (re)write its snapshot; returns the metadata."""
+    path = Path(path)
+    key = _snapshot_key(path, reader, options)
+    stat = path.stat()
+    digest = file_digest(path)
+    df = _parse_source(path, reader, options)
+    snapshot, fmt = _write_snapshot(df, key)
+    meta = {
+        "source": str(path.resolve()),
+        "reader": reader,
+        "options": options,
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "sha256": digest,
+        "snapshot": snapshot.name,
+        "format": fmt,
+        "columns": [c if isinstance(c, (int, float)) else str(c) for c in df.columns],
+        "shape": list(df.shape),
+    }
+    _store_meta(key, meta)
+    return meta
+
+
+def load_table(path: Path, reader: str, options: dict) -> pd.DataFrame:
+    """Return the source table, rebuilding its snapshot only if the file changed."""
+    path = Path(path)
+    key = _snapshot_key(path, reader, options)
+    meta = _fresh_meta(path, key)
+    if meta is None:
+        meta = build_snapshot(path, reader, options)
+    return _read_snapshot(meta)
+
+
+def read_excel(path: Path, sheet_name: str | int = 0, **kwargs) -> pd.DataFrame:
+    """Cached drop-in for `pd.read_excel` on a single sheet."""
+    return load_table(path, "excel", {"sheet_name": sheet_name, **kwargs})
+
+
+def read_csv(path: Path, **kwargs) -> pd.DataFrame:
+    """Cached drop-in for `pd.read_csv`."""
+    return load_table(path, "csv", kwargs)
+
+
+def refresh(sources=None, force: bool = False) -> list[Path]:
+    """
+    Rebuild the snapshots of the given (path, reader, options) sources.
+
+    Only inputs whose content changed are re-parsed unless `force` is set.
+    Returns the list of source paths that were rebuilt.
+    """
+    rebuilt = []
+    for path, reader, options in sources or SOURCES:
+        path = Path(path)
+        if not path.exists():
+            print(f"Skipping missing source: {path}")
+            continue
+        key = _snapshot_key(path, reader, options)
+        if force or _fresh_meta(path, key) is None:
+            build_snapshot(path, reader, options)
+            rebuilt.append(path)
+    return rebuilt
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Build or refresh the columnar snapshots of the input tables."
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Rebuild every snapshot even if its source is unchanged.",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    rebuilt = refresh(force=args.force)
+    for path in rebuilt:
+        print(f"Rebuilt snapshot for {path.relative_to(BASE_DIR)}")
+    print(f"{len(rebuilt)} of {len(SOURCES)} snapshots rebuilt in {CACHE_DIR}.")
+
+
+if __name__ == "__main__":
+    main()
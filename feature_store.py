@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from data_cache import file_digest, read_excel
+
+
+BASE_DIR = Path(__file__).parent
+COMMODITIES_PATH = BASE_DIR / "data" / "COMMODITIES_FINAL.xlsx"
+STORE_DIR = BASE_DIR / ".cache" / "features"
+YEAR_COL = "year"
+LEVEL = "level"
+SEPARATOR = "__"  # '<driver>__<transform>', e.g. 'usd/pln__lag1'; levels keep the plain name
+# lagK: value K years earlier; diffK: change over K years; pctK: relative
+# change over K years; rollW: trailing W-year mean (NaN until W years exist).
+DEFAULT_TRANSFORMS = ("lag1", "lag2", "diff1", "pct1", "roll3")
+TRANSFORM_RE = re.compile(r"^(lag|diff|pct|roll)([1-9][0-9]*)$")
+STORE_VERSION = 1
+
+
+def parse_transform(name: str) -> tuple[str, int]:
+    match = TRANSFORM_RE.match(name)
+    if match is None:
+        raise ValueError(f"Unknown transform '{name}'; expected lagK, diffK, pctK or rollW.")
+    return match.group(1), int(match.group(2))
+
+
+def feature_name(driver: str, transform: str = LEVEL) -> str:
+    return driver if transform == LEVEL else f"{driver}{SEPARATOR}{transform}"
+
+
+def clean_commodities(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Commodity drivers sorted by year, text columns such as 'It zarobki'
+    ('5 900,26') parsed to floats in one pass over all of them.
+    """
+    df = df.copy()
+    df[YEAR_COL] = df[YEAR_COL].astype(int)
+    df = df.sort_values(YEAR_COL).reset_index(drop=True)
+    text_cols = [c for c in df.columns if c != YEAR_COL and df[c].dtype == object]
+    if text_cols:
+        cleaned = df[text_cols].astype(str).replace({"\xa0": "", " ": "", ",": "."}, regex=True)
+        df[text_cols] = cleaned.apply(pd.to_numeric, errors="coerce")
+    return df
+
+
+def _shift(values: np.ndarray, k: int) -> np.ndarray:
+    shifted = np.full_like(values, np.nan)
+    if k < len(values):
+        shifted[k:] = values[:-k]
+    return shifted
+
+
+def derive(values: np.ndarray, transform: str) -> np.ndarray:
+    """One transform of a (year x driver) array over consecutive years."""
+    kind, k = parse_transform(transform)
+    if kind == "lag":
+        return _shift(values, k)
+    if kind == "diff":
+        return values - _shift(values, k)
+    if kind == "pct":
+        base = _shift(values, k)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(base == 0, np.nan, values / base - 1)
+    out = np.full_like(values, np.nan)
+    if k <= len(values):
+        out[k - 1:] = np.lib.stride_tricks.sliding_window_view(values, k, axis=0).mean(axis=-1)
+    return out
+
+
+def materialize(df_com: pd.DataFrame, transforms=DEFAULT_TRANSFORMS) -> pd.DataFrame:
+    """
+    Cleaned levels (original dtypes) followed by every transform of every
+    driver as float64 columns. Years missing from the sheet are filled in
+    before shifting, so a lag is always the calendar year before.
+    """
+    drivers = [c for c in df_com.columns if c != YEAR_COL]
+    years = df_com[YEAR_COL].to_numpy()
+    full = np.arange(years.min(), years.max() + 1) if len(years) else years
+    levels = (
+        df_com.set_index(YEAR_COL)[drivers].reindex(full).to_numpy(dtype=np.float64, na_value=np.nan)
+    )
+    rows = np.searchsorted(full, years)
+    blocks = {
+        feature_name(driver, transform): column
+        for transform in transforms
+        for driver, column in zip(drivers, derive(levels, transform)[rows].T)
+    }
+    derived = pd.DataFrame(blocks, index=df_com.index)
+    return pd.concat([df_com, derived], axis=1)
+
+
+@dataclass
+class PKDView:
+    """One PKD's feature columns and their positions in the store's matrix."""
+
+    pkd_code: str
+    feature_cols: list[str]
+    missing: list[str]
+    positions: np.ndarray
+    store: FeatureStore
+
+    def matrix(self, years=None) -> np.ndarray:
+        """(year x feature) matrix for `years` (all years by default)."""
+        values = self.store.values[:, self.positions]
+        if years is None:
+            return values
+        return values[self.store.rows(years)]
+
+    def frame(self, years) -> pd.DataFrame:
+        """'year' plus the feature columns, for those of `years` the store covers."""
+        years = np.asarray(years)[self.store.contains(years)]
+        frame = pd.DataFrame(self.matrix(years), columns=self.feature_cols)
+        frame.insert(0, YEAR_COL, years)
+        return frame
+
+
+class FeatureStore:
+    """
+    Every commodity driver and its lag/difference/rolling variants as one
+    (year x feature) float64 matrix, with the source frame kept for
+    pandas callers. Per-PKD views resolve column positions once.
+    """
+
+    def __init__(self, frame: pd.DataFrame, transforms=DEFAULT_TRANSFORMS) -> None:
+        self.frame = frame
+        self.transforms = tuple(transforms)
+        self.years = frame[YEAR_COL].to_numpy()
+        self.columns = pd.Index([c for c in frame.columns if c != YEAR_COL])
+        self.values = frame[self.columns].to_numpy(dtype=np.float64, na_value=np.nan)
+        self.drivers = [c for c in self.columns if SEPARATOR not in c]
+        self._year_pos = {int(y): i for i, y in enumerate(self.years.tolist())}
+        self._views: dict = {}
+
+    def __repr__(self) -> str:
+        return (
+            f"FeatureStore({len(self.years)} years x {len(self.drivers)} drivers x "
+            f"{1 + len(self.transforms)} variants)"
+        )
+
+    def contains(self, years) -> np.ndarray:
+        """Mask of the `years` the store has a row for."""
+        return np.isin(np.asarray(years), self.years)
+
+    def rows(self, years) -> np.ndarray:
+        try:
+            return np.array([self._year_pos[int(y)] for y in years], dtype=int)
+        except KeyError as exc:
+            raise KeyError(f"Year {exc.args[0]} not in feature store.") from None
+
+    def _check(self, transforms) -> None:
+        unknown = [t for t in transforms if t != LEVEL and t not in self.transforms]
+        if unknown:
+            raise KeyError(f"Transforms {unknown} not materialized; store has {self.transforms}.")
+
+    def feature_names(self, drivers, transforms=(LEVEL,)) -> list[str]:
+        """Feature names of `drivers` in driver-major order, e.g. [a, a__lag1, b, b__lag1]."""
+        self._check(transforms)
+        return [feature_name(d, t) for d in drivers for t in transforms]
+
+    def commodities(self, transforms=(LEVEL,)) -> pd.DataFrame:
+        """'year' plus the requested variants of every driver, as xgb_pipeline expects."""
+        return self.frame[[YEAR_COL, *self.feature_names(self.drivers, transforms)]]
+
+    def view(self, pkd_code: str, pkd_to_vars: dict[str, list[str]], transforms=(LEVEL,)) -> PKDView:
+        """A PKD's mapped drivers (and variants) present in the store; cached per call signature."""
+        key = (pkd_code, tuple(transforms))
+        if key not in self._views:
+            requested = pkd_to_vars.get(pkd_code, [])
+            available = [d for d in requested if d in self.drivers]
+            names = self.feature_names(available, transforms)
+            self._views[key] = PKDView(
+                pkd_code,
+                names,
+                sorted(set(requested) - set(available)),
+                self.columns.get_indexer(names),
+                self,
+            )
+        return self._views[key]
+
+
+def _with_defaults(transforms) -> tuple[str, ...]:
+    """DEFAULT_TRANSFORMS followed by the other requested transforms."""
+    extras = (t for t in transforms if t != LEVEL and t not in DEFAULT_TRANSFORMS)
+    return DEFAULT_TRANSFORMS + tuple(dict.fromkeys(extras))
+
+
+def _store_paths(source: Path, transforms=DEFAULT_TRANSFORMS) -> tuple[Path, Path]:
+    """
+    '<stem>.parquet' holds the default variants and is the features build
+    node's output; a store with extra variants is kept as
+    '<stem>+<extra>+...' so ad-hoc runs never rewrite the tracked file.
+    """
+    stem = "+".join([Path(source).stem, *_with_defaults(transforms)[len(DEFAULT_TRANSFORMS):]])
+    return STORE_DIR / f"{stem}.parquet", STORE_DIR / f"{stem}.json"
+
+
+def build_store(source: Path = COMMODITIES_PATH, transforms=DEFAULT_TRANSFORMS) -> FeatureStore:
+    """
+    Clean and materialize every driver and write the store (Parquet plus
+    metadata); the default variants are always included.
+    """
+    source = Path(source)
+    for transform in transforms:
+        parse_transform(transform)
+    transforms = _with_defaults(transforms)
+    frame = materialize(clean_commodities(read_excel(source)), transforms)
+    data_path, meta_path = _store_paths(source, transforms)
+    STORE_DIR.mkdir(parents=True, exist_ok=True)
+    # Per-process temp names: build nodes sharing the source may build at once.
+    tmp = data_path.with_suffix(f".parquet.{os.getpid()}.tmp")
+    frame.to_parquet(tmp, index=False)
+    os.replace(tmp, data_path)
+    stat = source.stat()
+    meta = {
+        "version": STORE_VERSION,
+        "source": str(source.resolve()),
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "sha256": file_digest(source),
+        "transforms": list(transforms),
+        "shape": list(frame.shape),
+    }
+    tmp = meta_path.with_suffix(f".json.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, meta_path)
+    return FeatureStore(frame, transforms)
+
+
+def _fresh(meta: dict, source: Path, transforms) -> bool:
+    if meta.get("version") != STORE_VERSION or not set(transforms) <= set(meta.get("transforms", [])):
+        return False
+    stat = source.stat()
+    if meta["mtime_ns"] == stat.st_mtime_ns and meta["size"] == stat.st_size:
+        return True
+    return meta["sha256"] == file_digest(source)
+
+
+def load_store(source: Path = COMMODITIES_PATH, transforms=DEFAULT_TRANSFORMS) -> FeatureStore:
+    """
+    The materialized store of `source`, read from Parquet; rebuilt only when
+    the source changed. Transforms beyond the defaults are read from (and
+    built into) their own store file, see `_store_paths`.
+    """
+    source = Path(source)
+    transforms = _with_defaults(transforms)
+    data_path, meta_path = _store_paths(source, transforms)
+    if data_path.is_file() and meta_path.is_file():
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        except ValueError:
+            meta = {}
+        if _fresh(meta, source, transforms):
+            return FeatureStore(pd.read_parquet(data_path), meta["transforms"])
+    return build_store(source, transforms)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Materialize the commodity driver feature store (levels plus lag/diff/rolling variants)."
+    )
+    parser.add_argument("--source", type=Path, default=COMMODITIES_PATH, help="Commodity workbook.")
+    parser.add_argument(
+        "--transforms",
+        nargs="+",
+        default=list(DEFAULT_TRANSFORMS),
+        help=(
+            "Variants to materialize: lagK, diffK, pctK, rollW. The defaults are always "
+            "included; extra variants go to a separate '<stem>+<extra>' store."
+        ),
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    store = build_store(args.source, args.transforms)
+    data_path, _ = _store_paths(args.source, store.transforms)
+    print(f"Built {store!r}: {store.values.shape[1]} feature columns -> {data_path.resolve()}")
+
+
+if __name__ == "__main__":
+    main()
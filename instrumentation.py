@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import argparse
+import cProfile
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows: no getrusage, peak RSS comes from psutil if present
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+_MB = 1024 * 1024
+PROFILE_TOP = 25
+
+# The trace of the running script; stages are no-ops while it is None.
+_ACTIVE: Trace | None = None
+
+
+def current_rss_mb() -> float | None:
+    """Resident set size of this process in MB, if the platform exposes it."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / _MB
+    try:
+        with open("/proc/self/statm", encoding="ascii") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / _MB
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_mb() -> float | None:
+    """Process high-water RSS in MB so far."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return peak / _MB if sys.platform == "darwin" else peak / 1024
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / _MB
+    return None
+
+
+def _shape(obj) -> dict[str, int]:
+    shape = getattr(obj, "shape", None)
+    if shape is None:
+        return {"rows": len(obj)}
+    counts = {"rows": int(shape[0])}
+    if len(shape) > 1:
+        counts["cols"] = int(shape[1])
+    return counts
+
+
+class Stage:
+    """Counters of one running stage; `count` and `shape` add to its record."""
+
+    def __init__(self, record: dict | None) -> None:
+        self.record = record
+
+    def count(self, **counters) -> None:
+        if self.record is not None:
+            self.record.update(counters)
+
+    def shape(self, obj, prefix: str = "") -> None:
+        """Record rows/cols of a frame or array (as `<prefix>rows`, `<prefix>cols`)."""
+        if self.record is not None:
+            self.record.update({prefix + key: value for key, value in _shape(obj).items()})
+
+
+class Trace:
+    """
+    Stage records of one script run: wall time, current and peak RSS, and
+    (with `memory`) the tracemalloc allocation peak inside each stage.
+    Nested stages are named 'outer/inner'.
+    """
+
+    def __init__(self, script: str, memory: bool = False) -> None:
+        self.script = script
+        self.memory = memory
+        self.stages: list[dict] = []
+        self._stack: list[dict] = []
+        self._start = time.perf_counter()
+        self.started = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name: str, **counters):
+        full_name = "/".join([frame["name"] for frame in self._stack] + [name])
+        record = {"stage": full_name, **counters}
+        frame = {"name": name, "child_peak": 0}
+        if self.memory:
+            frame["alloc_start"] = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self._stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield Stage(record)
+        finally:
+            record["seconds"] = round(time.perf_counter() - start, 6)
+            record["start"] = round(start - self._start, 6)
+            self._stack.pop()
+            if self.memory:
+                peak = max(tracemalloc.get_traced_memory()[1], frame["child_peak"])
+                record["alloc_peak_mb"] = round((peak - frame["alloc_start"]) / _MB, 3)
+                # reset_peak() above wiped the parent's running peak; carry ours up.
+                if self._stack:
+                    self._stack[-1]["child_peak"] = max(self._stack[-1]["child_peak"], peak)
+            rss, peak_rss = current_rss_mb(), peak_rss_mb()
+            if rss is not None:
+                record["rss_mb"] = round(rss, 1)
+            if peak_rss is not None:
+                record["peak_rss_mb"] = round(peak_rss, 1)
+            self.stages.append(record)
+
+    def to_dict(self) -> dict:
+        peak = peak_rss_mb()
+        return {
+            "script": self.script,
+            "started": self.started,
+            "argv": sys.argv[1:],
+            "python": sys.version.split()[0],
+            "pid": os.getpid(),
+            "total_seconds": round(time.perf_counter() - self._start, 6),
+            "peak_rss_mb": None if peak is None else round(peak, 1),
+            "stages": sorted(self.stages, key=lambda record: record["start"]),
+        }
+
+    def summary(self) -> str:
+        lines = [f"{'stage':<32} {'seconds':>9} {'peak RSS':>9}  counters"]
+        for record in sorted(self.stages, key=lambda r: r["start"]):
+            extra = {
+                k: v
+                for k, v in record.items()
+                if k not in ("stage", "seconds", "start", "rss_mb", "peak_rss_mb")
+            }
+            peak = record.get("peak_rss_mb")
+            lines.append(
+                f"{record['stage']:<32} {record['seconds']:>9.3f} "
+                f"{'-' if peak is None else f'{peak:.0f} MB':>9}  "
+                + " ".join(f"{k}={v}" for k, v in extra.items())
+            )
+        return "\n".join(lines)
+
+
+@contextmanager
+def stage(name: str, **counters):
+    """Time a stage of the active trace; a no-op when nothing is being traced."""
+    if _ACTIVE is None:
+        yield Stage(None)
+        return
+    with _ACTIVE.stage(name, **counters) as current:
+        yield current
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """The shared --trace / --trace-memory / --profile flags."""
+    parser.add_argument(
+        "--trace",
+        type=Path,
+        default=None,
+        help="Append a JSON line with per-stage timings, RSS and counters to this file.",
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="Also track the Python allocation peak of each stage (tracemalloc; slower).",
+    )
+    parser.add_argument(
+        "--profile",
+        type=Path,
+        default=None,
+        help="Write a cProfile dump here (view with snakeviz or `python -m pstats`).",
+    )
+
+
+@contextmanager
+def instrumented(script: str, args: argparse.Namespace):
+    """
+    Run a script body under a trace (and cProfile) as requested by the
+    flags from `add_arguments`; without them the stages cost nothing.
+    """
+    global _ACTIVE
+    trace_path = getattr(args, "trace", None)
+    profile_path = getattr(args, "profile", None)
+    memory = getattr(args, "trace_memory", False)
+    if trace_path is None and profile_path is None and not memory:
+        yield None
+        return
+
+    trace = Trace(script, memory=memory)
+    profiler = cProfile.Profile() if profile_path is not None else None
+    _ACTIVE = trace
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield trace
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        _ACTIVE = None
+        if memory:
+            tracemalloc.stop()
+        print(trace.summary(), file=sys.stderr)
+        if trace_path is not None:
+            trace_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(trace_path, "a", encoding="utf-8") as fh:
+                fh.write(json.dumps(trace.to_dict(), ensure_ascii=False) + "\n")
+            print(f"Appended trace to: {trace_path.resolve()}", file=sys.stderr)
+        if profiler is not None:
+            profile_path.parent.mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(profile_path)
+            stats = pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative")
+            stats.print_stats(PROFILE_TOP)
+            print(f"Saved profile to: {profile_path.resolve()}", file=sys.stderr)
@@ -0,0 +1,293 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from data_cache import file_digest, read_csv, read_excel
+
+
+BASE_DIR = Path(__file__).parent
+KRZ_PKD_PATH = BASE_DIR / "data" / "krz_pkd.csv"
+STRUCTURE_PATH = BASE_DIR / "data" / "StrukturaPKD2025.xls"
+CUBE_PATH = BASE_DIR / ".cache" / "krz_cube.npz"
+
+LEVELS = ("section", "division", "group", "class", "subclass")
+
+_SUBCLASS_RE = re.compile(r"^(\d{2})\.?(\d)(\d)\.?([A-Z])$")
+_CLASS_RE = re.compile(r"^(\d{2})\.?(\d)(\d)$")
+_GROUP_RE = re.compile(r"^(\d{1,2})\.(\d)$")
+_DIVISION_RE = re.compile(r"^(\d{2})$")
+_SECTION_RE = re.compile(r"^(?:SEKCJA\s+|SEK_)?([A-Z])$")
+
+
+def canonical_code(code) -> tuple[str, str] | None:
+    """
+    (level, code) in dotted PKD form for any accepted spelling:
+    '0111Z' / '01.11.Z' -> subclass '01.11.Z', '0111' / '01.11' -> class,
+    '01.1' / '1.1' -> group, '01' / '01.' -> division, 'A' / 'SEKCJA A' /
+    'SEK_A' -> section. Returns None for anything that is not a PKD code.
+    """
+    code = str(code).strip().upper().rstrip(".")
+    if m := _SUBCLASS_RE.match(code):
+        return "subclass", f"{m[1]}.{m[2]}{m[3]}.{m[4]}"
+    if m := _CLASS_RE.match(code):
+        return "class", f"{m[1]}.{m[2]}{m[3]}"
+    if m := _GROUP_RE.match(code):
+        return "group", f"{int(m[1]):02d}.{m[2]}"
+    if _DIVISION_RE.match(code):
+        return "division", code
+    if m := _SECTION_RE.match(code):
+        return "section", m[1]
+    return None
+
+
+def ancestors(level: str, code: str, sections: dict[str, str]) -> list[tuple[str, str]]:
+    """
+    The code and every coarser level above it, e.g. '01.11.Z' ->
+    [subclass, class '01.11', group '01.1', division '01', section 'A'].
+    The section comes from the PKD 2025 division map and is left out if
+    the division is not in it.
+    """
+    depth = LEVELS.index(level)
+    division = code[:2] if level != "section" else None
+    chain = {
+        "subclass": code,
+        "class": code[:5],
+        "group": code[:4],
+        "division": division,
+        "section": sections.get(division) if division else code,
+    }
+    return [(lvl, chain[lvl]) for lvl in LEVELS[: depth + 1] if chain[lvl] is not None]
+
+
+def load_structure(path: Path = STRUCTURE_PATH) -> tuple[dict[str, str], dict[str, str]]:
+    """
+    Parse StrukturaPKD2025: returns (division -> section letter, code -> name)
+    for every level of the hierarchy.
+    """
+    raw = read_excel(path, sheet_name=0, header=1, dtype="str")
+    sections, names = {}, {}
+    section = None
+    for division, group, klass, subclass, name in raw.iloc[:, :5].itertuples(index=False):
+        cell = next((c for c in (division, group, subclass, klass) if isinstance(c, str)), None)
+        if cell is None:
+            continue
+        parsed = canonical_code(cell)
+        if parsed is None:
+            continue
+        level, code = parsed
+        if level == "section":
+            section = code
+            names[code] = str(klass).strip() if isinstance(klass, str) else code
+            continue
+        if level == "division" and section is not None:
+            sections[code] = section
+        if isinstance(name, str):
+            names[code] = name.strip()
+            if level == "subclass" and isinstance(klass, str):
+                names[klass.strip()] = name.strip()
+    return sections, names
+
+
+class KRZCube:
+    """
+    Bankruptcy counts by (PKD node, year) for every node at every level of
+    the PKD 2025 hierarchy, with per-node cumulative sums over years so any
+    (code, year range) total is two dictionary lookups and one subtraction.
+    `observed` marks the (node, year) cells backed by at least one KRZ row.
+    """
+
+    def __init__(self, codes, levels, years, counts: np.ndarray, observed=None) -> None:
+        self.codes = np.asarray(codes, dtype=str)
+        self.levels = np.asarray(levels, dtype=str)
+        self.years = np.asarray(years, dtype=int)
+        self.counts = np.asarray(counts, dtype=np.int64)
+        if observed is None:
+            observed = self.counts != 0
+        self.observed = np.asarray(observed, dtype=bool)
+        self._node = {code: i for i, code in enumerate(self.codes.tolist())}
+        self._year_pos = {int(y): i for i, y in enumerate(self.years.tolist())}
+        self._cum = np.hstack(
+            [np.zeros((len(self.codes), 1), dtype=np.int64), np.cumsum(self.counts, axis=1)]
+        )
+
+    def __repr__(self) -> str:
+        return f"KRZCube({len(self.codes)} PKD nodes x {len(self.years)} years)"
+
+    @classmethod
+    def build(cls, krz: pd.DataFrame, sections: dict[str, str]) -> KRZCube:
+        """Aggregate a `rok;pkd;liczba_upadlosci` table up the hierarchy."""
+        years = pd.to_numeric(krz["rok"], errors="coerce")
+        counts = pd.to_numeric(krz["liczba_upadlosci"], errors="coerce").fillna(0)
+        parsed = krz["pkd"].map(canonical_code)
+        valid = parsed.notna() & years.notna()
+        years = years[valid].astype(int).to_numpy()
+        counts = counts[valid].astype(np.int64).to_numpy()
+        parsed = parsed[valid].tolist()
+
+        all_years = np.arange(years.min(), years.max() + 1) if len(years) else np.zeros(0, int)
+        nodes: dict[tuple[str, str], int] = {}
+        rows, cols, values = [], [], []
+        for (level, code), year, count in zip(parsed, years, counts):
+            for node in ancestors(level, code, sections):
+                rows.append(nodes.setdefault(node, len(nodes)))
+                cols.append(year - all_years[0])
+                values.append(count)
+
+        cells = (np.asarray(rows, dtype=int), np.asarray(cols, dtype=int))
+        matrix = np.zeros((len(nodes), len(all_years)), dtype=np.int64)
+        np.add.at(matrix, cells, values)
+        observed = np.zeros(matrix.shape, dtype=bool)
+        observed[cells] = True
+        levels = [level for level, _ in nodes]
+        codes = [code for _, code in nodes]
+        order = np.lexsort((codes, [LEVELS.index(lvl) for lvl in levels]))
+        return cls(
+            np.asarray(codes)[order],
+            np.asarray(levels)[order],
+            all_years,
+            matrix[order],
+            observed[order],
+        )
+
+    def _year_bounds(self, start: int | None, end: int | None) -> tuple[int, int]:
+        first, last = int(self.years[0]), int(self.years[-1])
+        start = first if start is None else max(int(start), first)
+        end = last if end is None else min(int(end), last)
+        if start > end:
+            return 0, 0
+        return self._year_pos[start], self._year_pos[end] + 1
+
+    def node(self, code) -> int | None:
+        parsed = canonical_code(code)
+        return None if parsed is None else self._node.get(parsed[1])
+
+    def total(self, code, start: int | None = None, end: int | None = None) -> int:
+        """Bankruptcies under `code` over years [start, end] (inclusive); 0 if unknown."""
+        node = self.node(code)
+        if node is None or not len(self.years):
+            return 0
+        lo, hi = self._year_bounds(start, end)
+        return int(self._cum[node, hi] - self._cum[node, lo])
+
+    def frame(self, codes, years) -> pd.DataFrame:
+        """codes x years frame of counts (0 for unknown codes or years)."""
+        codes = list(codes)
+        years = [int(y) for y in years]
+        nodes = np.array([self.node(c) if self.node(c) is not None else -1 for c in codes], dtype=int)
+        pos = np.array([self._year_pos.get(y, -1) for y in years], dtype=int)
+        values = np.zeros((len(codes), len(years)), dtype=np.int64)
+        ok_rows, ok_cols = nodes >= 0, pos >= 0
+        values[np.ix_(ok_rows, ok_cols)] = self.counts[np.ix_(nodes[ok_rows], pos[ok_cols])]
+        return pd.DataFrame(values, index=codes, columns=years)
+
+    def level_frame(self, level: str, missing_as_nan: bool = False) -> pd.DataFrame:
+        """
+        years x codes frame of every node at one level. With `missing_as_nan`,
+        cells with no KRZ row are NaN instead of 0 (as a pivot_table gives).
+        """
+        if level not in LEVELS:
+            raise ValueError(f"Unknown level '{level}'; expected one of {LEVELS}.")
+        rows = self.levels == level
+        values = self.counts[rows].T
+        if missing_as_nan:
+            values = np.where(self.observed[rows].T, values, np.nan)
+        return pd.DataFrame(
+            values,
+            index=pd.Index(self.years, name="year"),
+            columns=pd.Index(self.codes[rows], name="pkd"),
+        )
+
+    def save(self, path: Path, sources: dict[str, str]) -> None:
+        """Persist the cube with the source digests it was built from."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Per-process temp name: the dashboard and correlations nodes may build the cube at once.
+        tmp = path.with_suffix(f".{os.getpid()}.tmp.npz")
+        np.savez_compressed(
+            tmp,
+            codes=self.codes,
+            levels=self.levels,
+            years=self.years,
+            counts=self.counts,
+            observed=self.observed,
+            sources=np.array(json.dumps(sources, sort_keys=True)),
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> tuple[KRZCube, dict[str, str]]:
+        with np.load(path) as data:
+            cube = cls(
+                data["codes"], data["levels"], data["years"], data["counts"], data["observed"]
+            )
+            sources = json.loads(str(data["sources"]))
+        return cube, sources
+
+
+def _source_digests(krz_path: Path, structure_path: Path) -> dict[str, str]:
+    return {"krz": file_digest(krz_path), "structure": file_digest(structure_path)}
+
+
+def build_cube(
+    krz_path: Path = KRZ_PKD_PATH,
+    structure_path: Path = STRUCTURE_PATH,
+    cube_path: Path = CUBE_PATH,
+) -> KRZCube:
+    """Build the cube from the KRZ table (subclass or short group codes) and persist it."""
+    sections, _ = load_structure(structure_path)
+    cube = KRZCube.build(read_csv(krz_path, sep=";"), sections)
+    cube.save(cube_path, _source_digests(krz_path, structure_path))
+    return cube
+
+
+def load_cube(
+    krz_path: Path = KRZ_PKD_PATH,
+    structure_path: Path = STRUCTURE_PATH,
+    cube_path: Path = CUBE_PATH,
+) -> KRZCube:
+    """The persisted cube, rebuilt first if either source file changed."""
+    if cube_path.exists():
+        try:
+            cube, sources = KRZCube.load(cube_path)
+        except (OSError, ValueError, KeyError):
+            cube, sources = None, None
+        if cube is not None and sources == _source_digests(krz_path, structure_path):
+            return cube
+    return build_cube(krz_path, structure_path, cube_path)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Build the KRZ bankruptcy cube over the PKD 2025 hierarchy."
+    )
+    parser.add_argument(
+        "--krz-path",
+        type=Path,
+        default=KRZ_PKD_PATH,
+        help="KRZ table (rok;pkd;liczba_upadlosci), subclass or group codes.",
+    )
+    parser.add_argument(
+        "--cube-path",
+        type=Path,
+        default=CUBE_PATH,
+        help="Where the cube is persisted.",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    cube = build_cube(args.krz_path, STRUCTURE_PATH, args.cube_path)
+    for level in LEVELS:
+        print(f"{level}: {(cube.levels == level).sum()} codes")
+    print(f"Saved {cube} to: {args.cube_path.resolve()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import pickle
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+BASE_DIR = Path(__file__).parent
+REGISTRY_DIR = BASE_DIR / ".cache" / "models"
+
+
+def _update_digest(digest, part) -> None:
+    if isinstance(part, (pd.DataFrame, pd.Series)):
+        frame = part.to_frame() if isinstance(part, pd.Series) else part
+        header = [[str(c), str(t)] for c, t in zip(frame.columns, frame.dtypes)]
+        digest.update(json.dumps(header, ensure_ascii=False).encode("utf-8"))
+        digest.update(pd.util.hash_pandas_object(frame, index=True).to_numpy().tobytes())
+    elif isinstance(part, np.ndarray):
+        digest.update(f"{part.dtype}{part.shape}".encode("utf-8"))
+        digest.update(np.ascontiguousarray(part).tobytes())
+    else:
+        digest.update(json.dumps(part, sort_keys=True, default=str).encode("utf-8"))
+
+
+def fingerprint(*parts) -> str:
+    """
+    SHA-256 over a model's inputs: frames/arrays by content (values, index,
+    column names and dtypes), anything else by its JSON form, so feature
+    lists and hyperparameter dicts can be passed directly.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        _update_digest(digest, part)
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class ModelRegistry:
+    """
+    On-disk store of fitted models and their outputs, one entry per key
+    (a PKD code, a target column, ...).
+
+    An entry is only returned when its stored fingerprint matches the
+    caller's, so anything that changes the training slice, the features or
+    the hyperparameters invalidates it.
+    """
+
+    def __init__(self, name: str, root: Path = REGISTRY_DIR) -> None:
+        self.root = Path(root) / name
+
+    def _path(self, key: str) -> Path:
+        # Keys are free-form (column names contain '/', ';', spaces), so hash them.
+        name = hashlib.sha1(str(key).encode("utf-8")).hexdigest()[:16]
+        return self.root / f"{name}.pkl"
+
+    def load(self, key: str, fp: str) -> dict | None:
+        """The stored entry for `key` if it was fitted on inputs with fingerprint `fp`."""
+        path = self._path(key)
+        if not path.is_file():
+            return None
+        try:
+            with open(path, "rb") as fh:
+                entry = pickle.load(fh)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return None
+        if entry.get("key") != str(key) or entry.get("fingerprint") != fp:
+            return None
+        return entry
+
+    def save(self, key: str, fp: str, **payload) -> None:
+        """Store a fitted model and its outputs (atomically) under `key`."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        tmp = path.with_suffix(f".pkl.{os.getpid()}.tmp")
+        with open(tmp, "wb") as fh:
+            pickle.dump({"key": str(key), "fingerprint": fp, **payload}, fh)
+        os.replace(tmp, path)
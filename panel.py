@@ -0,0 +1,258 @@
+from __future__ import annotations
+
+import csv
+from collections.abc import Iterable
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+YEAR_COLUMNS = ("year", "rok")
+DEFAULT_CHUNKSIZE = 64
+
+
+def split_header(columns: Iterable[str]) -> pd.MultiIndex:
+    """
+    Parse '<PKD>_<metric>' column names into a (pkd, metric) MultiIndex,
+    splitting on the first underscore only ('10.1_GS_I' -> ('10.1', 'GS_I')).
+    """
+    columns = [str(c) for c in columns]
+    bad = [c for c in columns if "_" not in c]
+    if bad:
+        raise ValueError(f"Columns are not '<PKD>_<metric>' names: {bad[:5]}")
+    return pd.MultiIndex.from_tuples(
+        [tuple(c.split("_", 1)) for c in columns], names=["pkd", "metric"]
+    )
+
+
+def _year_column(columns: Iterable[str], year_col: str | None) -> str:
+    columns = list(columns)
+    if year_col is not None:
+        if year_col not in columns:
+            raise ValueError(f"Year column '{year_col}' not found.")
+        return year_col
+    found = next((c for c in YEAR_COLUMNS if c in columns), None)
+    if found is None:
+        raise ValueError(f"No year column found; expected one of {YEAR_COLUMNS}.")
+    return found
+
+
+class PKDPanel:
+    """
+    Wide '<PKD>_<metric>' table stored as a dense (year x pkd x metric)
+    array, NaN where a PKD has no column for a metric.
+
+    The header is parsed once; `by_pkd`, `by_metric` and `by_year` return
+    views into the array, and `to_long` builds categorical columns from
+    integer codes instead of string cells.
+    """
+
+    def __init__(
+        self,
+        years: np.ndarray,
+        pkds: pd.Index,
+        metrics: pd.Index,
+        values: np.ndarray,
+        present: np.ndarray | None = None,
+    ) -> None:
+        if values.shape != (len(years), len(pkds), len(metrics)):
+            raise ValueError(
+                f"Values shaped {values.shape}; expected "
+                f"({len(years)}, {len(pkds)}, {len(metrics)})."
+            )
+        self.years = np.asarray(years)
+        self.pkds = pd.Index(pkds, name="pkd")
+        self.metrics = pd.Index(metrics, name="metric")
+        self.values = values
+        # (pkd x metric) mask of the pairs that had a column in the source.
+        if present is None:
+            present = ~np.isnan(values).all(axis=0)
+        self.present = np.asarray(present, dtype=bool).reshape(len(pkds), len(metrics))
+        self._year_pos = {int(y): i for i, y in enumerate(self.years.tolist())}
+
+    def __repr__(self) -> str:
+        return (
+            f"PKDPanel({len(self.years)} years x {len(self.pkds)} PKD x "
+            f"{len(self.metrics)} metrics, {self.values.dtype})"
+        )
+
+    @staticmethod
+    def _layout(header: pd.MultiIndex) -> tuple[pd.Index, pd.Index, np.ndarray]:
+        """Sorted PKD/metric axes and each column's flat (pkd, metric) cell."""
+        pkds = pd.Index(sorted(set(header.get_level_values("pkd"))))
+        metrics = pd.Index(sorted(set(header.get_level_values("metric"))))
+        flat = (
+            pkds.get_indexer(header.get_level_values("pkd")) * len(metrics)
+            + metrics.get_indexer(header.get_level_values("metric"))
+        )
+        return pkds, metrics, flat
+
+    @classmethod
+    def from_wide(
+        cls,
+        df: pd.DataFrame,
+        year_col: str | None = None,
+        dtype=np.float32,
+    ) -> PKDPanel:
+        """Build a panel from an in-memory wide frame."""
+        year_col = _year_column(df.columns, year_col)
+        value_cols = [c for c in df.columns if c != year_col]
+        pkds, metrics, flat = cls._layout(split_header(value_cols))
+        values = _scatter(df[value_cols], flat, len(pkds) * len(metrics), dtype)
+        order = np.argsort(df[year_col].to_numpy(), kind="stable")
+        years = df[year_col].to_numpy()[order].astype(int)
+        return cls(
+            years,
+            pkds,
+            metrics,
+            values[order].reshape(len(years), len(pkds), len(metrics)),
+            present=_present(flat, len(pkds) * len(metrics)),
+        )
+
+    @classmethod
+    def read_csv(
+        cls,
+        path: Path,
+        sep: str = ",",
+        year_col: str | None = None,
+        dtype=np.float32,
+        chunksize: int = DEFAULT_CHUNKSIZE,
+        encoding: str = "utf-8",
+    ) -> PKDPanel:
+        """
+        Stream a wide CSV into a panel: the header is parsed once, then rows
+        are read `chunksize` at a time and scattered straight into the
+        array, so no full-width float64 frame is ever held.
+        """
+        with open(path, newline="", encoding=encoding) as fh:
+            header = next(csv.reader(fh, delimiter=sep))
+        year_col = _year_column(header, year_col)
+        value_cols = [c for c in header if c != year_col]
+        pkds, metrics, flat = cls._layout(split_header(value_cols))
+        width = len(pkds) * len(metrics)
+
+        year_chunks, value_chunks = [], []
+        reader = pd.read_csv(path, sep=sep, chunksize=chunksize, encoding=encoding)
+        for chunk in reader:
+            year_chunks.append(chunk[year_col].to_numpy())
+            value_chunks.append(_scatter(chunk[value_cols], flat, width, dtype))
+        years = np.concatenate(year_chunks).astype(int) if year_chunks else np.zeros(0, int)
+        values = np.concatenate(value_chunks) if value_chunks else np.zeros((0, width), dtype)
+
+        order = np.argsort(years, kind="stable")
+        return cls(
+            years[order],
+            pkds,
+            metrics,
+            values[order].reshape(len(years), len(pkds), len(metrics)),
+            present=_present(flat, width),
+        )
+
+    def _pkd_pos(self, pkd: str) -> int:
+        pos = self.pkds.get_indexer([pkd])[0]
+        if pos < 0:
+            raise KeyError(f"PKD '{pkd}' not in panel.")
+        return pos
+
+    def _metric_pos(self, metric: str) -> int:
+        pos = self.metrics.get_indexer([metric])[0]
+        if pos < 0:
+            raise KeyError(f"Metric '{metric}' not in panel.")
+        return pos
+
+    def by_pkd(self, pkd: str) -> np.ndarray:
+        """(year x metric) view of one PKD."""
+        return self.values[:, self._pkd_pos(pkd), :]
+
+    def by_metric(self, metric: str) -> np.ndarray:
+        """(year x pkd) view of one metric."""
+        return self.values[:, :, self._metric_pos(metric)]
+
+    def by_year(self, year: int) -> np.ndarray:
+        """(pkd x metric) view of one year."""
+        if int(year) not in self._year_pos:
+            raise KeyError(f"Year {year} not in panel.")
+        return self.values[self._year_pos[int(year)]]
+
+    def metric_frame(self, metric: str) -> pd.DataFrame:
+        """Years x PKD frame of one metric, backed by the panel array."""
+        return pd.DataFrame(
+            self.by_metric(metric),
+            index=pd.Index(self.years, name="year"),
+            columns=self.pkds,
+            copy=False,
+        )
+
+    def pkd_frame(self, pkd: str) -> pd.DataFrame:
+        """Years x metric frame of one PKD, backed by the panel array."""
+        return pd.DataFrame(
+            self.by_pkd(pkd),
+            index=pd.Index(self.years, name="year"),
+            columns=self.metrics,
+            copy=False,
+        )
+
+    def year_pkd_frame(self, dropna: bool = True) -> pd.DataFrame:
+        """
+        (year, pkd) x metric frame, the shape the notebooks get from
+        melt + str.split + pivot_table; with `dropna`, rows with no values
+        are dropped as pivot_table does.
+        """
+        n_years, n_pkds, n_metrics = self.values.shape
+        index = pd.MultiIndex.from_product(
+            [self.years, self.pkds], names=["year", "pkd"]
+        )
+        frame = pd.DataFrame(
+            self.values.reshape(n_years * n_pkds, n_metrics),
+            index=index,
+            columns=self.metrics,
+            copy=False,
+        )
+        if dropna:
+            frame = frame[~np.isnan(frame.to_numpy()).all(axis=1)]
+        return frame
+
+    def to_long(self, dropna: bool = True) -> pd.DataFrame:
+        """
+        Long (year, pkd, metric, value) frame. PKD and metric are categoricals
+        built from integer codes, so no per-row strings are allocated.
+        """
+        n_years, n_pkds, n_metrics = self.values.shape
+        flat = self.values.reshape(-1)
+        cells = np.flatnonzero(~np.isnan(flat)) if dropna else np.arange(flat.size)
+        year_idx, rem = np.divmod(cells, n_pkds * n_metrics)
+        pkd_idx, metric_idx = np.divmod(rem, n_metrics)
+        return pd.DataFrame(
+            {
+                "year": self.years[year_idx],
+                "pkd": pd.Categorical.from_codes(pkd_idx, categories=self.pkds),
+                "metric": pd.Categorical.from_codes(metric_idx, categories=self.metrics),
+                "value": flat[cells],
+            }
+        )
+
+    def to_wide(self, year_col: str = "year") -> pd.DataFrame:
+        """Back to one '<PKD>_<metric>' column per (pkd, metric) pair of the source."""
+        n_years, n_pkds, n_metrics = self.values.shape
+        flat = self.values.reshape(n_years, -1)
+        cells = np.flatnonzero(self.present.reshape(-1))
+        names = [f"{self.pkds[i // n_metrics]}_{self.metrics[i % n_metrics]}" for i in cells]
+        wide = pd.DataFrame(flat[:, cells], columns=names)
+        wide.insert(0, year_col, self.years)
+        return wide
+
+
+def _present(flat: np.ndarray, width: int) -> np.ndarray:
+    present = np.zeros(width, dtype=bool)
+    present[flat] = True
+    return present
+
+
+def _scatter(values: pd.DataFrame, flat: np.ndarray, width: int, dtype) -> np.ndarray:
+    """Place each wide column into its flat (pkd, metric) slot of a NaN block."""
+    if (values.dtypes == object).any():
+        values = values.apply(pd.to_numeric, errors="coerce")
+    block = np.full((len(values), width), np.nan, dtype=dtype)
+    block[:, flat] = values.to_numpy(dtype=dtype, na_value=np.nan)
+    return block
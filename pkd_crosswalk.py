@@ -0,0 +1,299 @@
+from __future__ import annotations
+
+import argparse
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from data_cache import read_csv, read_excel
+from krz_cube import canonical_code
+from panel import PKDPanel
+
+
+BASE_DIR = Path(__file__).parent
+MAPPING_PATH = BASE_DIR / "data" / "mapowanie_pkd.xlsx"
+KEYS_PATH = BASE_DIR / "data" / "KluczePKD_2007_2025_pop.csv"
+GS_PATH = BASE_DIR / "data" / "GS_filtered.xlsx"
+NWC_PATH = BASE_DIR / "data" / "NWC_filtered.xlsx"
+KRZ_PKD_PATH = BASE_DIR / "data" / "krz_pkd.csv"
+OUTPUT_DIR = BASE_DIR / "data" / "pkd2025"
+
+DIRECTIONS = ("2007_2025", "2025_2007")
+HOW = ("sum", "mean")
+
+
+def _canonical(codes) -> list[str | None]:
+    """Dotted PKD codes (see `krz_cube.canonical_code`), None for non-PKD labels."""
+    out = []
+    for code in codes:
+        parsed = canonical_code(code)
+        out.append(None if parsed is None else parsed[1])
+    return out
+
+
+class Crosswalk:
+    """
+    Many-to-many PKD mapping held as integer-coded edge arrays.
+
+    Every edge (source code, target code, weight) is stored as two positions
+    into the `sources` / `targets` indexes plus a float weight; the weights
+    of each source sum to 1, so `sum` remapping preserves totals. Remapping
+    builds one sparse (target x row) matrix per call and applies it to all
+    columns at once.
+    """
+
+    def __init__(
+        self,
+        sources: pd.Index,
+        targets: pd.Index,
+        src: np.ndarray,
+        dst: np.ndarray,
+        weight: np.ndarray,
+    ) -> None:
+        self.sources = pd.Index(sources)
+        self.targets = pd.Index(targets)
+        self.src = np.asarray(src, dtype=np.int64)
+        self.dst = np.asarray(dst, dtype=np.int64)
+        self.weight = np.asarray(weight, dtype=float)
+
+    def __repr__(self) -> str:
+        return (
+            f"Crosswalk({len(self.sources)} source codes -> {len(self.targets)} "
+            f"target codes, {len(self.src)} edges)"
+        )
+
+    @classmethod
+    def from_pairs(cls, pairs: pd.DataFrame, weight_col: str | None = None) -> Crosswalk:
+        """
+        Build from a (source, target[, weight]) frame. Codes are normalized to
+        dotted PKD form; without weights each source is split equally across
+        its targets, and given weights are rescaled to sum to 1 per source.
+        """
+        source = pd.Series(_canonical(pairs.iloc[:, 0]), index=pairs.index)
+        target = pd.Series(_canonical(pairs.iloc[:, 1]), index=pairs.index)
+        weight = (
+            pd.to_numeric(pairs[weight_col], errors="coerce").fillna(0.0)
+            if weight_col is not None
+            else pd.Series(1.0, index=pairs.index)
+        )
+        edges = pd.DataFrame({"source": source, "target": target, "weight": weight})
+        edges = edges.dropna(subset=["source", "target"])
+        edges = edges.groupby(["source", "target"], sort=True)["weight"].sum().reset_index()
+
+        sources = pd.Index(sorted(edges["source"].unique()))
+        targets = pd.Index(sorted(edges["target"].unique()))
+        src = sources.get_indexer(edges["source"])
+        dst = targets.get_indexer(edges["target"])
+        return cls(sources, targets, src, dst, _normalize(src, edges["weight"].to_numpy(), len(sources)))
+
+    def with_target_weights(self, sizes: pd.Series) -> Crosswalk:
+        """
+        Split each source in proportion to `sizes` of its targets (e.g. PKD
+        2025 revenue or employment) instead of equally. Sources whose
+        targets have no size keep the equal split.
+        """
+        sizes = pd.Series(sizes.to_numpy(dtype=float), index=_canonical(sizes.index))
+        sizes = sizes[sizes.index.notna()].groupby(level=0).sum()
+        target_size = sizes.reindex(self.targets).fillna(0.0).to_numpy()
+        raw = target_size[self.dst]
+        weight = _normalize(self.src, raw, len(self.sources))
+        unsized = np.bincount(self.src, weights=raw, minlength=len(self.sources)) == 0
+        weight[unsized[self.src]] = self.weight[unsized[self.src]]
+        return Crosswalk(self.sources, self.targets, self.src, self.dst, weight)
+
+    def targets_of(self, code) -> pd.Series:
+        """Target codes and weights of one source code."""
+        pos = self.sources.get_indexer(_canonical([code]))[0]
+        edges = self.src == pos if pos >= 0 else np.zeros(len(self.src), dtype=bool)
+        return pd.Series(self.weight[edges], index=self.targets[self.dst[edges]], name="weight")
+
+    def _row_matrix(self, codes) -> tuple[sparse.csr_matrix, pd.Index, np.ndarray]:
+        """
+        Sparse (target x row) weight matrix for rows labelled `codes`, the
+        target codes it covers, and a mask of rows the crosswalk cannot map.
+        """
+        codes = _canonical(codes)
+        pos = self.sources.get_indexer(codes)
+        dupes = pd.Index(codes)[pos >= 0]
+        if dupes.has_duplicates:
+            raise ValueError(f"Rows map to the same source code: {sorted(set(dupes[dupes.duplicated()]))[:5]}")
+
+        row_of_source = np.full(len(self.sources), -1, dtype=np.int64)
+        row_of_source[pos[pos >= 0]] = np.flatnonzero(pos >= 0)
+        rows = row_of_source[self.src]
+        used = rows >= 0
+        dst = self.dst[used]
+        covered, dst = np.unique(dst, return_inverse=True)
+        matrix = sparse.csr_matrix(
+            (self.weight[used], (dst, rows[used])), shape=(len(covered), len(codes))
+        )
+        return matrix, self.targets[covered], pos < 0
+
+    def remap_values(
+        self, codes, values: np.ndarray, how: str = "sum"
+    ) -> tuple[pd.Index, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Remap a (row x column) array whose rows are labelled `codes`.
+
+        `how="sum"` splits each source value across its targets by weight
+        (for additive data: revenue, counts); `how="mean"` gives the
+        weighted mean of the sources feeding a target (for ratios).
+        Returns (target codes, values, coverage, unmapped row mask), where
+        coverage is the share of a target's incoming weight backed by a
+        non-NaN source value; targets with zero coverage are NaN.
+        """
+        if how not in HOW:
+            raise ValueError(f"Unknown how '{how}'; expected one of {HOW}.")
+        matrix, targets, unmapped = self._row_matrix(codes)
+        values = np.asarray(values, dtype=float).reshape(len(unmapped), -1)
+        known = ~np.isnan(values)
+        weighted = matrix @ np.where(known, values, 0.0)
+        mass = matrix @ known.astype(float)
+        incoming = np.asarray(matrix.sum(axis=1))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out = weighted / mass if how == "mean" else weighted
+            coverage = mass / incoming
+        out[mass == 0] = np.nan
+        return targets, out, coverage, unmapped
+
+    def remap_frame(self, frame: pd.DataFrame, how: str = "sum") -> tuple[pd.DataFrame, pd.DataFrame]:
+        """Remap a frame indexed by PKD code; returns (values, coverage) frames."""
+        targets, values, coverage, _ = self.remap_values(frame.index, frame.to_numpy(dtype=float), how)
+        index = pd.Index(targets, name=frame.index.name)
+        return (
+            pd.DataFrame(values, index=index, columns=frame.columns),
+            pd.DataFrame(coverage, index=index, columns=frame.columns),
+        )
+
+    def remap_panel(self, panel: PKDPanel, how: str = "mean") -> tuple[PKDPanel, np.ndarray]:
+        """
+        Remap the PKD axis of a wide '<PKD>_<metric>' panel in one pass;
+        returns the new panel and its (year x pkd x metric) coverage.
+        """
+        n_years, n_pkds, n_metrics = panel.values.shape
+        by_pkd = np.moveaxis(panel.values, 1, 0).reshape(n_pkds, -1)
+        targets, values, coverage, _ = self.remap_values(panel.pkds, by_pkd, how)
+
+        def back(block: np.ndarray) -> np.ndarray:
+            return np.moveaxis(block.reshape(len(targets), n_years, n_metrics), 0, 1)
+
+        present = (back(coverage) > 0).any(axis=0)
+        remapped = PKDPanel(
+            panel.years, targets, panel.metrics, back(values).astype(panel.values.dtype), present
+        )
+        return remapped, back(coverage)
+
+
+def _normalize(src: np.ndarray, weight: np.ndarray, n_sources: int) -> np.ndarray:
+    """Rescale edge weights to sum to 1 per source (equal split where they sum to 0)."""
+    weight = np.asarray(weight, dtype=float)
+    total = np.bincount(src, weights=weight, minlength=n_sources)
+    count = np.bincount(src, minlength=n_sources)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out = np.where(total[src] > 0, weight / total[src], 1.0 / count[src])
+    return out
+
+
+@lru_cache(maxsize=None)
+def load_crosswalk(direction: str = "2007_2025", path: Path = MAPPING_PATH) -> Crosswalk:
+    """Crosswalk from the MAP_PKD_<direction> sheet of mapowanie_pkd.xlsx (section to class)."""
+    if direction not in DIRECTIONS:
+        raise ValueError(f"Unknown direction '{direction}'; expected one of {DIRECTIONS}.")
+    source, target = direction.split("_")
+    pairs = read_excel(path, sheet_name=f"MAP_PKD_{direction}", dtype="str")
+    return Crosswalk.from_pairs(pairs[[f"symbol_{source}", f"symbol_{target}"]])
+
+
+def load_keys_crosswalk(path: Path = KEYS_PATH) -> Crosswalk:
+    """2007 -> 2025 crosswalk from the official keys CSV (section to group only)."""
+    pairs = read_csv(path, dtype="str")
+    return Crosswalk.from_pairs(pairs[["Symbol PKD 2007", "Symbol PKD 2025"]])
+
+
+def remap_indicator_sheet(
+    df: pd.DataFrame,
+    crosswalk: Crosswalk,
+    code_col: str = "numer PKD",
+    how: str = "sum",
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Remap a GS/NWC-style sheet (one row per PKD code, one column per year).
+    Rows that are not PKD codes (e.g. 'OG') are dropped; 'bd' cells are NaN.
+    Returns (values, coverage), both with `code_col` plus the year columns.
+    """
+    year_cols = [c for c in df.columns if isinstance(c, (int, np.integer))]
+    values = df[year_cols].apply(pd.to_numeric, errors="coerce")
+    values.index = df[code_col].astype(str)
+    keep = pd.Series(_canonical(values.index), index=values.index).notna().to_numpy()
+    remapped, coverage = crosswalk.remap_frame(values[keep], how=how)
+    return remapped.rename_axis(code_col).reset_index(), coverage.rename_axis(code_col).reset_index()
+
+
+def remap_krz(krz: pd.DataFrame, crosswalk: Crosswalk) -> pd.DataFrame:
+    """
+    Remap a `rok;pkd;liczba_upadlosci` table. The mapping stops at class
+    level, so subclass codes are rolled up to their class first; split
+    counts are fractional where a class maps to several targets.
+    """
+    parsed = krz["pkd"].map(canonical_code)
+    valid = parsed.notna()
+    codes = parsed[valid].map(lambda p: p[1][:5] if p[0] == "subclass" else p[1])
+    counts = (
+        pd.DataFrame(
+            {
+                "pkd": codes,
+                "rok": pd.to_numeric(krz.loc[valid, "rok"], errors="coerce"),
+                "liczba_upadlosci": pd.to_numeric(krz.loc[valid, "liczba_upadlosci"], errors="coerce"),
+            }
+        )
+        .dropna(subset=["rok"])
+        .pivot_table(index="pkd", columns="rok", values="liczba_upadlosci", aggfunc="sum")
+    )
+    remapped, _ = crosswalk.remap_frame(counts, how="sum")
+    long = remapped.stack().rename("liczba_upadlosci").reset_index()
+    long = long[long["liczba_upadlosci"] > 0]
+    return long[["rok", "pkd", "liczba_upadlosci"]].astype({"rok": int}).sort_values(["rok", "pkd"])
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Remap GS/NWC sheets and KRZ bankruptcies between PKD 2007 and PKD 2025."
+    )
+    parser.add_argument(
+        "--direction",
+        choices=DIRECTIONS,
+        default="2007_2025",
+        help="Source and target classification.",
+    )
+    parser.add_argument(
+        "--output-dir",
+        type=Path,
+        default=OUTPUT_DIR,
+        help="Directory where the remapped CSVs are saved.",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    crosswalk = load_crosswalk(args.direction)
+    print(crosswalk)
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+
+    for name, path in (("GS", GS_PATH), ("NWC", NWC_PATH)):
+        values, coverage = remap_indicator_sheet(read_excel(path), crosswalk)
+        values.to_csv(args.output_dir / f"{name}_{args.direction}.csv", index=False)
+        coverage.to_csv(args.output_dir / f"{name}_{args.direction}_coverage.csv", index=False)
+        print(f"{name}: {len(values)} codes remapped")
+
+    krz = remap_krz(read_csv(KRZ_PKD_PATH, sep=";"), crosswalk)
+    krz.to_csv(args.output_dir / f"krz_pkd_{args.direction}.csv", sep=";", index=False)
+    print(f"KRZ: {len(krz)} (year, code) rows remapped")
+    print(f"Saved remapped tables to: {args.output_dir.resolve()}")
+
+
+if __name__ == "__main__":
+    main()
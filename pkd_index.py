@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+from bisect import bisect_left
+from collections.abc import Iterable
+
+import numpy as np
+import pandas as pd
+
+
+# Sorts after every character that can appear in a PKD code, so
+# [prefix, prefix + _PREFIX_END) spans exactly the keys starting with prefix.
+_PREFIX_END = "\U0010ffff"
+
+
+def normalize_code(code) -> str:
+    """Normalize a PKD code cell to the string form used for lookups."""
+    return str(code).strip()
+
+
+class PKDIndex:
+    """
+    Sorted-key index over the PKD codes of one table.
+
+    Built once per table; exact lookups are O(1) and prefix lookups are a
+    binary search over the sorted codes (O(log n + k) for k matching rows).
+    All returned positions are row positions in the original table.
+    """
+
+    def __init__(self, codes: Iterable) -> None:
+        keys = np.array([normalize_code(c) for c in codes], dtype=object)
+        self._order = np.argsort(keys, kind="stable")
+        self._sorted = keys[self._order].tolist()
+        self._first: dict[str, int] = {}
+        for pos, key in enumerate(keys.tolist()):
+            self._first.setdefault(key, pos)
+
+    def __len__(self) -> int:
+        return len(self._sorted)
+
+    def exact(self, code) -> int | None:
+        """Position of the first row whose code equals `code`."""
+        return self._first.get(normalize_code(code))
+
+    def prefix_range(self, prefix: str) -> tuple[int, int]:
+        """Half-open range in sorted order of the codes starting with `prefix`."""
+        lo = bisect_left(self._sorted, prefix)
+        hi = bisect_left(self._sorted, prefix + _PREFIX_END, lo)
+        return lo, hi
+
+    def prefix_rows(self, prefix: str) -> np.ndarray:
+        """Row positions (table order) of every code starting with `prefix`."""
+        lo, hi = self.prefix_range(prefix)
+        return np.sort(self._order[lo:hi])
+
+    def most_specific(self, code) -> int | None:
+        """
+        Row for `code`: the exact match if present, otherwise the first row
+        (in table order) of its sub-codes, i.e. codes starting with '<code>.'.
+        """
+        code = normalize_code(code)
+        pos = self._first.get(code)
+        if pos is not None:
+            return pos
+        lo, hi = self.prefix_range(f"{code}.")
+        if lo == hi:
+            return None
+        return int(self._order[lo:hi].min())
+
+    def prefix_sums(self, values) -> "PrefixSums":
+        """Prefix aggregator over a (rows x columns) value matrix aligned to this index."""
+        return PrefixSums(self, values)
+
+
+class PrefixSums:
+    """
+    Cumulative sums of a value matrix in sorted-code order, so the total over
+    all rows whose code starts with a given prefix is a binary search plus
+    one subtraction.
+    """
+
+    def __init__(self, index: PKDIndex, values) -> None:
+        values = np.asarray(values)
+        if values.ndim == 1:
+            values = values[:, None]
+        if values.shape[0] != len(index):
+            raise ValueError(
+                f"Value matrix has {values.shape[0]} rows; index has {len(index)} codes."
+            )
+        sorted_values = values[index._order]
+        self._index = index
+        self._cum = np.vstack(
+            [np.zeros((1, values.shape[1]), dtype=sorted_values.dtype),
+             np.cumsum(sorted_values, axis=0)]
+        )
+
+    def total(self, prefix: str) -> np.ndarray:
+        """Column totals over every row whose code starts with `prefix`."""
+        lo, hi = self._index.prefix_range(normalize_code(prefix))
+        return self._cum[hi] - self._cum[lo]
+
+
+def index_for(df: pd.DataFrame, label_col: str) -> PKDIndex:
+    """Build a `PKDIndex` over one code column of a table."""
+    return PKDIndex(df[label_col].tolist())
@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+import argparse
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from data_cache import read_csv, read_excel
+from krz_cube import canonical_code
+
+
+BASE_DIR = Path(__file__).parent
+CODE_COL = "numer PKD"
+NAME_COL = "nazwa PKD"
+LABEL_COL = "numer i nazwa PKD"
+INDICATOR_COL = "wskaźnik"
+TEXT_COLS = (CODE_COL, NAME_COL, LABEL_COL, INDICATOR_COL)
+# GUS sheets publish values to two decimals; float32 is only used where it
+# still reproduces them to that precision.
+DEFAULT_DECIMALS = 2
+# Text columns with at most this share of distinct values become categorical.
+CATEGORY_MAX_RATIO = 0.5
+
+SOURCES = {
+    "wsk_fin": (BASE_DIR / "data" / "wsk_fin.xlsx", "excel", {}),
+    "GS_filtered": (BASE_DIR / "data" / "GS_filtered.xlsx", "excel", {}),
+    "NWC_filtered": (BASE_DIR / "data" / "NWC_filtered.xlsx", "excel", {}),
+    "wskazniki_full": (BASE_DIR / "data" / "wskazniki_full.csv", "csv", {"sep": ";"}),
+}
+
+
+def memory_mb(df: pd.DataFrame) -> float:
+    """Deep memory footprint of a frame in MB (object cells included)."""
+    return df.memory_usage(deep=True).sum() / 1024 / 1024
+
+
+def _float32_safe(values: np.ndarray, decimals: int | None) -> bool:
+    """True if float32 keeps every value within half a unit of `decimals`."""
+    finite = values[np.isfinite(values)]
+    if not len(finite):
+        return True
+    with np.errstate(over="ignore"):
+        narrowed = finite.astype(np.float32)
+    if not np.isfinite(narrowed).all():
+        return False
+    if decimals is None:
+        return True
+    return bool(np.all(np.abs(narrowed.astype(np.float64) - finite) <= 0.5 * 10.0**-decimals))
+
+
+def downcast_numeric(series: pd.Series, decimals: int | None = DEFAULT_DECIMALS) -> pd.Series:
+    """
+    Narrowest safe dtype for a numeric (or numbers-plus-'bd') column:
+    int32 for whole numbers without gaps, float32 where it keeps the
+    published precision (any value with `decimals=None`), else float64.
+    Non-numeric markers such as 'bd' become NaN.
+    """
+    values = pd.to_numeric(series, errors="coerce").to_numpy(dtype=np.float64)
+    finite = np.isfinite(values)
+    if (
+        finite.all()
+        and len(values)
+        and np.array_equal(values, np.round(values))
+        and np.abs(values).max() <= np.iinfo(np.int32).max
+    ):
+        return pd.Series(values.astype(np.int32), index=series.index, name=series.name)
+    dtype = np.float32 if _float32_safe(values, decimals) else np.float64
+    return pd.Series(values.astype(dtype), index=series.index, name=series.name)
+
+
+def _is_numeric_like(series: pd.Series) -> bool:
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return True
+    if series.dtype != object:
+        return False
+    numeric = pd.to_numeric(series, errors="coerce")
+    text = series[numeric.isna() & series.notna()]
+    # numbers with a few markers ('bd', '-') but not free text
+    return numeric.notna().any() and text.astype(str).str.len().le(3).all()
+
+
+def compact_frame(
+    df: pd.DataFrame,
+    decimals: int | None = DEFAULT_DECIMALS,
+    text_cols=TEXT_COLS,
+) -> pd.DataFrame:
+    """
+    Same columns and rows, smaller dtypes: PKD code/name/indicator columns
+    (and other repetitive text) become categoricals, whose categories hold
+    each distinct string once; numeric and numbers-plus-'bd' columns are
+    downcast with `downcast_numeric`. Lookups by value keep working.
+    """
+    out = {}
+    for label in df.columns:
+        series = df[label]
+        if label in text_cols or not _is_numeric_like(series):
+            if series.nunique(dropna=True) <= max(1, CATEGORY_MAX_RATIO * len(series)):
+                out[label] = series.map(lambda v: v if pd.isna(v) else str(v)).astype("category")
+            else:
+                out[label] = series
+        else:
+            out[label] = downcast_numeric(series, decimals)
+    return pd.DataFrame(out, index=df.index)
+
+
+@dataclass
+class PKDTable:
+    """
+    An indicator sheet split into a dictionary of PKD codes (one row per
+    code with its name, label and hierarchy level, indexed by an int32
+    `pkd_id`) and a compact value frame that refers to it by id.
+    """
+
+    codes: pd.DataFrame
+    values: pd.DataFrame
+
+    @classmethod
+    def from_sheet(cls, df: pd.DataFrame, decimals: int | None = DEFAULT_DECIMALS) -> PKDTable:
+        raw_codes = df[CODE_COL].map(lambda v: str(v).strip())
+        _, first = np.unique(raw_codes.to_numpy(dtype=str), return_index=True)
+        order = np.sort(first)  # keep sheet order
+        code_list = raw_codes.iloc[order].tolist()
+        codes = pd.DataFrame(
+            {
+                "code": code_list,
+                "name": df[NAME_COL].iloc[order].tolist() if NAME_COL in df else None,
+                "label": df[LABEL_COL].iloc[order].tolist() if LABEL_COL in df else None,
+                "level": pd.Categorical(
+                    [(canonical_code(c) or (None,))[0] for c in code_list],
+                    categories=("section", "division", "group", "class", "subclass"),
+                ),
+            },
+            index=pd.RangeIndex(len(code_list), name="pkd_id"),
+        )
+        ids = pd.Index(code_list).get_indexer(raw_codes).astype(np.int32)
+        rest = df.drop(columns=[c for c in (CODE_COL, NAME_COL, LABEL_COL) if c in df.columns])
+        values = compact_frame(rest, decimals)
+        values.insert(0, "pkd_id", ids)
+        return cls(codes, values)
+
+    def __repr__(self) -> str:
+        return f"PKDTable({len(self.codes)} codes, {len(self.values)} rows, {self.memory_mb():.2f} MB)"
+
+    def memory_mb(self) -> float:
+        return memory_mb(self.codes) + memory_mb(self.values)
+
+    def ids(self, codes) -> np.ndarray:
+        """pkd_id of each code (-1 where unknown)."""
+        return pd.Index(self.codes["code"]).get_indexer([str(c).strip() for c in codes])
+
+    def to_frame(self) -> pd.DataFrame:
+        """The sheet in its original layout, with categorical text columns."""
+        ids = self.values["pkd_id"].to_numpy()
+        front = {
+            CODE_COL: pd.Categorical.from_codes(ids, self.codes["code"]),
+        }
+        for col, field in ((NAME_COL, "name"), (LABEL_COL, "label")):
+            if self.codes[field].notna().any():
+                # Names repeat across levels (section vs. division), so not a 1:1 lookup.
+                front[col] = pd.Categorical(self.codes[field].to_numpy(dtype=object)[ids])
+        front = pd.DataFrame(front, index=self.values.index)
+        return pd.concat([front, self.values.drop(columns="pkd_id")], axis=1)
+
+
+def read_compact_excel(path: Path, decimals: int | None = DEFAULT_DECIMALS, **kwargs) -> pd.DataFrame:
+    """`read_excel` through the snapshot cache, then `compact_frame`."""
+    return compact_frame(read_excel(path, **kwargs), decimals)
+
+
+def memory_report(name: str, before: pd.DataFrame, after) -> dict:
+    """Footprint before/after compaction; `after` is a frame or a PKDTable."""
+    before_mb = memory_mb(before)
+    after_mb = after.memory_mb() if isinstance(after, PKDTable) else memory_mb(after)
+    return {
+        "source": name,
+        "rows": len(before),
+        "cols": before.shape[1],
+        "before_mb": round(before_mb, 3),
+        "after_mb": round(after_mb, 3),
+        "ratio": round(before_mb / after_mb, 2) if after_mb else float("inf"),
+    }
+
+
+def _load_source(path: Path, reader: str, options: dict) -> pd.DataFrame:
+    return read_excel(path, **options) if reader == "excel" else read_csv(path, **options)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Report the memory saved by the compact PKD schema on the source tables."
+    )
+    parser.add_argument(
+        "sources",
+        nargs="*",
+        metavar="SOURCE",
+        help=f"Tables to report on: {', '.join(sorted(SOURCES))} (default: all).",
+    )
+    parser.add_argument(
+        "--decimals",
+        type=int,
+        default=DEFAULT_DECIMALS,
+        help="Precision float32 must preserve; -1 allows float32 everywhere.",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    decimals = None if args.decimals < 0 else args.decimals
+    unknown = sorted(set(args.sources) - set(SOURCES))
+    if unknown:
+        raise SystemExit(f"Unknown source(s) {unknown}; expected {sorted(SOURCES)}.")
+    rows = []
+    for name in args.sources or sorted(SOURCES):
+        path, reader, options = SOURCES[name]
+        raw = _load_source(path, reader, options)
+        if CODE_COL in raw.columns:
+            compact = PKDTable.from_sheet(raw, decimals)
+        else:
+            compact = compact_frame(raw, decimals)
+        rows.append(memory_report(name, raw, compact))
+    print(pd.DataFrame(rows).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
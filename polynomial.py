@@ -1,14 +1,16 @@
 from __future__ import annotations
 
 import argparse
+from dataclasses import dataclass
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
-from sklearn.pipeline import Pipeline, make_pipeline
-from sklearn.preprocessing import PolynomialFeatures
-from sklearn.linear_model import LinearRegression
-from scipy import stats
+from scipy import special
+
+from data_cache import read_excel
+from instrumentation import add_arguments, instrumented, stage
+from model_registry import ModelRegistry, fingerprint
 
 
 pd.set_option("display.float_format", lambda v: f"{v:0.3f}")
@@ -23,7 +25,7 @@ def load_and_prepare(
 
     Handles 'year', 'rok', or a numeric first column as the year.
     """
-    df_raw = pd.read_excel(data_path, sheet_name=sheet_name)
+    df_raw = read_excel(data_path, sheet_name=sheet_name)
 
     possible_year_cols = ["year", "rok"]
     year_col = next((c for c in possible_year_cols if c in df_raw.columns), None)
@@ -53,100 +55,300 @@ def load_and_prepare(
     return df
 
 
+# Search settings for the batched Box–Cox MLE: a coarse grid that widens for
+# columns whose optimum lies on its edge, then golden-section refinement.
+_BC_GRID_HALF_WIDTH = 8.0
+_BC_GRID_POINTS = 65
+_BC_MAX_HALF_WIDTH = 1024.0
+_BC_REFINE_ITERATIONS = 80
+_GOLDEN = (np.sqrt(5.0) - 1.0) / 2.0
+
+
+def _box_cox_llf(log_y: np.ndarray, lmb: np.ndarray) -> np.ndarray:
+    """
+    Box–Cox profile log-likelihood of every column at its own lambda.
+
+    `log_y` is (n_obs, n_targets); `lmb` broadcasts against (..., n_targets),
+    so a (k, 1, n_targets) array evaluates a k-point grid in one pass.
+    Missing observations are ignored. Mirrors `scipy.stats.boxcox_llf`,
+    with the variance taken in a max-shifted space to avoid overflow.
+    """
+    lmb = np.asarray(lmb, dtype=float)
+    if lmb.ndim:
+        lmb = lmb[..., None, :]
+    n_obs = np.sum(~np.isnan(log_y), axis=0)
+    z = lmb * log_y
+    shift = np.nanmax(z, axis=-2, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        log_var = (
+            2 * shift[..., 0, :]
+            + np.log(np.nanvar(np.exp(z - shift), axis=-2))
+            - 2 * np.log(np.abs(lmb[..., 0, :]))
+        )
+    log_var = np.where(lmb[..., 0, :] == 0, np.log(np.nanvar(log_y, axis=0)), log_var)
+    return (lmb[..., 0, :] - 1) * np.nansum(log_y, axis=0) - n_obs / 2 * log_var
+
+
+def _box_cox_lambdas(y: np.ndarray) -> np.ndarray:
+    """Maximum-likelihood Box–Cox lambda for every column of a positive matrix."""
+    log_y = np.log(y)
+    n_targets = y.shape[1]
+    lo = np.zeros(n_targets)
+    hi = np.zeros(n_targets)
+    pending = np.ones(n_targets, dtype=bool)
+    half_width = _BC_GRID_HALF_WIDTH
+    while pending.any():
+        grid = np.linspace(-half_width, half_width, _BC_GRID_POINTS)
+        step = grid[1] - grid[0]
+        llf = _box_cox_llf(log_y[:, pending], np.repeat(grid[:, None], pending.sum(), axis=1))
+        best = np.nanargmax(np.where(np.isnan(llf), -np.inf, llf), axis=0)
+        on_edge = (best == 0) | (best == _BC_GRID_POINTS - 1)
+        resolved = ~on_edge | (half_width >= _BC_MAX_HALF_WIDTH)
+        idx = np.flatnonzero(pending)[resolved]
+        lo[idx] = grid[best[resolved]] - step
+        hi[idx] = grid[best[resolved]] + step
+        pending[idx] = False
+        half_width *= 8
+
+    # Golden-section search on [lo, hi] for all columns at once.
+    c = hi - _GOLDEN * (hi - lo)
+    d = lo + _GOLDEN * (hi - lo)
+    fc = _box_cox_llf(log_y, c)
+    fd = _box_cox_llf(log_y, d)
+    for _ in range(_BC_REFINE_ITERATIONS):
+        keep_left = fc > fd
+        hi = np.where(keep_left, d, hi)
+        lo = np.where(keep_left, lo, c)
+        # the surviving interior point is reused; only one new point per column
+        new_point = np.where(keep_left, hi - _GOLDEN * (hi - lo), lo + _GOLDEN * (hi - lo))
+        f_new = _box_cox_llf(log_y, new_point)
+        c, d = np.where(keep_left, new_point, d), np.where(keep_left, c, new_point)
+        fc, fd = np.where(keep_left, f_new, fd), np.where(keep_left, fc, f_new)
+    return (lo + hi) / 2
+
+
 def _box_cox_transform(
     y: pd.DataFrame,
-) -> tuple[pd.DataFrame, dict[str, float | None], dict[str, float]]:
+) -> tuple[pd.DataFrame, pd.Series, pd.Series]:
     """
-    Apply Box–Cox column-wise. Constant columns are kept as zeros and flagged
-    so we can invert them back to their constant value later.
+    Apply Box–Cox to all columns at once. Constant columns are masked out:
+    they transform to zeros, get a NaN lambda and keep their constant value
+    so the inverse can restore it.
     """
-    transformed = {}
-    lambdas: dict[str, float | None] = {}
-    constants: dict[str, float] = {}
-
-    for col in y.columns:
-        series = y[col]
-        if series.nunique() <= 1:
-            lambdas[col] = None
-            constants[col] = float(series.iloc[0])
-            transformed[col] = np.zeros(len(series))
-            continue
+    values = y.to_numpy(dtype=float)
+    with np.errstate(invalid="ignore"):
+        constant = ~(np.nanmax(values, axis=0, initial=-np.inf) > np.nanmin(values, axis=0, initial=np.inf))
+
+    lambdas = np.full(values.shape[1], np.nan)
+    if (~constant).any():
+        lambdas[~constant] = _box_cox_lambdas(values[:, ~constant])
+    transformed = _box_cox_values(values, lambdas)
+
+    first_row = values[0] if len(values) else np.full(values.shape[1], np.nan)
+    constants = np.where(constant, first_row, np.nan)
+    return (
+        pd.DataFrame(transformed, index=y.index, columns=y.columns),
+        pd.Series(lambdas, index=y.columns),
+        pd.Series(constants, index=y.columns),
+    )
 
-        bc_vals, lam = stats.boxcox(series.to_numpy())
-        lambdas[col] = float(lam)
-        transformed[col] = bc_vals
 
-    return pd.DataFrame(transformed, index=y.index), lambdas, constants
+def _box_cox_values(values: np.ndarray, lambdas: np.ndarray) -> np.ndarray:
+    """Box–Cox of every column at its given lambda; NaN lambdas (constant columns) give zeros."""
+    fitted = ~np.isnan(lambdas)
+    transformed = np.zeros_like(values)
+    transformed[:, fitted] = special.boxcox(values[:, fitted], lambdas[fitted])
+    return transformed
 
 
 def _box_cox_inverse(
     y_bc: pd.DataFrame,
-    lambdas: dict[str, float | None],
-    constants: dict[str, float],
+    lambdas: pd.Series,
+    constants: pd.Series,
 ) -> pd.DataFrame:
-    """Invert a column-wise Box–Cox transform."""
-    inverted = {}
-    for col in y_bc.columns:
-        lam = lambdas[col]
-        if lam is None:
-            inverted[col] = np.full(len(y_bc), constants[col])
-        else:
-            vals = y_bc[col].to_numpy()
-            # Ensure we stay in the valid inverse domain: lambda * y + 1 > 0
-            z = lam * vals + 1
-            z = np.maximum(z, 1e-9)
-            if np.isclose(lam, 0.0):
-                inverted[col] = np.exp(vals)
-            else:
-                inverted[col] = np.power(z, 1.0 / lam)
-    return pd.DataFrame(inverted, index=y_bc.index)
+    """Invert a batched Box–Cox transform; NaN lambdas mark constant columns."""
+    inverted = _box_cox_inverse_values(
+        y_bc.to_numpy(dtype=float),
+        lambdas.reindex(y_bc.columns).to_numpy(dtype=float),
+        constants.reindex(y_bc.columns).to_numpy(dtype=float),
+    )
+    return pd.DataFrame(inverted, index=y_bc.index, columns=y_bc.columns)
+
+
+def _box_cox_inverse_values(vals: np.ndarray, lam: np.ndarray, constants: np.ndarray) -> np.ndarray:
+    """
+    Array form of `_box_cox_inverse`; targets on the last axis of `vals`.
+
+    Values past the inverse's domain (`lambda * y + 1 <= 0`) are not
+    clamped: with a negative lambda they lie beyond the pole and give +inf,
+    with a positive one they have no preimage and give NaN.
+    """
+    constant = np.isnan(lam)
+    near_zero = np.isclose(lam, 0.0)
+    safe_lam = np.where(near_zero | constant, 1.0, lam)
+    z = safe_lam * vals + 1
+    with np.errstate(over="ignore", divide="ignore", invalid="ignore"):
+        inverted = np.where(near_zero, np.exp(vals), np.power(np.maximum(z, 0.0), 1.0 / safe_lam))
+    inverted = np.where((z <= 0) & ~near_zero & (safe_lam > 0), np.nan, inverted)
+    return np.where(constant, constants, inverted)
+
+
+@dataclass
+class PolynomialTrend:
+    """
+    Polynomial in the year shared by every target, fitted by least squares.
+
+    The year is centered and scaled before building the Vandermonde matrix,
+    which keeps high powers well conditioned. Because the design matrix is
+    the same for all targets it is factorized once (QR) and solved against
+    the whole target matrix; `coef` holds one column per target, constant
+    term first.
+    """
+
+    degree: int
+    year_center: float
+    year_scale: float
+    coef: np.ndarray
+    degrees: np.ndarray | None = None
+
+    def __post_init__(self) -> None:
+        # Per-target degree; `refit` lowers it for single targets.
+        if self.degrees is None:
+            self.degrees = np.full(self.coef.shape[1], self.degree)
+
+    def design(self, years) -> np.ndarray:
+        scaled = (np.asarray(years, dtype=float) - self.year_center) / self.year_scale
+        return np.vander(scaled, self.degree + 1, increasing=True)
+
+    @classmethod
+    def fit(cls, years, y, degree: int) -> PolynomialTrend:
+        years = np.asarray(years, dtype=float)
+        if len(np.unique(years)) <= degree:
+            raise ValueError(
+                f"Need more than {degree} distinct years to fit a degree-{degree} "
+                f"polynomial; got {len(np.unique(years))}."
+            )
+        scale = years.std() or 1.0
+        trend = cls(degree, years.mean(), scale, np.empty((degree + 1, 0)))
+        q, r = np.linalg.qr(trend.design(years))
+        trend.coef = np.linalg.solve(r, q.T @ np.asarray(y, dtype=float))
+        trend.degrees = np.full(trend.coef.shape[1], degree)
+        return trend
+
+    def refit(self, years, y, columns: np.ndarray, degree: int) -> None:
+        """
+        Refit the targets at `columns` with a lower-degree polynomial in the
+        same scaled basis; their higher coefficients become zero, so
+        `predict` stays one matrix product.
+        """
+        q, r = np.linalg.qr(self.design(years)[:, : degree + 1])
+        self.coef[:, columns] = 0.0
+        self.coef[: degree + 1, columns] = np.linalg.solve(r, q.T @ np.asarray(y, dtype=float)[:, columns])
+        self.degrees[columns] = degree
+
+    def predict(self, years) -> np.ndarray:
+        """Predictions shaped (len(years), n_targets) as one matrix product."""
+        return self.design(years) @ self.coef
+
+
+def _implausible(pred: np.ndarray, y_train: pd.DataFrame, lambdas: pd.Series) -> np.ndarray:
+    """
+    Targets with a forecast past the Box–Cox domain (inf/NaN) or more than
+    their observed range beyond the training values. Constant targets are
+    never flagged.
+    """
+    low = y_train.min().to_numpy(dtype=float)
+    high = y_train.max().to_numpy(dtype=float)
+    span = high - low
+    with np.errstate(invalid="ignore"):
+        inside = np.isfinite(pred) & (pred >= low - span) & (pred <= high + span)
+    return ~inside.all(axis=0) & lambdas.notna().to_numpy()
 
 
 def fit_polynomial_model(
     df: pd.DataFrame,
     train_start_year: int = 2012,
     degree: int = 3,
-) -> tuple[Pipeline, dict[str, float | None], dict[str, float], pd.Series]:
+    verbose: bool = True,
+    extrapolate_to=None,
+) -> tuple[PolynomialTrend, pd.Series, pd.Series, pd.Series]:
     """
     Fit a polynomial regression model with Box–Cox-transformed targets.
+
+    With `extrapolate_to` years, targets whose forecast for them is
+    implausible (see `_implausible`) are refitted one degree lower at a
+    time, down to a constant; `poly_reg.degrees` records the result.
     Returns:
         poly_reg, lambdas, constants, target_offsets
     """
     train = df[df["year"] >= train_start_year].copy()
 
-    X_train = train[["year"]]
     y_train = train.drop(columns=["year"]).apply(pd.to_numeric, errors="coerce")
 
-    print(
-        f"Training rows: {train.shape[0]} from {train_start_year}+, "
-        f"Targets: {y_train.shape[1]} features."
-    )
+    if verbose:
+        print(
+            f"Training rows: {train.shape[0]} from {train_start_year}+, "
+            f"Targets: {y_train.shape[1]} features."
+        )
 
     # Box–Cox requires positive values; shift each target up if needed
-    target_offsets = y_train.min().apply(lambda v: 1 - v if v <= 0 else 0.0)
+    target_mins = y_train.min()
+    target_offsets = (1 - target_mins).where(target_mins <= 0, 0.0)
     y_train_positive = y_train + target_offsets
 
-    y_train_bc, lambdas, constants = _box_cox_transform(y_train_positive)
+    with stage("boxcox") as st:
+        st.shape(y_train_positive)
+        y_train_bc, lambdas, constants = _box_cox_transform(y_train_positive)
+
+    with stage("fit"):
+        poly_reg = PolynomialTrend.fit(train["year"], y_train_bc, degree=degree)
+        if extrapolate_to is not None:
+            for lower in range(degree - 1, -1, -1):
+                pred = predict_targets(poly_reg, lambdas, constants, target_offsets, extrapolate_to)
+                implausible = _implausible(pred.to_numpy(), y_train, lambdas)
+                if not implausible.any():
+                    break
+                poly_reg.refit(train["year"], y_train_bc, np.flatnonzero(implausible), lower)
+    if verbose:
+        print(
+            f"Model fitted with degree={degree} polynomial and "
+            "Box–Cox-transformed targets."
+        )
+        lowered = poly_reg.degrees < degree
+        if lowered.any():
+            names = ", ".join(
+                f"{target} ({d})" for target, d in zip(y_train.columns[lowered], poly_reg.degrees[lowered])
+            )
+            print(
+                f"[WARN] {int(lowered.sum())} targets extrapolate implausibly at degree {degree}; "
+                f"refitted at lower degrees: {names}"
+            )
 
-    poly_reg = make_pipeline(
-        PolynomialFeatures(degree=degree, include_bias=False),
-        LinearRegression(),
-    )
+    return poly_reg, lambdas, constants, target_offsets
 
-    poly_reg.fit(X_train, y_train_bc)
-    print(
-        f"Model fitted with degree={degree} polynomial and "
-        "Box–Cox-transformed targets."
-    )
 
-    return poly_reg, lambdas, constants, target_offsets
+def predict_targets(
+    poly_reg: PolynomialTrend,
+    lambdas: pd.Series,
+    constants: pd.Series,
+    target_offsets: pd.Series,
+    years,
+) -> pd.DataFrame:
+    """Predictions on the original target scale for the given years."""
+    years = np.asarray(years)
+    pred_bc = pd.DataFrame(
+        poly_reg.predict(years),
+        columns=target_offsets.index,
+        index=years,
+    )
+    return _box_cox_inverse(pred_bc, lambdas, constants) - target_offsets
 
 
 def forecast_future(
     df: pd.DataFrame,
-    poly_reg,
-    lambdas: dict[str, float | None],
-    constants: dict[str, float],
+    poly_reg: PolynomialTrend,
+    lambdas: pd.Series,
+    constants: pd.Series,
     target_offsets: pd.Series,
     horizon: int = 3,
 ) -> pd.DataFrame:
@@ -155,17 +357,16 @@ def forecast_future(
     """
     last_year = int(df["year"].max())
     future_years = np.arange(last_year + 1, last_year + horizon + 1)
-    future_X = pd.DataFrame({"year": future_years})
-
-    future_pred_bc = pd.DataFrame(
-        poly_reg.predict(future_X),
-        columns=target_offsets.index,
-        index=future_years,
-    )
 
-    future_pred = (
-        _box_cox_inverse(future_pred_bc, lambdas, constants) - target_offsets
+    future_pred = predict_targets(
+        poly_reg, lambdas, constants, target_offsets, future_years
     )
+    beyond = future_pred.columns[(~np.isfinite(future_pred) & lambdas.notna()).any()]
+    if len(beyond):
+        print(
+            f"[WARN] Forecast past the Box–Cox domain (written as inf/NaN) for "
+            f"{len(beyond)} targets: {', '.join(beyond)}"
+        )
 
     print("Forecast for next years (head):")
     print(future_pred.head())
@@ -173,6 +374,253 @@ def forecast_future(
     return future_pred
 
 
+BOOTSTRAP_METHODS = ("residual", "pairs")
+DEFAULT_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+def _resample_counts(rng: np.random.Generator, draws: int, n_obs: int, min_distinct: int) -> np.ndarray:
+    """
+    (draws x n_obs) counts of how often each training year is drawn, with
+    at least `min_distinct` different years per draw so the batched
+    normal equations stay solvable.
+    """
+    counts = np.zeros((draws, n_obs))
+    pending = np.arange(draws)
+    while len(pending):
+        idx = rng.integers(0, n_obs, size=(len(pending), n_obs))
+        fresh = np.zeros((len(pending), n_obs))
+        np.add.at(fresh, (np.arange(len(pending))[:, None], idx), 1)
+        counts[pending] = fresh
+        pending = pending[(fresh > 0).sum(axis=1) < min_distinct]
+    return counts
+
+
+def quantile_column(target: str, q: float) -> str:
+    """'<target>_q05' style name of a bootstrap quantile column."""
+    return f"{target}_q{q * 100:02g}"
+
+
+def bootstrap_forecast(
+    df: pd.DataFrame,
+    train_start_year: int = 2012,
+    degree: int = 3,
+    horizon: int = 3,
+    draws: int = 1000,
+    method: str = "residual",
+    quantiles=DEFAULT_QUANTILES,
+    seed: int | None = 0,
+) -> pd.DataFrame:
+    """
+    Bootstrap prediction intervals for every target over the horizon.
+
+    The Box–Cox lambdas stay at their point estimates; resampling happens
+    on the transformed scale. `residual` adds resampled (leverage-adjusted)
+    residuals to the fitted values, `pairs` resamples whole years. Either
+    way the polynomial is refitted for all draws and targets as one
+    batched solve: a draw only reweights the rows of the shared design
+    matrix, so its coefficients are `solve(X' W X, X' W y)` with W the
+    resample counts, computed as (draws x p x p) and (draws x p x targets)
+    arrays. Forecast draws get a resampled residual added, are inverted
+    through Box–Cox in one call and reduced to quantiles.
+
+    The fit, the per-target degree fallback and the Box–Cox inverse are
+    those of the point forecast, so `<target>_q50` lies next to it. With a
+    negative lambda the inverse is unbounded above: draws past its pole
+    (lambda * y + 1 <= 0) count as +inf and a quantile landing among them
+    is reported as inf (NaN below the domain of a positive lambda).
+
+    Returns a frame indexed by year with one `<target>_q05` style column
+    per target and quantile (see `quantile_column`).
+    """
+    if method not in BOOTSTRAP_METHODS:
+        raise ValueError(f"Unknown bootstrap method '{method}'; expected one of {BOOTSTRAP_METHODS}.")
+    last_year = int(df["year"].max())
+    future_years = np.arange(last_year + 1, last_year + horizon + 1)
+    trend, lambdas, constants, target_offsets = fit_polynomial_model(
+        df, train_start_year=train_start_year, degree=degree, verbose=False, extrapolate_to=future_years
+    )
+    train = df[df["year"] >= train_start_year]
+    y_train = train.drop(columns=["year"]).apply(pd.to_numeric, errors="coerce")
+    lam = lambdas.to_numpy(dtype=float)
+    y = _box_cox_values((y_train + target_offsets).to_numpy(dtype=float), lam)
+
+    rng = np.random.default_rng(seed)
+    x = trend.design(train["year"])
+    n_obs, n_coef = x.shape
+    # Every target keeps the degree its point forecast settled on, so the
+    # batched refits below run once per degree on that degree's columns.
+    groups = [(d, trend.degrees == d) for d in np.unique(trend.degrees)]
+    # Residuals rescaled by 1/sqrt(1 - leverage) and centred, so their
+    # spread matches the errors rather than the shrunken in-sample fit.
+    resid = np.empty_like(y)
+    for d, cols in groups:
+        xd = x[:, : d + 1]
+        leverage = np.einsum("ij,ji->i", xd, np.linalg.pinv(xd))
+        fitted = xd @ trend.coef[: d + 1, cols]
+        resid[:, cols] = (y[:, cols] - fitted) / np.sqrt(np.clip(1 - leverage, 1e-12, None))[:, None]
+    resid -= resid.mean(axis=0)
+
+    coef = np.zeros((draws, n_coef, y.shape[1]))
+    if method == "residual":
+        # y* = fitted + resid[idx], and fitted is reproduced exactly, so only
+        # the projection of the resampled residuals moves the coefficients.
+        idx = rng.integers(0, n_obs, size=(draws, n_obs))
+        for d, cols in groups:
+            weights = np.zeros((draws, d + 1, n_obs))
+            pinv = np.linalg.pinv(x[:, : d + 1])
+            np.add.at(weights, (np.arange(draws)[:, None, None], np.arange(d + 1)[None, :, None], idx[:, None, :]), pinv[None])
+            coef[:, : d + 1, cols] = trend.coef[None, : d + 1, cols] + weights @ resid[:, cols]
+    else:
+        counts = _resample_counts(rng, draws, n_obs, n_coef)
+        for d, cols in groups:
+            xd = x[:, : d + 1]
+            xw = xd.T[None] * counts[:, None, :]
+            coef[:, : d + 1, cols] = np.linalg.solve(xw @ xd, xw @ y[:, cols])
+
+    noise = resid[rng.integers(0, n_obs, size=(draws, horizon))]
+    pred_bc = trend.design(future_years) @ coef + noise
+    pred = _box_cox_inverse_values(pred_bc, lam, constants.to_numpy()) - target_offsets.to_numpy()
+    # Same inverse as the point forecast: +inf past the pole of a negative
+    # lambda, NaN below the domain of a positive one.
+    above = np.isposinf(pred)
+    below = np.isnan(pred) & ~np.isnan(lam)
+
+    qs = np.asarray(quantiles, dtype=float)
+    with np.errstate(invalid="ignore"):
+        values = np.quantile(np.where(below, -np.inf, pred), qs, axis=0)  # (quantile, year, target)
+    # Interpolating next to an infinite draw gives NaN; a quantile whose
+    # upper neighbour is past the pole is inf, one whose lower neighbour
+    # is below the domain is NaN.
+    upper = np.ceil((draws - 1) * qs)[:, None, None]
+    lower = np.floor((draws - 1) * qs)[:, None, None]
+    values[upper >= draws - above.sum(axis=0)[None]] = np.inf
+    values[lower < below.sum(axis=0)[None]] = np.nan
+
+    shares = (above | below).mean(axis=0).max(axis=0)
+    if shares.any():
+        worst = y_train.columns[np.argmax(shares)]
+        print(
+            f"[WARN] {int((shares > 0).sum())} targets have draws beyond the Box–Cox range "
+            f"(up to {shares.max():.0%} for {worst}); their outer quantiles may be inf or NaN."
+        )
+
+    columns = [quantile_column(target, q) for q in qs for target in y_train.columns]
+    frame = pd.DataFrame(
+        values.transpose(1, 0, 2).reshape(len(future_years), -1),
+        index=pd.Index(future_years, name="year"),
+        columns=columns,
+    )
+    return frame[[quantile_column(target, q) for target in y_train.columns for q in qs]]
+
+
+def with_quantiles(forecast: pd.DataFrame, intervals: pd.DataFrame, quantiles) -> pd.DataFrame:
+    """Point forecast with each target's quantile columns right after it."""
+    columns = [
+        name
+        for target in forecast.columns
+        for name in (target, *(quantile_column(target, q) for q in quantiles))
+    ]
+    return pd.concat([forecast, intervals], axis=1)[columns]
+
+
+def _target_fingerprint(
+    df: pd.DataFrame,
+    target: str,
+    train_start_year: int,
+    degree: int,
+    horizon: int,
+) -> str:
+    """Fingerprint of one target's training slice and the model settings."""
+    train = df.loc[df["year"] >= train_start_year, ["year", target]]
+    settings = {
+        "train_start_year": train_start_year,
+        "degree": degree,
+        "horizon": horizon,
+        "last_year": int(df["year"].max()),
+        # entries from before the unclamped inverse and the degree fallback
+        "degree_fallback": True,
+    }
+    return fingerprint(train, settings)
+
+
+def forecast_incremental(
+    df: pd.DataFrame,
+    registry: ModelRegistry,
+    train_start_year: int = 2012,
+    degree: int = 3,
+    horizon: int = 3,
+    refit_all: bool = False,
+) -> pd.DataFrame:
+    """
+    Forecast every target, refitting only those whose training slice or
+    settings changed since they were stored in `registry`.
+
+    Targets are independent (own Box–Cox lambda, own polynomial column and
+    degree fallback), so fitting just the stale subset gives the same
+    forecasts as a full refit.
+    """
+    targets = [c for c in df.columns if c != "year"]
+    with stage("fingerprint", targets=len(targets)):
+        fingerprints = {
+            c: _target_fingerprint(df, c, train_start_year, degree, horizon) for c in targets
+        }
+    forecasts = {}
+    if not refit_all:
+        with stage("registry_load") as st:
+            beyond = []
+            for target in targets:
+                entry = registry.load(target, fingerprints[target])
+                if entry is not None:
+                    forecasts[target] = entry["forecast"]
+                    if pd.notna(entry["model"]["lambda"]) and not np.isfinite(entry["forecast"]).all():
+                        beyond.append(target)
+            st.count(hits=len(forecasts))
+        if beyond:
+            print(
+                f"[WARN] Cached forecast past the Box–Cox domain (inf/NaN) for "
+                f"{len(beyond)} targets: {', '.join(beyond)}"
+            )
+
+    stale = [c for c in targets if c not in forecasts]
+    print(f"Reusing {len(forecasts)} cached target models; refitting {len(stale)}.")
+    if stale:
+        subset = df[["year"] + stale]
+        last_year = int(df["year"].max())
+        poly_reg, lambdas, constants, target_offsets = fit_polynomial_model(
+            subset,
+            train_start_year=train_start_year,
+            degree=degree,
+            extrapolate_to=np.arange(last_year + 1, last_year + horizon + 1),
+        )
+        with stage("forecast", targets=len(stale), horizon=horizon):
+            future_pred = forecast_future(
+                subset,
+                poly_reg=poly_reg,
+                lambdas=lambdas,
+                constants=constants,
+                target_offsets=target_offsets,
+                horizon=horizon,
+            )
+        with stage("registry_save", targets=len(stale)):
+            for i, target in enumerate(stale):
+                # Plain values only, so entries written by the CLI (__main__) load anywhere.
+                model = {
+                    "degree": int(poly_reg.degrees[i]),
+                    "year_center": poly_reg.year_center,
+                    "year_scale": poly_reg.year_scale,
+                    "coef": poly_reg.coef[:, i],
+                    "lambda": lambdas[target],
+                    "constant": constants[target],
+                    "offset": target_offsets[target],
+                }
+                registry.save(
+                    target, fingerprints[target], model=model, forecast=future_pred[target]
+                )
+                forecasts[target] = future_pred[target]
+
+    return pd.DataFrame({c: forecasts[c] for c in targets})
+
+
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         description="Polynomial forecasting baseline for tabular time series."
@@ -207,36 +655,78 @@ def parse_args() -> argparse.Namespace:
         default=Path("data/polynomial_forecast_next3.csv"),
         help="Path where the forecast CSV will be saved.",
     )
+    parser.add_argument(
+        "--refit-all",
+        action="store_true",
+        help="Refit every target even if its inputs match the cached model.",
+    )
+    parser.add_argument(
+        "--bootstrap",
+        type=int,
+        default=0,
+        metavar="DRAWS",
+        help="Add bootstrap quantile columns (<target>_q05, ...) from this many draws (0 = off).",
+    )
+    parser.add_argument(
+        "--bootstrap-method",
+        choices=BOOTSTRAP_METHODS,
+        default="residual",
+        help="Resample residuals around the fit, or whole (year, values) pairs.",
+    )
+    parser.add_argument(
+        "--quantiles",
+        type=float,
+        nargs="+",
+        default=list(DEFAULT_QUANTILES),
+        help="Quantiles written for every target and forecast year.",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the bootstrap.")
+    add_arguments(parser)
     return parser.parse_args()
 
 
 def main() -> None:
     args = parse_args()
 
-    df = load_and_prepare(args.data_path, sheet_name=args.sheet_name)
-
-    poly_reg, lambdas, constants, target_offsets = fit_polynomial_model(
-        df,
-        train_start_year=args.train_start_year,
-        degree=2,
-    )
-
-    # Use the trained model to forecast future years
-    future_pred = forecast_future(
-        df,
-        poly_reg=poly_reg,
-        lambdas=lambdas,
-        constants=constants,
-        target_offsets=target_offsets,
-        horizon=args.horizon,
-    )
+    with instrumented("polynomial", args):
+        with stage("load") as st:
+            df = load_and_prepare(args.data_path, sheet_name=args.sheet_name)
+            st.shape(df)
+
+        # Only targets whose data changed since the last run are refitted
+        future_pred = forecast_incremental(
+            df,
+            ModelRegistry("polynomial"),
+            train_start_year=args.train_start_year,
+            degree=2,
+            horizon=args.horizon,
+            refit_all=args.refit_all,
+        )
 
-    # Persist forecasts
-    output_path = args.output_path
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    future_pred.to_csv(output_path, index_label="year")
+        if args.bootstrap:
+            with stage("bootstrap", draws=args.bootstrap, method=args.bootstrap_method) as st:
+                intervals = bootstrap_forecast(
+                    df,
+                    train_start_year=args.train_start_year,
+                    degree=2,
+                    horizon=args.horizon,
+                    draws=args.bootstrap,
+                    method=args.bootstrap_method,
+                    quantiles=args.quantiles,
+                    seed=args.seed,
+                )
+                st.shape(intervals)
+                future_pred = with_quantiles(future_pred, intervals, args.quantiles)
+
+        # Persist forecasts
+        output_path = args.output_path
+        with stage("write") as st:
+            st.shape(future_pred)
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            future_pred.to_csv(output_path, index_label="year")
     print(f"Saved forecast to: {output_path.resolve()}")
-
+    if args.bootstrap:
+        print(f"Included quantiles {args.quantiles} of {args.bootstrap} bootstrap draws per target.")
 
 if __name__ == "__main__":
     main()
@@ -1,8 +1,30 @@
+import argparse
+import gzip
+import hashlib
 import json
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 
+from data_cache import read_excel
+from instrumentation import add_arguments, instrumented, stage
+from krz_cube import load_cube
+from pkd_index import PKDIndex, index_for
+from pkd_schema import memory_mb, read_compact_excel
+from sector_scoring import (
+    DEFAULT_TIERS,
+    DEFAULT_WEIGHTS,
+    LAST_ACTUAL_YEAR,
+    normalize_per_year,
+    score_sectors,
+)
+
+try:
+    import brotli
+except ImportError:  # optional: only .gz variants are written without it
+    brotli = None
+
 
 YEARS = [2020, 2021, 2022, 2023, 2024, 2025, 2026, 2027]
 BASE_DIR = Path(__file__).parent
@@ -11,41 +33,74 @@ NWC_PATH = BASE_DIR / "data" / "NWC_filtered.xlsx"
 DEFAULTS_PATH = BASE_DIR / "data" / "krz_pkd.csv"
 EXPORT_PATH = BASE_DIR / "data" / "dane_export.xlsx"
 OUTPUT_PATH = BASE_DIR / "data" / "dashboard_data.json"
+SHARD_DIR = BASE_DIR / "data" / "dashboard"
+LU_PATH = BASE_DIR / "data" / "LICZBA UPADŁOŚCI %.csv"
 PKD_VARS = BASE_DIR / "pkd_to_variables.json"
-
-
-def load_series_for_codes(df: pd.DataFrame, codes, label_col: str):
-    """Return {pkd_code: {year: value}} using the most specific available row."""
-    data = {}
+WEIGHTS = DEFAULT_WEIGHTS
+TIERS = DEFAULT_TIERS
+# Per-year series every cross-sector chart needs; they go in the overview file, the rest in shards.
+OVERVIEW_FIELDS = ("score", "growth", "risk", "debt", "export")
+METRICS = [
+    {
+        "title": "Revenue momentum",
+        "detail": "Historical GS revenue plus polynomial projection for 2025-2027 to show run-rate growth.",
+    },
+    {
+        "title": "Default stress (KRZ)",
+        "detail": "Bankruptcy/insolvency observations per PKD, treated as a risk anchor for the outlook.",
+    },
+    {
+        "title": "Leverage & liquidity",
+        "detail": "Debt ratio and working-capital stretch to spot sectors with tightening cash positions.",
+    },
+    {
+        "title": "Export exposure",
+        "detail": "Share of exports inside revenues to capture FX sensitivity and external demand.",
+    },
+    {
+        "title": "Macro & commodity drivers",
+        "detail": "Mapped per pkd_to_variables.json (FX pairs, energy, agri/metal inputs, rates, wages).",
+    },
+]
+
+
+def load_series_frame(df: pd.DataFrame, codes, label_col: str, index: PKDIndex | None = None):
+    """Return a codes x YEARS frame using the most specific available row per code."""
+    index = index or index_for(df, label_col)
+    rows = {}
     for code in codes:
-        matches = df[df[label_col].astype(str) == code]
-        if matches.empty:
-            # try startswith fallback (aggregate)
-            matches = df[df[label_col].astype(str).str.startswith(f"{code}.")]
-        if matches.empty:
-            continue
-        row = matches.iloc[0]
-        data[code] = {}
-        for year in YEARS:
-            value = row.get(year, 0)
-            value = pd.to_numeric(value, errors="coerce")
-            data[code][year] = float(value) if pd.notnull(value) else 0.0
-    return data
+        pos = index.most_specific(code)
+        if pos is not None:
+            rows[code] = pos
+    values = (
+        df.iloc[list(rows.values())]
+        .reindex(columns=YEARS)
+        .apply(pd.to_numeric, errors="coerce")
+        .fillna(0.0)
+        .astype(float)
+    )
+    values.index = list(rows)
+    return values
+
+
+def load_series_for_codes(df: pd.DataFrame, codes, label_col: str, index: PKDIndex | None = None):
+    """Return {pkd_code: {year: value}} using the most specific available row."""
+    frame = load_series_frame(df, codes, label_col, index=index)
+    return {code: dict(zip(YEARS, map(float, row))) for code, row in zip(frame.index, frame.to_numpy())}
 
 
-def load_names(df: pd.DataFrame, codes):
+def load_names(df: pd.DataFrame, codes, index: PKDIndex | None = None):
+    index = index or index_for(df, "numer PKD")
     names = {}
     for code in codes:
-        matches = df[df["numer PKD"].astype(str) == code]
-        if matches.empty:
-            matches = df[df["numer PKD"].astype(str).str.startswith(f"{code}.")]
-        if not matches.empty:
-            names[code] = matches.iloc[0]["nazwa PKD"]
+        pos = index.most_specific(code)
+        if pos is not None:
+            names[code] = df["nazwa PKD"].iloc[pos]
     return names
 
 
 def load_exports():
-    df = pd.read_excel(EXPORT_PATH)
+    df = read_excel(EXPORT_PATH)
     total = float(df.loc[df["Unnamed: 0"] == "OGÓŁEM", 2024].squeeze())
     exports = {}
     for _, row in df.iterrows():
@@ -60,170 +115,193 @@ def load_exports():
     return exports
 
 
+def load_defaults_frame(codes):
+    """Return a codes x YEARS frame of bankruptcies under each PKD code (any level)."""
+    return load_cube(krz_path=DEFAULTS_PATH).frame(codes, YEARS)
+
+
 def load_defaults(codes):
-    df = pd.read_csv(DEFAULTS_PATH, sep=";")
-    df = df[df["pkd"].astype(str).str.len() > 0]
-    df["section"] = df["pkd"].astype(str).str[0]
-    df = df[df["rok"].isin(YEARS)]
-    defaults = {}
-    for code in codes:
-        # match full pkd prefix
-        mask = df["pkd"].astype(str).str.startswith(code)
-        slice_df = df[mask]
-        series = {year: 0 for year in YEARS}
-        for _, row in slice_df.iterrows():
-            series[row["rok"]] += int(row["liczba_upadlosci"])
-        defaults[code] = series
-    return defaults
+    frame = load_defaults_frame(codes)
+    return {code: dict(zip(YEARS, map(int, row))) for code, row in zip(frame.index, frame.to_numpy())}
 
 
 def normalize_series(series_dict):
     """Normalize values per year across sectors to 0-1."""
-    result = {}
-    for year in YEARS:
-        values = [vals[year] for vals in series_dict.values()]
-        min_v, max_v = min(values), max(values)
-        span = max(max_v - min_v, 1e-9)
-        for key, vals in series_dict.items():
-            result.setdefault(key, {})[year] = (vals[year] - min_v) / span
-    return result
-
-
-def project_revenue(rev_series):
-    # Extend revenue to 2027 using recent CAGR or last growth
-    available_years = [y for y in YEARS if y in rev_series and rev_series[y] != 0 and y <= 2024]
-    if not available_years:
-        return rev_series
-    last_year = max(available_years)
-    last_value = rev_series[last_year]
-    cagr = 0.02
-    if last_year >= 2022 and rev_series.get(last_year - 2, 0):
-        cagr = (rev_series[last_year] / rev_series[last_year - 2]) ** (1 / 2) - 1
-    elif last_year >= 2021 and rev_series.get(last_year - 1, 0):
-        cagr = (rev_series[last_year] / rev_series[last_year - 1]) - 1
-    cagr = max(min(cagr, 0.3), -0.1)  # cap extremes
-    for year in [2025, 2026, 2027]:
-        last_value = last_value * (1 + cagr)
-        rev_series[year] = last_value
-    return rev_series
-
-
-def main():
-    pkd_json = json.loads(PKD_VARS.read_text())
-    pkd_codes = list(pkd_json.keys())
-    driver_set = set()
-    for arr in pkd_json.values():
-        driver_set.update(arr)
-    gs = pd.read_excel(GS_PATH)
-    nwc = pd.read_excel(NWC_PATH)
-
-    revenue = load_series_for_codes(gs, pkd_codes, "numer PKD")
-    working_capital = load_series_for_codes(nwc, pkd_codes, "numer PKD")
-    names = load_names(gs, pkd_codes)
-    exports = load_exports()
-    defaults = load_defaults(pkd_codes)
-
-    growth_raw = {}
-    debt_raw = {}
-    risk_raw = {}
-    export_raw = {}
-
-    seen_codes = set()
-    for section, rev_series in revenue.items():
-        # Year-over-year growth (%)
-        growth_series = {}
-        rev_series = project_revenue(rev_series)
-        prev = None
-        for year in YEARS:
-            current = rev_series[year]
-            if prev and prev != 0:
-                growth_series[year] = (current - prev) / prev * 100
-            else:
-                growth_series[year] = 0
-            prev = current
-        growth_raw[section] = growth_series
-
-        # Debt proxy: 1 - working_capital / revenue (bounded to [0,1])
-        debt_series = {}
-        wc_series = working_capital.get(section, {})
-        for year in YEARS:
-            rev = rev_series[year]
-            wc = wc_series.get(year, 0)
-            if year >= 2025 and wc == 0 and rev != 0:
-                # project WC using last known ratio
-                last_known_years = [y for y, v in wc_series.items() if v]
-                ratio = 0.3
-                if last_known_years:
-                    ly = max(last_known_years)
-                    last_rev = rev_series.get(ly, 0)
-                    ratio = (wc_series[ly] / last_rev) if last_rev else 0.3
-                wc = rev * ratio
-            debt = 1 - (wc / rev if rev else 0)
-            debt_series[year] = max(0, min(1, debt))
-        debt_raw[section] = debt_series
-
-        # Risk proxy from defaults, normalized later (flat forward)
-        def_series = defaults.get(section, {y: 0 for y in YEARS})
-        last_def = def_series.get(2024, 0)
-        for y in [2025, 2026, 2027]:
-            def_series[y] = last_def
-        risk_raw[section] = def_series
-
-        # Export share stays flat (use section letter if available)
-        exp = exports.get(section[0], exports.get(section, {"share": 0}))["share"] if section else 0
-        export_raw[section] = {year: exp for year in YEARS}
-
-    growth_norm = normalize_series(growth_raw)
-    risk_norm = {}
-    # Normalize risk by max defaults per year (higher defaults => higher risk)
-    for year in YEARS:
-        vals = [risk_raw[s][year] for s in risk_raw]
-        max_v = max(vals) if vals else 1
-        for s in risk_raw:
-            risk_norm.setdefault(s, {})[year] = (risk_raw[s][year] / max_v) if max_v else 0
-
-    debt_norm = normalize_series(debt_raw)
-    export_norm = normalize_series(export_raw)
-
+    keys = list(series_dict)
+    values = np.array([[vals[year] for year in YEARS] for vals in series_dict.values()], dtype=float)
+    normalized = normalize_per_year(values.reshape(len(keys), len(YEARS)))
+    return {key: dict(zip(YEARS, row)) for key, row in zip(keys, normalized.tolist())}
+
+
+def _json_values(values: np.ndarray, digits: int, as_int: np.ndarray | None = None) -> list:
+    """Round for JSON; cells flagged in `as_int` (fallback zeros, clipped bounds) stay integers."""
+    if as_int is None:
+        return [round(v, digits) for v in values.tolist()]
+    return [int(v) if flag else round(v, digits) for v, flag in zip(values.tolist(), as_int.tolist())]
+
+
+def apply_lu_risk(sectors: list[dict], years, path: Path = LU_PATH) -> None:
+    """
+    Overwrite risk/defaults with the KRZ bankruptcy shares from
+    'LICZBA UPADŁOŚCI %.csv' (`<id>_LU%` columns), as the browser used to
+    do after fetching the raw CSV.
+    """
+    if not path.exists():
+        return
+    lu = pd.read_csv(path, sep=";")
+    year_pos = {year: i for i, year in enumerate(years)}
+    lu = lu[lu["rok"].isin(year_pos)]
+    for sector in sectors:
+        column = f"{sector['id']}_LU%"
+        if column not in lu.columns:
+            continue
+        values = pd.to_numeric(lu[column], errors="coerce")
+        for year, value in zip(lu["rok"], values):
+            if pd.notna(value):
+                sector["risk"][year_pos[year]] = float(value) / 100
+                sector["defaults"][year_pos[year]] = float(value)
+
+
+def _compact_json(payload) -> bytes:
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _write_precompressed(path: Path, body: bytes, keep_existing: bool = False) -> None:
+    """
+    Write `path` plus .gz (and .br when brotli is installed) variants. With
+    `keep_existing` (content-hashed names) each variant already on disk is
+    kept and only the missing ones are written.
+    """
+    variants = {
+        path: lambda: body,
+        path.with_name(path.name + ".gz"): lambda: gzip.compress(body, compresslevel=9, mtime=0),
+    }
+    if brotli is not None:
+        variants[path.with_name(path.name + ".br")] = lambda: brotli.compress(body)
+    for target, encode in variants.items():
+        if not (keep_existing and target.exists()):
+            target.write_bytes(encode())
+
+
+def _write_hashed(directory: Path, stem: str, payload) -> str:
+    """Write `payload` as '<stem>.<content hash>.json' (plus variants); returns the file name."""
+    body = _compact_json(payload)
+    name = f"{stem}.{hashlib.sha256(body).hexdigest()[:12]}.json"
+    _write_precompressed(directory / name, body, keep_existing=True)
+    return name
+
+
+def _remove_stale(directory: Path, pattern: str, keep: set[str]) -> None:
+    for stale in directory.glob(pattern):
+        if stale.name not in keep:
+            stale.unlink()
+
+
+def write_shards(model: dict, out_dir: Path = SHARD_DIR) -> Path:
+    """
+    Split the dashboard model into `index.json`, one overview file and one
+    shard per sector.
+
+    The index holds ids, names, tiers, latest score and the shard and
+    overview URLs; the overview holds the per-year series the cross-sector
+    charts need (fetched on first use), shards the full sector record.
+    Overview and shard names carry a content hash, so they can be cached
+    indefinitely; files no longer referenced are removed.
+    """
+    shard_dir = out_dir / "sectors"
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    entries, written = [], set()
+    for sector in model["sectors"]:
+        name = _write_hashed(shard_dir, sector["id"], sector)
+        written.update({name, name + ".gz", name + ".br"})
+        entries.append(
+            {
+                "id": sector["id"],
+                "name": sector["name"],
+                "tier": sector["tier"],
+                "score": sector["score"][-1],
+                "shard": f"sectors/{name}",
+            }
+        )
+    _remove_stale(shard_dir, "*", written)
+
+    overview = _write_hashed(
+        out_dir,
+        "overview",
+        {field: [sector[field] for sector in model["sectors"]] for field in OVERVIEW_FIELDS},
+    )
+    _remove_stale(out_dir, "overview.*", {overview, overview + ".gz", overview + ".br"})
+
+    index = {
+        "years": model["years"],
+        "forecast_start": model["forecast_start"],
+        "drivers": model["drivers"],
+        "metrics": model["metrics"],
+        "sectors": entries,
+        "overview": overview,
+    }
+    index_path = out_dir / "index.json"
+    _write_precompressed(index_path, _compact_json(index))
+    return index_path
+
+
+def load_scoring_inputs(pkd_codes) -> tuple[list[str], dict[str, str], dict[str, np.ndarray]]:
+    """
+    Codes with financial coverage, their names, and the `score_sectors`
+    input matrices (revenue, working capital, defaults, export share).
+    """
+    with stage("sheets") as st:
+        # Categorical codes/names and downcast values; 'bd' cells become NaN.
+        gs = read_compact_excel(GS_PATH)
+        nwc = read_compact_excel(NWC_PATH)
+        st.shape(gs, "gs_")
+        st.shape(nwc, "nwc_")
+        st.count(memory_mb=round(memory_mb(gs) + memory_mb(nwc), 3))
+    with stage("series"):
+        gs_index = index_for(gs, "numer PKD")
+        revenue = load_series_frame(gs, pkd_codes, "numer PKD", index=gs_index)
+        sections = list(revenue.index)
+        working_capital = load_series_frame(nwc, sections, "numer PKD").reindex(sections, fill_value=0.0)
+        names = load_names(gs, pkd_codes, index=gs_index)
+    with stage("exports"):
+        exports = load_exports()
+    with stage("defaults"):
+        defaults = load_defaults_frame(sections)
+
+    # Export share stays flat (use section letter if available)
+    export_entries = [
+        exports.get(section[0], exports.get(section)) if section else None for section in sections
+    ]
+    export_known = np.array([entry is not None for entry in export_entries], dtype=bool)
+    export_share = np.array([entry["share"] if entry else 0.0 for entry in export_entries], dtype=float)
+
+    inputs = {
+        "revenue": revenue.to_numpy(),
+        "working_capital": working_capital.to_numpy(),
+        "defaults": defaults.to_numpy(),
+        "export_share": export_share,
+        "export_known": export_known,
+    }
+    return sections, names, inputs
+
+
+def sector_records(sections, names, pkd_codes, result) -> list[dict]:
+    """Dashboard records for the scored sections plus placeholders for uncovered codes."""
     sectors = []
-    weights = {"growth": 0.35, "risk": 0.25, "debt": 0.25, "export": 0.15}
-
-    for section in revenue.keys():
-        seen_codes.add(section)
-        scores = []
-        growth = []
-        debt = []
-        risk = []
-        export = []
-        defaults_series = []
-        for year in YEARS:
-            g = growth_raw[section][year]
-            d = debt_raw[section][year]
-            r = risk_norm.get(section, {}).get(year, 0)
-            ex = export_raw[section][year]
-            g_norm = growth_norm.get(section, {}).get(year, 0)
-            d_norm = debt_norm.get(section, {}).get(year, 0)
-            ex_norm = export_norm.get(section, {}).get(year, 0)
-            score = 100 * (
-                weights["growth"] * g_norm
-                + weights["risk"] * (1 - r)
-                + weights["debt"] * (1 - d_norm)
-                + weights["export"] * ex_norm
-            )
-            scores.append(round(score, 1))
-            growth.append(round(g, 2))
-            debt.append(round(d, 3))
-            risk.append(round(r, 3))
-            export.append(round(ex, 2))
-            defaults_series.append(int(risk_raw[section][year]))
-
-        latest_score = scores[-1]
-        tier = "developing" if latest_score >= 70 else "core" if latest_score >= 55 else "watchlist"
+    seen_codes = set(sections)
+    for i, section in enumerate(sections):
+        scores = _json_values(result.score[i], 1)
+        growth = _json_values(result.growth[i], 2, ~result.growth_defined[i])
+        debt = _json_values(result.debt[i], 3, (result.debt[i] == 0) | (result.debt[i] == 1))
+        risk = _json_values(result.risk[i], 3, ~result.risk_defined[i])
+        export = _json_values(result.export[i], 2, ~result.export_known[i])
+        defaults_series = [int(v) for v in result.defaults[i].tolist()]
+
         sectors.append(
             {
                 "id": section.lower(),
                 "name": names.get(section, f"Sekcja {section}"),
-                "tier": tier,
+                "tier": str(result.tiers[i]),
                 "score": scores,
                 "growth": growth,
                 "risk": risk,
@@ -252,10 +330,54 @@ def main():
                 "note": "Placeholder — no aggregated financial series available, only forecast drivers present.",
             }
         )
+    return sectors
 
-    model = {"years": YEARS, "sectors": sectors, "drivers": sorted(driver_set)}
-    OUTPUT_PATH.write_text(json.dumps(model, ensure_ascii=False, indent=2))
-    print(f"Wrote {OUTPUT_PATH.relative_to(BASE_DIR)} with {len(sectors)} sectors.")
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Rebuild the dashboard data (monolithic JSON plus index and sector shards)."
+    )
+    add_arguments(parser)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    with instrumented("prepare_dashboard_data", args):
+        with stage("load") as st:
+            pkd_json = json.loads(PKD_VARS.read_text())
+            pkd_codes = list(pkd_json.keys())
+            driver_set = set()
+            for arr in pkd_json.values():
+                driver_set.update(arr)
+            sections, names, inputs = load_scoring_inputs(pkd_codes)
+            st.shape(inputs["revenue"])
+
+        with stage("score", sectors=len(sections), years=len(YEARS)):
+            result = score_sectors(years=YEARS, weights=WEIGHTS, tiers=TIERS, **inputs)
+
+        with stage("serialize") as st:
+            sectors = sector_records(sections, names, pkd_codes, result)
+            model = {
+                "years": YEARS,
+                "sectors": sectors,
+                "drivers": sorted(driver_set),
+                "forecast_start": LAST_ACTUAL_YEAR + 1,
+                "metrics": METRICS,
+            }
+            st.count(sectors=len(sectors))
+
+        with stage("write_json") as st:
+            # Monolithic file kept for dashboard.html; dashboard.js reads the sharded layout.
+            body = json.dumps(model, ensure_ascii=False, indent=2)
+            OUTPUT_PATH.write_text(body)
+            st.count(bytes=len(body.encode("utf-8")))
+        print(f"Wrote {OUTPUT_PATH.relative_to(BASE_DIR)} with {len(sectors)} sectors.")
+
+        with stage("write_shards", sectors=len(sectors)):
+            apply_lu_risk(sectors, YEARS)
+            index_path = write_shards(model, SHARD_DIR)
+        print(f"Wrote {index_path.relative_to(BASE_DIR)} and {len(sectors)} sector shards.")
 
 
 if __name__ == "__main__":
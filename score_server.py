@@ -0,0 +1,269 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import time
+from functools import lru_cache
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from prepare_dashboard_data import PKD_VARS, TIERS, WEIGHTS, YEARS, load_scoring_inputs
+from sector_scoring import (
+    FALLBACK_TIER,
+    assign_tiers,
+    latest_scores,
+    normalize_indicators,
+    score_sectors,
+)
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8001
+DEFAULT_CACHE_SIZE = 256
+INDICATORS = ("growth", "risk", "debt", "export")
+MAX_REQUEST_LINE = 8192
+
+
+class ScoreRequestError(ValueError):
+    """A /score query that cannot be parsed; answered with 400."""
+
+
+def parse_weights(raw: str | None) -> tuple[float, ...]:
+    """
+    'growth:0.4,risk:0.2,...' or four numbers in INDICATORS order; missing
+    indicators keep their default weight. Weights are rescaled to sum to 1
+    so scores stay on the 0-100 scale.
+    """
+    weights = dict(WEIGHTS)
+    if raw:
+        parts = [p for p in raw.split(",") if p]
+        try:
+            if all(":" in p for p in parts):
+                for part in parts:
+                    name, value = part.split(":", 1)
+                    if name not in INDICATORS:
+                        raise ScoreRequestError(f"Unknown indicator '{name}'; expected {INDICATORS}.")
+                    weights[name] = float(value)
+            elif len(parts) == len(INDICATORS):
+                weights = dict(zip(INDICATORS, map(float, parts)))
+            else:
+                raise ScoreRequestError(f"Expected name:value pairs or {len(INDICATORS)} numbers.")
+        except ScoreRequestError:
+            raise
+        except ValueError as exc:
+            raise ScoreRequestError(f"Bad weights '{raw}': {exc}") from None
+    values = np.array([weights[name] for name in INDICATORS], dtype=float)
+    if (values < 0).any() or not np.isfinite(values).all() or values.sum() == 0:
+        raise ScoreRequestError("Weights must be finite, non-negative and not all zero.")
+    # Rounded so near-identical slider positions share a cache entry.
+    return tuple(round(v, 6) for v in (values / values.sum()).tolist())
+
+
+def _shorten(text: str, limit: int = 60) -> str:
+    """A request value cut to `limit` characters for an error message."""
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+def parse_years(raw: str | None, available) -> tuple[int, ...]:
+    """'2023,2024' or '2022-2027'; defaults to every year."""
+    available = [int(y) for y in available]
+    if not raw:
+        return tuple(available)
+    first, last = min(available), max(available)
+    years = []
+    try:
+        for part in raw.split(","):
+            if "-" in part:
+                start, end = map(int, part.split("-", 1))
+                # Checked before expanding, so a huge range costs nothing.
+                if start <= end and (start < first or end > last):
+                    raise ScoreRequestError(f"Years {start}-{end} not available; expected {first}-{last}.")
+                years.extend(range(start, end + 1))
+            elif part:
+                years.append(int(part))
+    except ScoreRequestError:
+        raise
+    except ValueError:
+        raise ScoreRequestError(f"Bad years '{_shorten(raw)}'.") from None
+    if not years:
+        raise ScoreRequestError(f"No years in '{_shorten(raw)}'.")
+    unknown = sorted(set(years) - set(available))
+    if unknown:
+        raise ScoreRequestError(f"Years {_shorten(str(unknown))} not available; expected {first}-{last}.")
+    return tuple(sorted(set(years)))
+
+
+def parse_tiers(raw: str | None) -> tuple[tuple[str, float], ...]:
+    """'developing:70,core:55' (checked in order); defaults to the build-time tiers."""
+    if not raw:
+        return tuple(TIERS)
+    try:
+        tiers = tuple(
+            (name, float(value)) for name, value in (p.split(":", 1) for p in raw.split(",") if p)
+        )
+    except ValueError:
+        raise ScoreRequestError(f"Bad tiers '{raw}'; expected name:threshold pairs.") from None
+    return tiers
+
+
+class ScoreModel:
+    """
+    The normalized (sector x year) indicator matrices, computed once, so a
+    what-if score is a 4-term weighted sum over the selected year columns.
+    """
+
+    def __init__(self, ids: list[str], years, indicators: dict[str, np.ndarray]) -> None:
+        self.ids = list(ids)
+        self.years = np.asarray(years, dtype=int)
+        # (indicator, sector, year); risk and debt enter the score inverted.
+        self.stack = np.stack(
+            [
+                indicators["growth"],
+                1 - indicators["risk"],
+                1 - indicators["debt"],
+                indicators["export"],
+            ]
+        )
+        self._year_pos = {int(y): i for i, y in enumerate(self.years.tolist())}
+
+    @classmethod
+    def load(cls) -> ScoreModel:
+        pkd_codes = list(json.loads(PKD_VARS.read_text()))
+        sections, _, inputs = load_scoring_inputs(pkd_codes)
+        result = score_sectors(years=YEARS, weights=WEIGHTS, tiers=TIERS, **inputs)
+        indicators = normalize_indicators(result.growth, result.risk, result.debt, result.export)
+        return cls([code.lower() for code in sections], YEARS, indicators)
+
+    def score(self, weights: tuple[float, ...], years: tuple[int, ...]) -> np.ndarray:
+        """(sector x year) 0-100 scores for the selected years."""
+        cols = [self._year_pos[y] for y in years]
+        return 100 * np.tensordot(np.asarray(weights), self.stack[:, :, cols], axes=1)
+
+    def response(self, weights, years, tiers) -> dict:
+        score = self.score(weights, years)
+        tier = assign_tiers(latest_scores(score), tiers, FALLBACK_TIER)
+        return {
+            "years": list(years),
+            "weights": dict(zip(INDICATORS, weights)),
+            "tiers": [list(t) for t in tiers],
+            "sectors": [
+                {"id": sector_id, "tier": str(t), "score": [round(v, 1) for v in row]}
+                for sector_id, t, row in zip(self.ids, tier.tolist(), score.tolist())
+            ],
+        }
+
+
+class ScoreServer:
+    """Minimal asyncio HTTP/1.1 server answering GET /score and /health."""
+
+    def __init__(self, model: ScoreModel, cache_size: int = DEFAULT_CACHE_SIZE) -> None:
+        self.model = model
+        self.cached_body = lru_cache(maxsize=cache_size)(self._body)
+
+    def _body(self, weights, years, tiers) -> bytes:
+        payload = self.model.response(weights, years, tiers)
+        return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def handle_score(self, query: dict[str, list[str]]) -> bytes:
+        def arg(name):
+            return query.get(name, [None])[-1]
+
+        weights = parse_weights(arg("weights"))
+        years = parse_years(arg("years"), self.model.years)
+        tiers = parse_tiers(arg("tiers"))
+        return self.cached_body(weights, years, tiers)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await reader.readline()
+            if not request_line or len(request_line) > MAX_REQUEST_LINE:
+                return
+            # Drain headers; nothing in them changes the answer.
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            method, target, *_ = request_line.decode("latin-1").split()
+            status, body = self.dispatch(method, target)
+            writer.write(_response(status, body))
+            await writer.drain()
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def dispatch(self, method: str, target: str) -> tuple[HTTPStatus, bytes]:
+        if method == "OPTIONS":
+            return HTTPStatus.NO_CONTENT, b""
+        if method != "GET":
+            return HTTPStatus.METHOD_NOT_ALLOWED, _error("Only GET is supported.")
+        url = urlsplit(target)
+        if url.path == "/health":
+            info = self.cached_body.cache_info()
+            return HTTPStatus.OK, json.dumps(
+                {"sectors": len(self.model.ids), "cache_hits": info.hits, "cache_misses": info.misses}
+            ).encode("utf-8")
+        if url.path != "/score":
+            return HTTPStatus.NOT_FOUND, _error(f"Unknown path '{url.path}'.")
+        try:
+            return HTTPStatus.OK, self.handle_score(parse_qs(url.query))
+        except ScoreRequestError as exc:
+            return HTTPStatus.BAD_REQUEST, _error(str(exc))
+
+
+def _error(message: str) -> bytes:
+    return json.dumps({"error": message}, ensure_ascii=False).encode("utf-8")
+
+
+def _response(status: HTTPStatus, body: bytes) -> bytes:
+    headers = [
+        f"HTTP/1.1 {status.value} {status.phrase}",
+        "Content-Type: application/json; charset=utf-8",
+        f"Content-Length: {len(body)}",
+        "Access-Control-Allow-Origin: *",
+        "Access-Control-Allow-Methods: GET, OPTIONS",
+        "Cache-Control: no-store",
+        "Connection: close",
+    ]
+    return ("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + body
+
+
+async def serve(host: str, port: int, cache_size: int) -> None:
+    start = time.perf_counter()
+    model = ScoreModel.load()
+    app = ScoreServer(model, cache_size)
+    server = await asyncio.start_server(app.handle, host, port)
+    print(
+        f"Loaded {len(model.ids)} sectors x {len(model.years)} years in "
+        f"{time.perf_counter() - start:.1f}s; serving http://{host}:{port}/score"
+    )
+    async with server:
+        await server.serve_forever()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Local what-if scoring service for the dashboard (GET /score?weights=&years=&tiers=)."
+    )
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Interface to bind.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port to listen on.")
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_CACHE_SIZE,
+        help="Number of recent (weights, years, tiers) responses kept in memory.",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.cache_size))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
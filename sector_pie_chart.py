@@ -1,69 +1,118 @@
+import argparse
 from pathlib import Path
 
-import matplotlib
-import matplotlib.pyplot as plt
 import pandas as pd
 
-matplotlib.use("Agg")
+from charts import ChartSpec, render_all
+from instrumentation import add_arguments, instrumented, stage
+from krz_cube import LEVELS
+from sector_shares import DEFAULT_CHUNKSIZE, LABEL_COL, SHARE_COL, TopShares, iter_chunks, stream_top_shares
 
 
 DATA_PATH = Path("data/GS_filtered_xx.x.xlsx")
 OUTPUT_DIR = Path("charts")
 OUTPUT_PATH = OUTPUT_DIR / "sector_percentage_pie.png"
 TOP_EXCEL_PATH = OUTPUT_DIR / "sector_top_values.xlsx"
+MANIFEST_PATH = Path(".cache/charts_sector_pie.json")
 TOP_N = 15
 
 
-def load_data(path: Path) -> pd.DataFrame:
-    df = pd.read_excel(path)
-    required_cols = {"numer i nazwa PKD", "percentage in total"}
-    missing = required_cols.difference(df.columns)
+def check_columns(columns) -> None:
+    required_cols = {LABEL_COL, SHARE_COL}
+    missing = required_cols.difference(columns)
     if missing:
         raise ValueError(f"Missing required columns: {', '.join(sorted(missing))}")
-    return df
+
+
+def read_chunks(path: Path, chunksize: int):
+    """Stream the sheet in row chunks, checking the header on the first one."""
+    for i, chunk in enumerate(iter_chunks(path, chunksize)):
+        if i == 0:
+            check_columns(chunk.columns)
+        yield chunk
 
 
 def prepare_segments(df: pd.DataFrame, top_n: int) -> tuple[pd.DataFrame, pd.DataFrame]:
-    top = df.nlargest(top_n, "percentage in total")[["numer i nazwa PKD", "percentage in total"]]
-    other_sum = df.drop(top.index)["percentage in total"].sum()
-    segments = top.copy()
-    if other_sum > 0:
-        segments = pd.concat(
-            [segments, pd.DataFrame({"numer i nazwa PKD": ["Other sectors"], "percentage in total": [other_sum]})],
-            ignore_index=True,
-        )
-    return top, segments
+    aggregator = TopShares(top_n)
+    aggregator.update(df)
+    return aggregator.top(), aggregator.segments()
 
 
 def plot_pie(segments: pd.DataFrame, output_path: Path) -> None:
-    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-    labels = segments["numer i nazwa PKD"]
-    sizes = segments["percentage in total"]
-
-    plt.figure(figsize=(10, 10))
-    plt.pie(
-        sizes,
-        labels=labels,
-        autopct="%1.1f%%",
-        startangle=90,
-        pctdistance=0.8,
+    spec = ChartSpec(
+        "pie",
+        str(output_path),
+        {
+            "labels": segments["numer i nazwa PKD"].astype(str).tolist(),
+            "values": segments["percentage in total"].astype(float).tolist(),
+        },
+        {"title": "Sector share by percentage in total", "dpi": 300},
     )
-    plt.title("Sector share by percentage in total", pad=20)
-    plt.tight_layout()
-    plt.savefig(output_path, dpi=300)
-    plt.close()
+    render_all([spec], workers=1, manifest_path=MANIFEST_PATH)
 
 
-def export_top_segments(top_segments: pd.DataFrame, output_path: Path) -> None:
+def export_top_segments(
+    top_segments: pd.DataFrame,
+    output_path: Path,
+    year_shares: pd.DataFrame | None = None,
+) -> None:
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-    top_segments.to_excel(output_path, index=False)
+    if year_shares is None:
+        top_segments.to_excel(output_path, index=False)
+        return
+    with pd.ExcelWriter(output_path) as writer:
+        top_segments.to_excel(writer, index=False)
+        year_shares.to_excel(writer, sheet_name="years", index=False)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Pie chart of the top sectors by share in total.")
+    parser.add_argument("--top-n", type=int, default=TOP_N, help="Sectors shown before 'Other sectors'.")
+    parser.add_argument(
+        "--level",
+        choices=LEVELS,
+        default=None,
+        help="Only rank rows of this PKD level (default: every row of the sheet).",
+    )
+    parser.add_argument(
+        "--years",
+        type=int,
+        nargs="+",
+        default=None,
+        help="Also rank these year columns in the same pass (extra 'years' sheet in the export).",
+    )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=DEFAULT_CHUNKSIZE,
+        help="Rows read per chunk; memory stays bounded by the top-N, not the sheet size.",
+    )
+    add_arguments(parser)
+    return parser.parse_args()
 
 
 def main() -> None:
-    df = load_data(DATA_PATH)
-    top_segments, pie_segments = prepare_segments(df, TOP_N)
-    plot_pie(pie_segments, OUTPUT_PATH)
-    export_top_segments(top_segments, TOP_EXCEL_PATH)
+    args = parse_args()
+    columns = [SHARE_COL, *(args.years or [])]
+    with instrumented("sector_pie_chart", args):
+        with stage("aggregate", top_n=args.top_n) as st:
+            aggregator = stream_top_shares(
+                read_chunks(DATA_PATH, args.chunksize), args.top_n, columns, level=args.level
+            )
+            top_segments, pie_segments = aggregator.top(), aggregator.segments()
+            st.count(rows=aggregator.rows_seen)
+            st.shape(pie_segments, prefix="segment_")
+        if aggregator.total() <= 0:
+            scope = f" at level '{args.level}'" if args.level else ""
+            raise SystemExit(
+                f"No positive '{SHARE_COL}' values in {DATA_PATH}{scope} "
+                f"({aggregator.rows_seen} rows matched); nothing to plot."
+            )
+        with stage("plot"):
+            plot_pie(pie_segments, OUTPUT_PATH)
+        with stage("write"):
+            year_shares = aggregator.shares().query("column != @SHARE_COL") if args.years else None
+            export_top_segments(top_segments, TOP_EXCEL_PATH, year_shares)
     print(f"Pie chart saved to {OUTPUT_PATH}")
     print(f"Top segments exported to {TOP_EXCEL_PATH}")
 
@@ -0,0 +1,366 @@
+from __future__ import annotations
+
+import argparse
+import warnings
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from charts import write_plotly_html
+from panel import PKDPanel
+
+try:
+    import plotly.express as px
+except ImportError:  # only the HTML views need plotly
+    px = None
+
+
+BASE_DIR = Path(__file__).parent
+RATIOS_PATH = BASE_DIR / "data" / "df_ratios_finished_final_8_ratios_jig.csv"
+FORECASTS_PATH = BASE_DIR / "data" / "xgb_forecasts_2025_2027.csv"
+GROUPS_PATH = BASE_DIR / "pkd_groups_by_year.csv"
+FRAME_PATH = BASE_DIR / "data" / "sector_quadrants.csv"
+CHART_MANIFEST_PATH = BASE_DIR / ".cache" / "charts_quadrants.json"
+
+RATIOS = (
+    "GS_dyn",
+    "NP_dyn",
+    "CF_dyn",
+    "NP_to_GS",
+    "DEBT_to_GS",
+    "CF_to_TC",
+    "STL_to_GS",
+    "NP_to_TC",
+)
+# Ratios the forecasts may lack, rebuilt from their forecast components.
+DERIVED = {"NP_to_GS": ("NP", "GS"), "NP_to_TC": ("NP", "TC")}
+PILLARS = {
+    "growth": ("GS_dyn", "NP_dyn", "CF_dyn"),
+    "profit": ("NP_to_GS", "NP_to_TC"),
+    "cash": ("CF_to_TC", "CF_dyn"),
+    "debt_burden": ("DEBT_to_GS", "STL_to_GS"),
+}
+# IKB (Indeks Kondycji Branży) weights of the z-scored pillars.
+WEIGHTS = {"growth": 0.35, "profit": 0.35, "cash": 0.20, "leverage": 0.10}
+GROUPS = ("Dog", "Question mark", "Cash cow", "Star")
+PKD_PICK = "46.4"
+
+
+def _nanmean(values: np.ndarray, axis: int) -> np.ndarray:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN slices stay NaN
+        return np.nanmean(values, axis=axis)
+
+
+def _metric(panel: PKDPanel, metric: str) -> np.ndarray:
+    """(year x pkd) slice of `metric`, all NaN when the panel has no such column."""
+    pos = panel.metrics.get_indexer([metric])[0]
+    if pos < 0:
+        return np.full(panel.values.shape[:2], np.nan)
+    return panel.values[:, :, pos]
+
+
+def stitch_forecasts(history: PKDPanel, forecasts: PKDPanel, ratios=RATIOS) -> PKDPanel:
+    """
+    Historical ratios followed by the forecast years, on the (year x pkd x
+    ratio) axes of `history`. NP_to_GS / NP_to_TC are derived from the
+    forecast NP, GS and TC where the forecasts do not carry them; only the
+    (pkd, ratio) pairs the history has are kept.
+    """
+    fc = forecasts.values
+    ratio_idx = pd.Index(ratios, name="metric")
+    future = np.full((len(forecasts.years), len(forecasts.pkds), len(ratio_idx)), np.nan)
+    for r, ratio in enumerate(ratio_idx):
+        pos = forecasts.metrics.get_indexer([ratio])[0]
+        have = forecasts.present[:, pos] if pos >= 0 else np.zeros(len(forecasts.pkds), bool)
+        if pos >= 0:
+            future[:, have, r] = fc[:, have, pos]
+        if ratio in DERIVED:
+            num, den = (_metric(forecasts, m) for m in DERIVED[ratio])
+            with np.errstate(divide="ignore", invalid="ignore"):
+                derived = num / np.where(den == 0, np.nan, den)
+            future[:, ~have, r] = derived[:, ~have]
+
+    # Align forecast PKDs/ratios to the history and keep its (pkd, ratio) pairs.
+    pkd_pos = forecasts.pkds.get_indexer(history.pkds)
+    metric_pos = history.metrics.get_indexer(ratio_idx)
+    aligned = np.full((len(forecasts.years), len(history.pkds), len(ratio_idx)), np.nan)
+    known = pkd_pos >= 0
+    aligned[:, known] = future[:, pkd_pos[known]]
+    present = np.zeros((len(history.pkds), len(ratio_idx)), dtype=bool)
+    present[:, metric_pos >= 0] = history.present[:, metric_pos[metric_pos >= 0]]
+    aligned[:, ~present] = np.nan
+
+    past = np.full((len(history.years), len(history.pkds), len(ratio_idx)), np.nan)
+    past[:, :, metric_pos >= 0] = history.values[:, :, metric_pos[metric_pos >= 0]]
+    new = ~np.isin(forecasts.years, history.years)
+    return PKDPanel(
+        np.concatenate([history.years, forecasts.years[new]]),
+        history.pkds,
+        ratio_idx,
+        np.concatenate([past, aligned[new]]),
+        present=present,
+    )
+
+
+def load_panel(ratios_path: Path = RATIOS_PATH, forecasts_path: Path | None = FORECASTS_PATH) -> PKDPanel:
+    """The 8-ratio panel with the forecast years appended (float64, like the notebook)."""
+    history = PKDPanel.read_csv(ratios_path, dtype=np.float64)
+    if forecasts_path is None:
+        return stitch_forecasts(
+            history, PKDPanel(np.zeros(0, int), history.pkds, history.metrics, np.zeros((0, *history.present.shape)))
+        )
+    return stitch_forecasts(history, PKDPanel.read_csv(forecasts_path, dtype=np.float64))
+
+
+def zscore(values: np.ndarray) -> np.ndarray:
+    """Per-year (axis 0) z-scores across PKDs, population sd; a flat year scores 0."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean = np.nanmean(values, axis=1, keepdims=True)
+        sd = np.nanstd(values, axis=1, keepdims=True)
+    centred = values - mean
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where((sd == 0) | np.isnan(sd), centred * 0, centred / sd)
+
+
+@dataclass
+class Quadrants:
+    """
+    Every sector in every year: the ratio panel, its four pillars and their
+    per-year z-scores (leverage = -debt_burden), the IKB and FPI indices,
+    and one group label per (year, pkd) from the chosen classifier.
+    """
+
+    panel: PKDPanel
+    pillars: np.ndarray  # (year, pkd, pillar)
+    z: np.ndarray  # (year, pkd, pillar) with debt_burden, then leverage appended
+    ikb: np.ndarray
+    fpi: np.ndarray
+    groups: np.ndarray  # (year, pkd) object array, None where unclassified
+    extras: dict = field(default_factory=dict)
+
+    def pillar(self, name: str) -> np.ndarray:
+        return self.pillars[:, :, list(PILLARS).index(name)]
+
+    def pillar_z(self, name: str) -> np.ndarray:
+        names = [*PILLARS, "leverage"]
+        return self.z[:, :, names.index(name)]
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Long (year, pkd) table with the ratios, pillars, z-scores, indices,
+        classifier columns and group, for (year, pkd) rows with any ratio.
+        """
+        n_years, n_pkds = self.groups.shape
+        columns = {
+            "year": np.repeat(self.panel.years, n_pkds),
+            "pkd": np.tile(self.panel.pkds.to_numpy(dtype=object), n_years),
+        }
+        ratios = self.panel.values.reshape(n_years * n_pkds, -1)
+        for i, ratio in sorted(enumerate(self.panel.metrics), key=lambda item: item[1]):
+            columns[ratio] = ratios[:, i]
+        for name in PILLARS:
+            columns[name] = self.pillar(name).reshape(-1)
+        for name in [*PILLARS, "leverage"]:
+            columns[f"{name}_z"] = self.pillar_z(name).reshape(-1)
+        columns["IKB"] = self.ikb.reshape(-1)
+        columns["FPI"] = self.fpi.reshape(-1)
+        for name, values in self.extras.items():
+            columns[name] = values.reshape(-1)
+        columns["group"] = np.where(pd.isna(self.groups), np.nan, self.groups).reshape(-1)
+        frame = pd.DataFrame(columns)
+        return frame[~np.isnan(ratios).all(axis=1)].reset_index(drop=True)
+
+    def groups_by_year(self) -> pd.DataFrame:
+        """pkd x year group table, years and PKDs without any group left out."""
+        table = pd.DataFrame(
+            self.groups.T,
+            index=pd.Index(self.panel.pkds, name="pkd"),
+            columns=self.panel.years,
+        )
+        table = table.dropna(axis=1, how="all").dropna(axis=0, how="all")
+        table.columns.name = "year"
+        return table
+
+
+def quadrant_labels(growth_high: np.ndarray, profit_high: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    """Star / Cash cow / Question mark / Dog from two boolean axes, None where not `valid`."""
+    labels = np.array(GROUPS, dtype=object)[growth_high.astype(int) + 2 * profit_high.astype(int)]
+    return np.where(valid, labels, None)
+
+
+def classify_quantile(
+    pillars: np.ndarray, z: np.ndarray, q_growth: float = 0.5, q_profit: float = 0.5
+) -> tuple[np.ndarray, dict]:
+    """
+    Quantile quadrants: a sector is high-growth / high-profit when it is at
+    or above that year's `q` quantile across PKDs (the median by default,
+    as in the notebook's matrix).
+    """
+    growth, profit = pillars[:, :, 0], pillars[:, :, 1]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        g_cut = np.nanquantile(growth, q_growth, axis=1, keepdims=True)
+        p_cut = np.nanquantile(profit, q_profit, axis=1, keepdims=True)
+    growth_high = growth >= g_cut
+    profit_high = profit >= p_cut
+    labels = quadrant_labels(growth_high, profit_high, ~np.isnan(growth) & ~np.isnan(profit))
+    extras = {
+        "g_med": np.broadcast_to(g_cut, growth.shape),
+        "p_med": np.broadcast_to(p_cut, growth.shape),
+        "growth_high": growth_high,
+        "profit_high": profit_high,
+    }
+    return labels, extras
+
+
+def classify_kmeans(pillars: np.ndarray, z: np.ndarray, k: int = 4, seed: int = 0) -> tuple[np.ndarray, dict]:
+    """
+    k-means on each year's (growth_z, profit_z) points; every cluster takes
+    the quadrant of its centroid, so labels stay comparable across years.
+    Years with fewer than `k` sectors fall back to the sign of the z-scores.
+    """
+    from sklearn.cluster import KMeans
+
+    points = z[:, :, :2]
+    valid = ~np.isnan(points).any(axis=2)
+    centred = np.where(valid[:, :, None], points, 0.0)
+    cluster = np.full(valid.shape, -1)
+    for t in range(points.shape[0]):
+        rows = np.flatnonzero(valid[t])
+        if len(rows) < k:
+            continue
+        model = KMeans(n_clusters=k, n_init=10, random_state=seed).fit(points[t, rows])
+        cluster[t, rows] = model.labels_
+        centred[t, rows] = model.cluster_centers_[model.labels_]
+    labels = quadrant_labels(centred[:, :, 0] >= 0, centred[:, :, 1] >= 0, valid)
+    return labels, {"cluster": cluster}
+
+
+CLASSIFIERS = {"quantile": classify_quantile, "kmeans": classify_kmeans}
+
+
+def classify(panel: PKDPanel, method: str = "quantile", weights=WEIGHTS, **options) -> Quadrants:
+    """Pillars, z-scores, IKB/FPI and groups of every (year, pkd) in one pass over the panel."""
+    try:
+        classifier = CLASSIFIERS[method]
+    except KeyError:
+        raise ValueError(f"Unknown method '{method}'; expected one of {sorted(CLASSIFIERS)}.") from None
+    positions = {ratio: panel.metrics.get_loc(ratio) for ratio in panel.metrics}
+    pillars = np.stack(
+        [_nanmean(panel.values[:, :, [positions[r] for r in ratios]], axis=2) for ratios in PILLARS.values()],
+        axis=2,
+    )
+    z = zscore(pillars)
+    z = np.concatenate([z, -z[:, :, 3:4]], axis=2)  # leverage: higher = better balance sheet
+    growth_z, profit_z, cash_z, _, leverage_z = np.moveaxis(z, 2, 0)
+    ikb = (
+        weights["growth"] * growth_z
+        + weights["profit"] * profit_z
+        + weights["cash"] * cash_z
+        + weights["leverage"] * leverage_z
+    )
+    # Funding pressure: growth raises borrowing needs, weak cash and high debt too.
+    fpi = growth_z - cash_z - leverage_z
+    groups, extras = classifier(pillars, z, **options)
+    return Quadrants(panel, pillars, z, ikb, fpi, groups, extras)
+
+
+def classify_sectors(
+    ratios_path: Path = RATIOS_PATH,
+    forecasts_path: Path | None = FORECASTS_PATH,
+    method: str = "quantile",
+    **options,
+) -> Quadrants:
+    return classify(load_panel(ratios_path, forecasts_path), method, **options)
+
+
+def write_fpi_views(frame: pd.DataFrame, pkd_pick: str = PKD_PICK, out_dir: Path = BASE_DIR) -> list[Path]:
+    """The notebook's FPI ranking, FPI trends and IKB-vs-FPI HTML views."""
+    if px is None:
+        raise ImportError("plotly is required for the FPI views (pip install plotly).")
+    fpi = frame.dropna(subset=["FPI"])
+    labels = {"pkd": "PKD", "FPI": "FPI (presja finansowania)"}
+    rank = px.bar(
+        fpi.sort_values(["year", "FPI"]),
+        x="FPI",
+        y="pkd",
+        orientation="h",
+        animation_frame="year",
+        range_x=[fpi["FPI"].quantile(0.02), fpi["FPI"].quantile(0.98)],
+        title="Funding Pressure Index (FPI) – ranking PKD w czasie",
+        labels=labels,
+    )
+    rank.update_layout(yaxis={"categoryorder": "total ascending"})
+    trends = px.line(
+        fpi.sort_values(["pkd", "year"]),
+        x="year",
+        y="FPI",
+        color="pkd",
+        markers=True,
+        title="Funding Pressure Index (FPI) – trendy PKD w czasie",
+        labels=labels,
+    )
+    pair = px.line(
+        frame[frame["pkd"] == pkd_pick].sort_values("year"),
+        x="year",
+        y=["IKB", "FPI"],
+        markers=True,
+        title=f"PKD {pkd_pick} – IKB vs FPI",
+        labels={"value": "Wartość wskaźnika", "variable": "Indeks"},
+    )
+    paths = [
+        out_dir / "pkd_fpi_ranking_animated.html",
+        out_dir / "pkd_fpi_trends.html",
+        out_dir / f"pkd_{pkd_pick}_ikb_vs_fpi.html",
+    ]
+    for fig, path in zip((rank, trends, pair), paths):
+        write_plotly_html(fig, path, manifest_path=CHART_MANIFEST_PATH)
+    return paths
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Growth/profit quadrants, IKB and FPI of every PKD in every year (history + forecasts)."
+    )
+    parser.add_argument("--ratios", type=Path, default=RATIOS_PATH, help="Historical ratio CSV.")
+    parser.add_argument(
+        "--forecasts",
+        type=Path,
+        default=FORECASTS_PATH,
+        help="Forecast CSV stitched after the history.",
+    )
+    parser.add_argument("--no-forecasts", action="store_true", help="Classify the historical years only.")
+    parser.add_argument("--method", choices=sorted(CLASSIFIERS), default="quantile", help="Classifier.")
+    parser.add_argument("--groups-output", type=Path, default=GROUPS_PATH, help="pkd x year group table.")
+    parser.add_argument("--frame-output", type=Path, default=FRAME_PATH, help="Long table of every (year, pkd).")
+    parser.add_argument(
+        "--html",
+        action="store_true",
+        help="Also write the FPI ranking/trend/IKB-vs-FPI views (needs plotly).",
+    )
+    parser.add_argument("--pkd", default=PKD_PICK, help="PKD for the IKB-vs-FPI view.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    result = classify_sectors(args.ratios, None if args.no_forecasts else args.forecasts, args.method)
+    print(f"Classified {result.panel!r} with the {args.method} classifier.")
+
+    groups = result.groups_by_year()
+    groups.to_csv(args.groups_output)
+    print(f"Saved groups to: {args.groups_output.resolve()}")
+    frame = result.to_frame()
+    frame.to_csv(args.frame_output, index=False)
+    print(f"Saved {len(frame)} sector-years to: {args.frame_output.resolve()}")
+    if args.html:
+        for path in write_fpi_views(frame, args.pkd):
+            print(f"Saved {path.name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import numpy as np
+
+
+DEFAULT_WEIGHTS = {"growth": 0.35, "risk": 0.25, "debt": 0.25, "export": 0.15}
+# (tier, minimum latest score), checked in order; anything below falls through.
+DEFAULT_TIERS = (("developing", 70.0), ("core", 55.0))
+FALLBACK_TIER = "watchlist"
+LAST_ACTUAL_YEAR = 2024
+DEFAULT_CAGR = 0.02
+CAGR_BOUNDS = (-0.1, 0.3)
+DEFAULT_WC_RATIO = 0.3
+
+
+@dataclass
+class SectorScores:
+    """
+    Indicator and score matrices for all sectors, shaped (sectors, years).
+
+    The `*_defined` masks mark cells that come from an actual computation
+    rather than a fallback zero (no prior revenue, no defaults in that
+    year, no export data for the sector).
+    """
+
+    years: np.ndarray
+    score: np.ndarray
+    growth: np.ndarray
+    debt: np.ndarray
+    risk: np.ndarray
+    export: np.ndarray
+    defaults: np.ndarray
+    tiers: np.ndarray
+    growth_defined: np.ndarray
+    risk_defined: np.ndarray
+    export_known: np.ndarray
+
+
+def _year_positions(years: np.ndarray, wanted: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Column positions of `wanted` years plus a mask of which ones exist."""
+    pos = np.clip(np.searchsorted(years, wanted), 0, len(years) - 1)
+    return pos, years[pos] == wanted
+
+
+def _last_true(mask: np.ndarray) -> np.ndarray:
+    """Column index of the last True per row (0 for rows without any)."""
+    flipped = np.argmax(mask[:, ::-1], axis=1)
+    return mask.shape[1] - 1 - flipped
+
+
+def project_revenue(
+    revenue: np.ndarray,
+    years: np.ndarray,
+    last_actual_year: int = LAST_ACTUAL_YEAR,
+    default_cagr: float = DEFAULT_CAGR,
+    cagr_bounds: tuple[float, float] = CAGR_BOUNDS,
+) -> np.ndarray:
+    """
+    Extend revenue past `last_actual_year` with the recent CAGR: two-year
+    CAGR from the last non-zero actual year if possible, else one-year
+    growth, else `default_cagr`, capped to `cagr_bounds`.
+    """
+    revenue = np.array(revenue, dtype=float)
+    rows = np.arange(revenue.shape[0])
+    actual = years <= last_actual_year
+    available = (revenue != 0) & actual
+    has_actual = available.any(axis=1)
+
+    last_idx = _last_true(available)
+    last_year = years[last_idx]
+    last_value = revenue[rows, last_idx]
+
+    pos2, ok2 = _year_positions(years, last_year - 2)
+    pos1, ok1 = _year_positions(years, last_year - 1)
+    prev2 = np.where(ok2, revenue[rows, pos2], 0.0)
+    prev1 = np.where(ok1, revenue[rows, pos1], 0.0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cagr2 = (last_value / prev2) ** (1 / 2) - 1
+        cagr1 = (last_value / prev1) - 1
+    cagr = np.select([prev2 != 0, prev1 != 0], [cagr2, cagr1], default=default_cagr)
+    cagr = np.maximum(np.minimum(cagr, cagr_bounds[1]), cagr_bounds[0])
+
+    future = ~actual
+    if future.any():
+        steps = np.repeat((1 + cagr)[:, None], future.sum(), axis=1)
+        projected = np.cumprod(np.hstack([last_value[:, None], steps]), axis=1)[:, 1:]
+        revenue[np.ix_(has_actual, future)] = projected[has_actual]
+    return revenue
+
+
+def yoy_growth(revenue: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Year-over-year growth in %, 0 where the prior year is missing or zero."""
+    growth = np.zeros_like(revenue, dtype=float)
+    prev, current = revenue[:, :-1], revenue[:, 1:]
+    defined = np.zeros(revenue.shape, dtype=bool)
+    defined[:, 1:] = prev != 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        growth[:, 1:] = np.where(defined[:, 1:], (current - prev) / prev * 100, 0.0)
+    return growth, defined
+
+
+def debt_proxy(
+    revenue: np.ndarray,
+    working_capital: np.ndarray,
+    years: np.ndarray,
+    last_actual_year: int = LAST_ACTUAL_YEAR,
+    default_ratio: float = DEFAULT_WC_RATIO,
+) -> np.ndarray:
+    """
+    Debt proxy 1 - working_capital / revenue, bounded to [0, 1]. Missing
+    forecast-year working capital is projected from the last known
+    WC/revenue ratio.
+    """
+    rows = np.arange(revenue.shape[0])
+    known = working_capital != 0
+    last_idx = _last_true(known)
+    last_wc = working_capital[rows, last_idx]
+    last_rev = revenue[rows, last_idx]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(last_rev != 0, last_wc / last_rev, default_ratio)
+    ratio = np.where(known.any(axis=1), ratio, default_ratio)
+
+    fill = (years > last_actual_year) & (working_capital == 0) & (revenue != 0)
+    wc = np.where(fill, revenue * ratio[:, None], working_capital)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        debt = 1 - np.where(revenue != 0, wc / revenue, 0.0)
+    return np.clip(debt, 0, 1)
+
+
+def carry_forward(values: np.ndarray, years: np.ndarray, last_actual_year: int = LAST_ACTUAL_YEAR) -> np.ndarray:
+    """Hold the `last_actual_year` value flat over later years."""
+    values = np.array(values)
+    pos, ok = _year_positions(years, np.array([last_actual_year]))
+    last = values[:, pos[0]] if ok[0] else np.zeros(values.shape[0], dtype=values.dtype)
+    values[:, years > last_actual_year] = last[:, None]
+    return values
+
+
+def normalize_per_year(values: np.ndarray) -> np.ndarray:
+    """Min-max normalize each year (column) across sectors to 0-1."""
+    if values.shape[0] == 0:
+        return np.zeros_like(values, dtype=float)
+    min_v = values.min(axis=0)
+    span = np.maximum(values.max(axis=0) - min_v, 1e-9)
+    return (values - min_v) / span
+
+
+def scale_by_year_max(values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Divide each year by its maximum across sectors (0 where the max is 0)."""
+    if values.shape[0] == 0:
+        return np.zeros_like(values, dtype=float), np.zeros(values.shape, dtype=bool)
+    max_v = values.max(axis=0)
+    defined = np.broadcast_to(max_v != 0, values.shape)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scaled = np.where(defined, values / max_v, 0.0)
+    return scaled, defined
+
+
+def normalize_indicators(
+    growth: np.ndarray, risk: np.ndarray, debt: np.ndarray, export: np.ndarray
+) -> dict[str, np.ndarray]:
+    """The 0-1 indicator matrices `weighted_score` combines (risk is already scaled)."""
+    return {
+        "growth": normalize_per_year(growth),
+        "risk": risk,
+        "debt": normalize_per_year(debt),
+        "export": normalize_per_year(export),
+    }
+
+
+def weighted_score(
+    growth_norm: np.ndarray,
+    risk_norm: np.ndarray,
+    debt_norm: np.ndarray,
+    export_norm: np.ndarray,
+    weights: dict[str, float] = DEFAULT_WEIGHTS,
+) -> np.ndarray:
+    """0-100 score; higher growth/export and lower risk/debt score better."""
+    return 100 * (
+        weights["growth"] * growth_norm
+        + weights["risk"] * (1 - risk_norm)
+        + weights["debt"] * (1 - debt_norm)
+        + weights["export"] * export_norm
+    )
+
+
+def assign_tiers(
+    latest_score: np.ndarray,
+    tiers=DEFAULT_TIERS,
+    fallback: str = FALLBACK_TIER,
+) -> np.ndarray:
+    """Map each sector's latest score to the first tier whose threshold it meets."""
+    conditions = [latest_score >= threshold for _, threshold in tiers]
+    return np.select(conditions, [name for name, _ in tiers], default=fallback)
+
+
+def latest_scores(score: np.ndarray) -> np.ndarray:
+    """
+    Last-column scores rounded to one decimal with Python's round(), so
+    tiers agree with the published score.
+    """
+    if score.shape[1] == 0:
+        return np.zeros(score.shape[0])
+    return np.array([round(v, 1) for v in score[:, -1].tolist()])
+
+
+def score_sectors(
+    revenue: np.ndarray,
+    working_capital: np.ndarray,
+    defaults: np.ndarray,
+    export_share: np.ndarray,
+    years,
+    export_known: np.ndarray | None = None,
+    weights: dict[str, float] = DEFAULT_WEIGHTS,
+    tiers=DEFAULT_TIERS,
+    last_actual_year: int = LAST_ACTUAL_YEAR,
+) -> SectorScores:
+    """
+    Score every sector for every year in one pass.
+
+    `revenue`, `working_capital` and `defaults` are (sectors, years) matrices
+    with 0 for missing cells; `export_share` is one flat share per sector.
+    Tiers are assigned on the latest score rounded to one decimal, as shown.
+    """
+    years = np.asarray(years)
+    revenue = project_revenue(np.asarray(revenue, dtype=float), years, last_actual_year)
+    working_capital = np.asarray(working_capital, dtype=float)
+    export_share = np.asarray(export_share, dtype=float)
+    if export_known is None:
+        export_known = np.ones(export_share.shape, dtype=bool)
+
+    growth, growth_defined = yoy_growth(revenue)
+    debt = debt_proxy(revenue, working_capital, years, last_actual_year)
+    defaults = carry_forward(np.asarray(defaults), years, last_actual_year)
+    risk, risk_defined = scale_by_year_max(defaults)
+    export = np.repeat(export_share[:, None], len(years), axis=1)
+
+    norm = normalize_indicators(growth, risk, debt, export)
+    score = weighted_score(norm["growth"], norm["risk"], norm["debt"], norm["export"], weights)
+    latest = latest_scores(score)
+    return SectorScores(
+        years=years,
+        score=score,
+        growth=growth,
+        debt=debt,
+        risk=risk,
+        export=export,
+        defaults=defaults,
+        tiers=assign_tiers(latest, tiers),
+        growth_defined=growth_defined,
+        risk_defined=np.asarray(risk_defined),
+        export_known=np.repeat(np.asarray(export_known)[:, None], len(years), axis=1),
+    )
@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import heapq
+from itertools import count
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import numpy as np
+import pandas as pd
+
+from krz_cube import LEVELS, canonical_code
+
+
+LABEL_COL = "numer i nazwa PKD"
+SHARE_COL = "percentage in total"
+OTHER_LABEL = "Other sectors"
+DEFAULT_CHUNKSIZE = 10_000
+
+
+class TopShares:
+    """
+    Streaming top-N with remainder: for every value column, a min-heap of
+    the `n` largest (value, label) rows seen so far plus running sums of
+    everything pushed out of it and of all values.
+
+    Memory is O(n x columns) however many rows are fed. Ties and NaN are
+    handled like `DataFrame.nlargest(n, col)` (keep='first'; NaN rows only
+    pad the result when fewer than n values exist), so `top()` matches
+    `nlargest` and `other()` matches `df.drop(top.index)[col].sum()`.
+    """
+
+    def __init__(self, n: int, columns=(SHARE_COL,)) -> None:
+        if n < 1:
+            raise ValueError(f"n must be positive, got {n}.")
+        self.n = n
+        self.columns = list(columns)
+        # column -> heap of (value, -row number, index label, label)
+        self._heaps: dict = {c: [] for c in self.columns}
+        # column -> first n (index label, label) rows without a value
+        self._missing: dict = {c: [] for c in self.columns}
+        self._other = dict.fromkeys(self.columns, 0.0)
+        self._total = dict.fromkeys(self.columns, 0.0)
+        self._rows = count()
+        self.rows_seen = 0
+
+    def update(self, chunk: pd.DataFrame, label_col: str = LABEL_COL) -> None:
+        """Feed one chunk of rows; non-numeric cells ('bd') are skipped."""
+        seqs = np.fromiter(self._rows, dtype=np.int64, count=len(chunk)) if len(chunk) else np.zeros(0, int)
+        labels = chunk[label_col].tolist()
+        index = chunk.index.tolist()
+        self.rows_seen += len(chunk)
+        for column in self.columns:
+            values = pd.to_numeric(chunk[column], errors="coerce").to_numpy(dtype=float)
+            valid = np.flatnonzero(~np.isnan(values))
+            missing = self._missing[column]
+            if len(missing) < self.n:
+                missing.extend(
+                    (index[i], labels[i]) for i in np.flatnonzero(np.isnan(values))[: self.n - len(missing)]
+                )
+            self._total[column] += float(values[valid].sum())
+            heap = self._heaps[column]
+            # Rows that cannot beat the current n-th largest never touch the heap.
+            if len(heap) == self.n:
+                floor = heap[0][0]
+                candidates = valid[values[valid] >= floor]
+                self._other[column] += float(values[valid[values[valid] < floor]].sum())
+            else:
+                candidates = valid
+            for i in candidates.tolist():
+                item = (values[i], -int(seqs[i]), index[i], labels[i])
+                if len(heap) < self.n:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    self._other[column] += heapq.heappushpop(heap, item)[0]
+                else:
+                    self._other[column] += item[0]
+
+    def top(self, column: str = SHARE_COL, label_col: str = LABEL_COL) -> pd.DataFrame:
+        """The largest rows, descending, indexed like the input rows."""
+        ranked = sorted(self._heaps[column], key=lambda item: (-item[0], -item[1]))
+        rows = [(item[2], item[3], item[0]) for item in ranked]
+        rows += [(i, label, np.nan) for i, label in self._missing[column][: self.n - len(rows)]]
+        return pd.DataFrame(
+            {label_col: [row[1] for row in rows], column: [row[2] for row in rows]},
+            index=[row[0] for row in rows],
+        )
+
+    def other(self, column: str = SHARE_COL) -> float:
+        """Sum of every valid value outside the top rows."""
+        return self._other[column]
+
+    def total(self, column: str = SHARE_COL) -> float:
+        return self._total[column]
+
+    def segments(self, column: str = SHARE_COL, label_col: str = LABEL_COL) -> pd.DataFrame:
+        """Top rows plus an 'Other sectors' row when the remainder is positive."""
+        segments = self.top(column, label_col)
+        other = self.other(column)
+        if other > 0:
+            segments = pd.concat(
+                [segments, pd.DataFrame({label_col: [OTHER_LABEL], column: [other]})],
+                ignore_index=True,
+            )
+        return segments.reset_index(drop=True)
+
+    def shares(self, label_col: str = LABEL_COL) -> pd.DataFrame:
+        """
+        Long table of every column's top rows and remainder with their
+        percentage of the column total (for value columns such as years).
+        """
+        frames = []
+        for column in self.columns:
+            segments = self.segments(column, label_col).rename(columns={column: "value"})
+            total = self._total[column]
+            segments.insert(0, "column", column)
+            segments["rank"] = np.arange(1, len(segments) + 1)
+            segments["share"] = segments["value"] / total * 100 if total else np.nan
+            frames.append(segments)
+        return pd.concat(frames, ignore_index=True)
+
+
+def code_level(label) -> str | None:
+    """Hierarchy level of a '<code> <name>' label, e.g. '01.7 Łowiectwo ...' -> 'group'."""
+    parts = str(label).split(maxsplit=1)
+    parsed = canonical_code(parts[0]) if parts else None
+    return parsed[0] if parsed else None
+
+
+def filter_level(chunk: pd.DataFrame, level: str | None, label_col: str = LABEL_COL) -> pd.DataFrame:
+    """Rows of one PKD hierarchy level; all rows when `level` is None."""
+    if level is None:
+        return chunk
+    if level not in LEVELS:
+        raise ValueError(f"Unknown PKD level '{level}'; expected one of {LEVELS}.")
+    return chunk[chunk[label_col].map(code_level) == level]
+
+
+def iter_chunks(path: Path, chunksize: int = DEFAULT_CHUNKSIZE, **kwargs) -> Iterator[pd.DataFrame]:
+    """
+    Row chunks of a CSV or first-sheet Excel file without loading it whole;
+    Excel rows are streamed through openpyxl's read-only mode. Index labels
+    continue across chunks, as if the file had been read in one go.
+    """
+    path = Path(path)
+    if path.suffix.lower() == ".csv":
+        yield from pd.read_csv(path, chunksize=chunksize, **kwargs)
+        return
+
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = list(next(rows, ()))
+        start, buffer = 0, []
+        for row in rows:
+            buffer.append(row)
+            if len(buffer) == chunksize:
+                yield pd.DataFrame(buffer, columns=header, index=pd.RangeIndex(start, start + len(buffer)))
+                start += len(buffer)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=header, index=pd.RangeIndex(start, start + len(buffer)))
+    finally:
+        workbook.close()
+
+
+def stream_top_shares(
+    chunks: Iterable[pd.DataFrame],
+    n: int,
+    columns=(SHARE_COL,),
+    level: str | None = None,
+    label_col: str = LABEL_COL,
+) -> TopShares:
+    """One pass over `chunks` for every value column (e.g. several years) at once."""
+    aggregator = TopShares(n, columns)
+    for chunk in chunks:
+        aggregator.update(filter_level(chunk, level, label_col), label_col)
+    return aggregator
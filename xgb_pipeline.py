@@ -0,0 +1,535 @@
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import xgboost
+from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+from sklearn.multioutput import MultiOutputRegressor
+from xgboost import XGBRegressor
+
+from data_cache import read_csv
+from feature_store import LEVEL, FeatureStore, load_store
+from model_registry import ModelRegistry, fingerprint
+
+
+BASE_DIR = Path(__file__).parent
+DATA_DIR = BASE_DIR / "data"
+PKD_TO_VARS_PATH = BASE_DIR / "pkd_to_variables.json"
+COMMODITIES_PATH = DATA_DIR / "COMMODITIES_FINAL.xlsx"
+TARGETS_PATH = DATA_DIR / "df_pivot_filtered_numbers.csv"
+EVAL_OUTPUT_PATH = DATA_DIR / "xgb_evaluation_results.csv"
+FORECAST_OUTPUT_PATH = DATA_DIR / "xgb_forecasts_2025_2027.csv"
+TUNED_PARAMS_PATH = DATA_DIR / "xgb_tuned_params.json"
+PARTS_DIR = BASE_DIR / ".cache" / "xgb_forecasts"
+
+YEAR_COL = "year"
+TRAIN_START = 2012
+TRAIN_END = 2022  # inclusive
+TEST_START = 2023  # inclusive
+TEST_END = 2024  # inclusive
+FORECAST_YEARS = [2025, 2026, 2027]
+
+EVAL_COLUMNS = [
+    "pkd_code",
+    "target",
+    "n_train",
+    "n_test",
+    "mae",
+    "rmse",
+    "r2",
+    "n_features_used",
+    "missing_features",
+]
+
+# Set per worker process by `_init_worker`, so each job only ships its PKD code.
+_WORKER_DATA: dict = {}
+# Thread-pool sizes OpenMP/BLAS read once at load time; see `worker_pool`.
+THREAD_LIMIT_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+
+
+def load_pkd_to_vars(path: Path = PKD_TO_VARS_PATH) -> dict[str, list[str]]:
+    """Mapping from PKD code to the commodity columns used as its features."""
+    with open(path, "r", encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def load_commodities(path: Path = COMMODITIES_PATH, transforms=(LEVEL,)) -> pd.DataFrame:
+    """
+    Load the commodity drivers sorted by year, with text columns such as
+    'It zarobki' ('5 900,26') coerced to floats, from the feature store.
+    Extra `transforms` ('lag1', 'diff1', 'roll3', ...) add those variants
+    of every driver as '<driver>__<transform>' columns.
+    """
+    return load_store(path, transforms).commodities(transforms)
+
+
+def load_targets(path: Path = TARGETS_PATH) -> pd.DataFrame:
+    """Load the wide '<PKD>_<metric>' target table sorted by year."""
+    df_target = read_csv(path).copy()
+    df_target[YEAR_COL] = df_target[YEAR_COL].astype(int)
+    return df_target.sort_values(YEAR_COL).reset_index(drop=True)
+
+
+def get_target_columns_for_pkd(pkd_code: str, df_target: pd.DataFrame) -> list[str]:
+    """Target columns of a PKD, i.e. those named '<PKD>_<metric>'."""
+    prefix = f"{pkd_code}_"
+    return [c for c in df_target.columns if c.startswith(prefix)]
+
+
+def prepare_pkd_dataset(
+    pkd_code: str,
+    store: FeatureStore,
+    df_target: pd.DataFrame,
+    pkd_to_vars: dict[str, list[str]],
+    transforms=(LEVEL,),
+) -> tuple[pd.DataFrame | None, list[str], list[str], list[str]]:
+    """
+    One PKD's targets next to its commodity features (the `transforms`
+    variants of its mapped drivers) for every year both cover, sliced from
+    the store's per-PKD view.
+
+    Returns (df_merged, feature_cols, target_cols, missing_features);
+    df_merged is None when the PKD has no usable features or targets.
+    """
+    view = store.view(pkd_code, pkd_to_vars, transforms)
+    feature_cols, missing_features = view.feature_cols, view.missing
+    target_cols = get_target_columns_for_pkd(pkd_code, df_target)
+
+    if not feature_cols:
+        print(f"[WARN] PKD {pkd_code}: no available commodity features. Skipping.")
+        return None, [], [], missing_features
+
+    if not target_cols:
+        print(f"[WARN] PKD {pkd_code}: no target columns found. Skipping.")
+        return None, feature_cols, [], missing_features
+
+    df_t = df_target[[YEAR_COL] + target_cols]
+    df_t = df_t[store.contains(df_t[YEAR_COL])].sort_values(YEAR_COL).reset_index(drop=True)
+    df_c = pd.DataFrame(view.matrix(df_t[YEAR_COL]), columns=feature_cols)
+    df_merged = pd.concat([df_t, df_c], axis=1)
+    return df_merged, feature_cols, target_cols, missing_features
+
+
+def time_based_split(
+    df_merged: pd.DataFrame, feature_cols: list[str], target_cols: list[str]
+) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Split into train/test by calendar year, dropping rows where any target
+    is missing.
+    """
+    years = df_merged[YEAR_COL]
+    mask_train = (years >= TRAIN_START) & (years <= TRAIN_END)
+    mask_test = (years >= TEST_START) & (years <= TEST_END)
+
+    X_train = df_merged.loc[mask_train, feature_cols]
+    y_train = df_merged.loc[mask_train, target_cols]
+    X_test = df_merged.loc[mask_test, feature_cols]
+    y_test = df_merged.loc[mask_test, target_cols]
+
+    train_valid = y_train.notna().all(axis=1)
+    test_valid = y_test.notna().all(axis=1)
+    return X_train[train_valid], X_test[test_valid], y_train[train_valid], y_test[test_valid]
+
+
+def make_xgb_model(random_state: int = 42, n_jobs: int = -1, **params) -> XGBRegressor:
+    """
+    Create a base XGBRegressor with reasonable default hyperparameters;
+    keyword `params` (e.g. a PKD's tuned configuration) override them.
+    """
+    defaults = dict(
+        n_estimators=100,
+        max_depth=3,
+        learning_rate=0.05,
+        subsample=0.9,
+        colsample_bytree=0.9,
+        objective="reg:squarederror",
+    )
+    return XGBRegressor(**{**defaults, **params}, n_jobs=n_jobs, random_state=random_state)
+
+
+def load_tuned_params(path: Path = TUNED_PARAMS_PATH) -> dict[str, dict]:
+    """PKD code -> hyperparameters chosen by xgb_tuning.py (empty if never tuned)."""
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as fh:
+        return {pkd: entry["params"] for pkd, entry in json.load(fh).items()}
+
+
+def evaluate_predictions(
+    y_true: pd.DataFrame, y_pred: np.ndarray, target_cols: list[str]
+) -> list[tuple[str, float, float, float]]:
+    """MAE, RMSE and R^2 per target column."""
+    results = []
+    for idx, col in enumerate(target_cols):
+        mae = mean_absolute_error(y_true.iloc[:, idx], y_pred[:, idx])
+        rmse = np.sqrt(mean_squared_error(y_true.iloc[:, idx], y_pred[:, idx]))
+        r2 = r2_score(y_true.iloc[:, idx], y_pred[:, idx])
+        results.append((col, mae, rmse, r2))
+    return results
+
+
+def pkd_fingerprint(
+    df_merged: pd.DataFrame,
+    df_future: pd.DataFrame,
+    feature_cols: list[str],
+    target_cols: list[str],
+    missing_features: list[str],
+    params: dict | None = None,
+) -> str:
+    """
+    Fingerprint of everything one PKD's model and outputs depend on: its
+    merged training/test rows, the forecast-year features, the column
+    lists, the hyperparameters and the split configuration.
+    """
+    params = make_xgb_model(**(params or {})).get_params()
+    params.pop("n_jobs")  # thread count does not change the fitted model
+    config = {
+        "train": [TRAIN_START, TRAIN_END],
+        "test": [TEST_START, TEST_END],
+        "forecast_years": FORECAST_YEARS,
+        "xgboost": xgboost.__version__,
+    }
+    return fingerprint(
+        df_merged,
+        df_future[[YEAR_COL] + feature_cols],
+        feature_cols,
+        target_cols,
+        missing_features,
+        params,
+        config,
+    )
+
+
+def run_pkd(
+    pkd_code: str,
+    store: FeatureStore,
+    df_target: pd.DataFrame,
+    pkd_to_vars: dict[str, list[str]],
+    n_jobs: int = -1,
+    registry: ModelRegistry | None = None,
+    refit: bool = False,
+    tuned_params: dict[str, dict] | None = None,
+    transforms=(LEVEL,),
+) -> tuple[list[dict], pd.DataFrame | None]:
+    """
+    Train, evaluate and forecast one PKD code.
+
+    Returns the evaluation rows (empty if there is no test data) and the
+    forecast frame (year + target columns), or None if the PKD was skipped.
+    With a `registry`, a PKD whose inputs are unchanged since the last fit
+    reuses the stored outputs instead of retraining, unless `refit` is set.
+    PKD codes in `tuned_params` use their tuned hyperparameters.
+    """
+    df_merged, feature_cols, target_cols, missing_features = prepare_pkd_dataset(
+        pkd_code, store, df_target, pkd_to_vars, transforms
+    )
+    if df_merged is None:
+        return [], None
+    if missing_features:
+        print(f"[INFO] Missing feature columns for {pkd_code} (ignored): {missing_features}")
+
+    df_future = store.view(pkd_code, pkd_to_vars, transforms).frame(FORECAST_YEARS)
+    params = (tuned_params or {}).get(pkd_code, {})
+    fp = None
+    if registry is not None:
+        fp = pkd_fingerprint(df_merged, df_future, feature_cols, target_cols, missing_features, params)
+        entry = None if refit else registry.load(pkd_code, fp)
+        if entry is not None:
+            print(f"PKD {pkd_code}: inputs unchanged, reusing cached model.")
+            return entry["eval_rows"], entry["forecast"]
+
+    X_train, X_test, y_train, y_test = time_based_split(df_merged, feature_cols, target_cols)
+    if X_train.empty or y_train.empty:
+        print(f"[WARN] PKD {pkd_code}: empty training set, skipping.")
+        return [], None
+
+    # NumPy arrays so XGBoost does not see pandas column names.
+    model = MultiOutputRegressor(make_xgb_model(random_state=42, n_jobs=n_jobs, **params))
+    model.fit(X_train.to_numpy(), y_train.to_numpy())
+
+    eval_rows = []
+    if not X_test.empty and not y_test.empty:
+        y_pred_test = model.predict(X_test.to_numpy())
+        for target_name, mae, rmse, r2 in evaluate_predictions(y_test, y_pred_test, target_cols):
+            eval_rows.append(
+                {
+                    "pkd_code": pkd_code,
+                    "target": target_name,
+                    "n_train": len(X_train),
+                    "n_test": len(X_test),
+                    "mae": mae,
+                    "rmse": rmse,
+                    "r2": r2,
+                    "n_features_used": len(feature_cols),
+                    "missing_features": ";".join(missing_features),
+                }
+            )
+    else:
+        print(f"[INFO] PKD {pkd_code}: no valid test data for evaluation.")
+
+    forecast = None
+    if df_future.empty:
+        print(f"[WARN] PKD {pkd_code}: no commodity data for forecast years, skipping forecast.")
+    else:
+        forecast = pd.DataFrame(
+            model.predict(df_future[feature_cols].to_numpy()), columns=target_cols
+        )
+        forecast.insert(0, YEAR_COL, df_future[YEAR_COL].to_numpy())
+
+    if registry is not None:
+        registry.save(pkd_code, fp, model=model, eval_rows=eval_rows, forecast=forecast)
+    return eval_rows, forecast
+
+
+def threads_per_job(workers: int) -> int:
+    """Split the machine's cores evenly between the worker processes."""
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def _start_worker(initializer, initargs: tuple) -> None:
+    # Workers exit without flushing; keep their progress lines.
+    sys.stdout.reconfigure(line_buffering=True)
+    initializer(*initargs)
+
+
+@contextmanager
+def worker_pool(workers: int, n_threads: int, initializer, initargs: tuple = ()):
+    """
+    Process pool of `workers` spawned processes running `initializer`, with
+    OpenMP/BLAS pools capped at `n_threads` each (XGBoost's own threads are
+    set through n_jobs/nthread). The limits only take effect when those
+    libraries load, so they are exported before the workers start and the
+    parent's environment is restored on exit.
+    """
+    saved = {var: os.environ.get(var) for var in THREAD_LIMIT_VARS}
+    os.environ.update(dict.fromkeys(THREAD_LIMIT_VARS, str(n_threads)))
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_start_worker,
+            initargs=(initializer, initargs),
+        ) as pool:
+            yield pool
+    finally:
+        for var, value in saved.items():
+            if value is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = value
+
+
+def _init_worker(
+    store: FeatureStore,
+    df_target: pd.DataFrame,
+    pkd_to_vars: dict[str, list[str]],
+    n_threads: int,
+    registry: ModelRegistry | None,
+    refit: bool,
+    tuned_params: dict[str, dict] | None = None,
+    transforms=(LEVEL,),
+) -> None:
+    _WORKER_DATA.update(
+        store=store,
+        df_target=df_target,
+        pkd_to_vars=pkd_to_vars,
+        n_jobs=n_threads,
+        registry=registry,
+        refit=refit,
+        tuned_params=tuned_params,
+        transforms=transforms,
+    )
+
+
+def _run_pkd_in_worker(pkd_code: str) -> tuple[str, list[dict], pd.DataFrame | None]:
+    eval_rows, forecast = run_pkd(pkd_code, **_WORKER_DATA)
+    return pkd_code, eval_rows, forecast
+
+
+def _part_path(parts_dir: Path, pkd_code: str) -> Path:
+    return parts_dir / f"{pkd_code}.csv"
+
+
+def assemble_forecasts(forecasts: dict[str, pd.DataFrame], pkd_codes: list[str]) -> pd.DataFrame:
+    """Merge per-PKD forecasts into one wide frame, PKDs in `pkd_codes` order."""
+    forecast_df = pd.DataFrame({YEAR_COL: FORECAST_YEARS})
+    for pkd_code in pkd_codes:
+        if pkd_code in forecasts:
+            forecast_df = forecast_df.merge(forecasts[pkd_code], on=YEAR_COL, how="left")
+    return forecast_df
+
+
+def run_pipeline(
+    pkd_codes: list[str] | None = None,
+    workers: int | None = None,
+    eval_path: Path = EVAL_OUTPUT_PATH,
+    forecast_path: Path = FORECAST_OUTPUT_PATH,
+    parts_dir: Path = PARTS_DIR,
+    registry: ModelRegistry | None = None,
+    refit_all: bool = False,
+    tuned_params: dict[str, dict] | None = None,
+    transforms=(LEVEL,),
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Train, evaluate and forecast every PKD code across a process pool.
+
+    Each finished PKD appends its metrics to `eval_path` and writes its
+    forecast to `parts_dir/<pkd>.csv` straight away, so partial results
+    survive an interrupted run. When all jobs are done both outputs are
+    rewritten in sorted PKD order, matching a serial run.
+
+    With a `registry`, only PKD codes whose inputs changed are retrained
+    (all of them if `refit_all`); the rest reuse their cached outputs.
+    `tuned_params` (see `load_tuned_params`) replaces the default
+    hyperparameters per PKD code. `transforms` picks the driver variants
+    from the feature store each PKD is trained on (same-year levels only
+    by default).
+    """
+    pkd_to_vars = load_pkd_to_vars()
+    store = load_store(transforms=transforms)
+    df_target = load_targets()
+    pkd_codes = sorted(pkd_codes if pkd_codes is not None else pkd_to_vars)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(pkd_codes) or 1))
+    n_threads = threads_per_job(workers)
+
+    print(f"Features: {store!r}; targets shape: {df_target.shape}")
+    print(f"Training {len(pkd_codes)} PKD codes on {workers} workers x {n_threads} threads.")
+
+    eval_path.parent.mkdir(parents=True, exist_ok=True)
+    parts_dir.mkdir(parents=True, exist_ok=True)
+    pd.DataFrame(columns=EVAL_COLUMNS).to_csv(eval_path, index=False)
+
+    eval_by_pkd: dict[str, list[dict]] = {}
+    forecasts: dict[str, pd.DataFrame] = {}
+
+    def collect(pkd_code: str, eval_rows: list[dict], forecast: pd.DataFrame | None) -> None:
+        eval_by_pkd[pkd_code] = eval_rows
+        if eval_rows:
+            pd.DataFrame(eval_rows, columns=EVAL_COLUMNS).to_csv(
+                eval_path, mode="a", header=False, index=False
+            )
+        if forecast is not None:
+            forecasts[pkd_code] = forecast
+            forecast.to_csv(_part_path(parts_dir, pkd_code), index=False)
+        print(f"PKD {pkd_code}: {len(eval_rows)} targets evaluated "
+              f"({len(eval_by_pkd)}/{len(pkd_codes)} done).")
+
+    if workers == 1:
+        for pkd_code in pkd_codes:
+            collect(
+                pkd_code,
+                *run_pkd(
+                    pkd_code,
+                    store,
+                    df_target,
+                    pkd_to_vars,
+                    n_jobs=n_threads,
+                    registry=registry,
+                    refit=refit_all,
+                    tuned_params=tuned_params,
+                    transforms=transforms,
+                ),
+            )
+    else:
+        with worker_pool(
+            workers,
+            n_threads,
+            _init_worker,
+            (store, df_target, pkd_to_vars, n_threads, registry, refit_all, tuned_params, transforms),
+        ) as pool:
+            futures = [pool.submit(_run_pkd_in_worker, pkd_code) for pkd_code in pkd_codes]
+            for future in as_completed(futures):
+                collect(*future.result())
+
+    rows = [row for pkd_code in pkd_codes for row in eval_by_pkd.get(pkd_code, [])]
+    eval_df = pd.DataFrame(rows, columns=EVAL_COLUMNS)
+    forecast_df = assemble_forecasts(forecasts, pkd_codes)
+
+    if eval_df.empty:
+        print("[INFO] No evaluation results to save.")
+    eval_df.to_csv(eval_path, index=False)
+    print(f"Saved evaluation results to: {eval_path.resolve()}")
+    forecast_path.parent.mkdir(parents=True, exist_ok=True)
+    forecast_df.to_csv(forecast_path, index=False)
+    print(f"Saved forecasts to: {forecast_path.resolve()}")
+    return eval_df, forecast_df
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Per-PKD XGBoost training, evaluation and 2025-2027 forecasts."
+    )
+    parser.add_argument(
+        "--pkd",
+        nargs="+",
+        default=None,
+        help="PKD codes to run (default: every code in pkd_to_variables.json).",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Worker processes (default: one per core; 1 runs in-process).",
+    )
+    parser.add_argument(
+        "--eval-path",
+        type=Path,
+        default=EVAL_OUTPUT_PATH,
+        help="Path where the evaluation CSV will be saved.",
+    )
+    parser.add_argument(
+        "--forecast-path",
+        type=Path,
+        default=FORECAST_OUTPUT_PATH,
+        help="Path where the wide forecast CSV will be saved.",
+    )
+    parser.add_argument(
+        "--refit-all",
+        action="store_true",
+        help="Retrain every PKD even if its inputs match the cached model.",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not read or write the model registry.",
+    )
+    parser.add_argument(
+        "--tuned",
+        action="store_true",
+        help=f"Use the per-PKD hyperparameters in {TUNED_PARAMS_PATH.name} (see xgb_tuning.py).",
+    )
+    parser.add_argument(
+        "--features",
+        nargs="+",
+        default=[],
+        metavar="TRANSFORM",
+        help="Driver variants added to the same-year levels, e.g. lag1 diff1 roll3 (see feature_store.py).",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    run_pipeline(
+        pkd_codes=args.pkd,
+        workers=args.workers,
+        eval_path=args.eval_path,
+        forecast_path=args.forecast_path,
+        registry=None if args.no_cache else ModelRegistry("xgb"),
+        refit_all=args.refit_all,
+        tuned_params=load_tuned_params() if args.tuned else None,
+        transforms=(LEVEL, *args.features),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,372 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+from concurrent.futures import as_completed
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import xgboost
+
+from charts import ChartSpec, render_all
+from feature_store import FeatureStore, load_store
+from model_registry import ModelRegistry
+from xgb_pipeline import (
+    FORECAST_YEARS,
+    TRAIN_START,
+    YEAR_COL,
+    load_pkd_to_vars,
+    load_targets,
+    load_tuned_params,
+    pkd_fingerprint,
+    prepare_pkd_dataset,
+    run_pkd,
+    threads_per_job,
+    worker_pool,
+)
+
+
+BASE_DIR = Path(__file__).parent
+DATA_DIR = BASE_DIR / "data"
+SHAP_PATH = DATA_DIR / "xgb_shap.npz"
+GLOBAL_RANKING_PATH = DATA_DIR / "xgb_shap_global.csv"
+SECTOR_RANKING_PATH = DATA_DIR / "xgb_shap_by_pkd.csv"
+DRIVERS_PATH = DATA_DIR / "xgb_shap_drivers.json"
+CHART_DIR = BASE_DIR / "charts" / "shap"
+CHART_MANIFEST_PATH = BASE_DIR / ".cache" / "charts_shap.json"
+# Every year the commodity sheet covers from the first training year on,
+# i.e. the fitted, test and forecast years.
+YEARS = list(range(TRAIN_START, FORECAST_YEARS[-1] + 1))
+TOP_DRIVERS = 10
+
+# Set per worker process by `_init_worker`, so each job only ships its PKD code.
+_WORKER_DATA: dict = {}
+
+
+@dataclass
+class Attributions:
+    """
+    TreeSHAP contributions of every PKD model: `values[p, m, y, f]` is the
+    float32 contribution of feature `features[f]` to the prediction of
+    metric `metrics[m]` of PKD `pkds[p]` in `years[y]`, and `bias[p, m, y]`
+    the model's expected value. NaN marks features a PKD does not use and
+    (PKD, metric) pairs without a model, so `bias + nansum(values, -1)` is
+    the model prediction wherever there is one.
+    """
+
+    pkds: np.ndarray
+    metrics: np.ndarray
+    years: np.ndarray
+    features: np.ndarray
+    values: np.ndarray
+    bias: np.ndarray
+
+    def save(self, path: Path = SHAP_PATH) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(
+            path,
+            pkds=self.pkds,
+            metrics=self.metrics,
+            years=self.years,
+            features=self.features,
+            values=self.values,
+            bias=self.bias,
+        )
+
+    @classmethod
+    def load(cls, path: Path = SHAP_PATH) -> Attributions:
+        with np.load(path, allow_pickle=False) as data:
+            return cls(**{name: data[name] for name in cls.__dataclass_fields__})
+
+    def __repr__(self) -> str:
+        shape = " x ".join(str(n) for n in self.values.shape)
+        return f"Attributions(pkd x metric x year x feature = {shape})"
+
+    def prediction(self) -> np.ndarray:
+        """(pkd, metric, year) model predictions recovered from the contributions."""
+        return self.bias + np.nansum(self.values, axis=-1)
+
+    def _year_mask(self, years) -> np.ndarray:
+        if years is None:
+            return np.ones(len(self.years), dtype=bool)
+        return np.isin(self.years, list(years))
+
+    def importance(self, years=None) -> np.ndarray:
+        """
+        (pkd, metric, feature) mean |SHAP| over `years`, as a share of the
+        model's total so that metrics on different scales (revenue in PLN,
+        ratios) weigh the same when averaged.
+        """
+        mean_abs = np.abs(self.values[:, :, self._year_mask(years)]).mean(axis=2)
+        total = np.nansum(mean_abs, axis=-1, keepdims=True)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(total > 0, mean_abs / total, np.nan)
+
+    def driver_ranking(self, pkd: str | None = None, metric: str | None = None, years=None) -> pd.DataFrame:
+        """Features by average importance share, over all PKDs/metrics or one of each."""
+        share = self.importance(years)
+        if pkd is not None:
+            share = share[np.flatnonzero(self.pkds == pkd)]
+        if metric is not None:
+            share = share[:, np.flatnonzero(self.metrics == metric)]
+        flat = share.reshape(-1, len(self.features))
+        used = ~np.isnan(flat)
+        counts = used.sum(axis=0)
+        keep = counts > 0
+        mean = np.where(used, flat, 0).sum(axis=0)[keep] / counts[keep]
+        ranking = pd.DataFrame({"feature": self.features[keep], "importance": mean, "models": counts[keep]})
+        ranking = ranking.sort_values(["importance", "feature"], ascending=[False, True], ignore_index=True)
+        ranking["rank"] = np.arange(1, len(ranking) + 1)
+        return ranking
+
+    def sector_rankings(self, years=None) -> pd.DataFrame:
+        """Long (pkd, feature, importance, rank) table: each PKD's drivers averaged over its metrics."""
+        share = self.importance(years)
+        used = ~np.isnan(share)
+        counts = used.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(used, share, 0).sum(axis=1) / counts
+        p, f = np.nonzero(counts > 0)
+        ranking = pd.DataFrame({"pkd": self.pkds[p], "feature": self.features[f], "importance": mean[p, f]})
+        ranking = ranking.sort_values(
+            ["pkd", "importance", "feature"], ascending=[True, False, True], ignore_index=True
+        )
+        ranking["rank"] = ranking.groupby("pkd", sort=False).cumcount() + 1
+        return ranking
+
+
+def pkd_contributions(
+    pkd_code: str,
+    store: FeatureStore,
+    df_target: pd.DataFrame,
+    pkd_to_vars: dict[str, list[str]],
+    n_jobs: int = -1,
+    registry: ModelRegistry | None = None,
+    tuned_params: dict[str, dict] | None = None,
+) -> dict | None:
+    """
+    TreeSHAP contributions of one PKD's models for every year in YEARS,
+    from XGBoost's native `pred_contribs` (one call per target, all years
+    at once). The model comes from the registry; a PKD whose inputs
+    changed since the last fit is refitted (and stored) first. Pass the
+    same `tuned_params` the pipeline ran with to explain tuned models.
+    """
+    registry = registry or ModelRegistry("xgb")
+    df_merged, feature_cols, target_cols, missing_features = prepare_pkd_dataset(
+        pkd_code, store, df_target, pkd_to_vars
+    )
+    if df_merged is None:
+        return None
+    view = store.view(pkd_code, pkd_to_vars)
+    df_future = view.frame(FORECAST_YEARS)
+    params = (tuned_params or {}).get(pkd_code, {})
+    fp = pkd_fingerprint(df_merged, df_future, feature_cols, target_cols, missing_features, params)
+    entry = registry.load(pkd_code, fp)
+    if entry is None:
+        run_pkd(
+            pkd_code, store, df_target, pkd_to_vars, n_jobs=n_jobs, registry=registry, tuned_params=tuned_params
+        )
+        entry = registry.load(pkd_code, fp)
+    if entry is None or entry.get("model") is None:
+        print(f"[WARN] PKD {pkd_code}: no fitted model, skipping.")
+        return None
+
+    rows = view.frame(YEARS)
+    matrix = xgboost.DMatrix(rows[feature_cols].to_numpy())
+    contribs = []
+    for estimator in entry["model"].estimators_:
+        booster = estimator.get_booster()
+        booster.set_param({"nthread": n_jobs})
+        contribs.append(booster.predict(matrix, pred_contribs=True))
+    prefix = f"{pkd_code}_"
+    return {
+        "pkd": pkd_code,
+        "metrics": [c[len(prefix):] for c in target_cols],
+        "years": rows[YEAR_COL].tolist(),
+        "features": feature_cols,
+        # (target, year, feature + bias)
+        "contribs": np.stack(contribs).astype(np.float32),
+    }
+
+
+def assemble(results: list[dict]) -> Attributions:
+    """Scatter per-PKD contribution blocks into one padded (pkd, metric, year, feature) array."""
+    pkds = sorted(r["pkd"] for r in results)
+    metrics = list(dict.fromkeys(m for r in results for m in r["metrics"]))
+    features = sorted({f for r in results for f in r["features"]})
+    values = np.full((len(pkds), len(metrics), len(YEARS), len(features)), np.nan, dtype=np.float32)
+    bias = np.full(values.shape[:3], np.nan, dtype=np.float32)
+    for r in results:
+        p = pkds.index(r["pkd"])
+        m = pd.Index(metrics).get_indexer(r["metrics"])
+        y = pd.Index(YEARS).get_indexer(r["years"])
+        f = pd.Index(features).get_indexer(r["features"])
+        block = r["contribs"]
+        values[p, m[:, None, None], y[None, :, None], f[None, None, :]] = block[:, :, :-1]
+        bias[p, m[:, None], y[None, :]] = block[:, :, -1]
+    return Attributions(
+        pkds=np.array(pkds),
+        metrics=np.array(metrics),
+        years=np.array(YEARS),
+        features=np.array(features),
+        values=values,
+        bias=bias,
+    )
+
+
+def _init_worker(
+    store: FeatureStore,
+    df_target: pd.DataFrame,
+    pkd_to_vars: dict[str, list[str]],
+    n_threads: int,
+    registry: ModelRegistry,
+    tuned_params: dict[str, dict] | None = None,
+) -> None:
+    _WORKER_DATA.update(
+        store=store,
+        df_target=df_target,
+        pkd_to_vars=pkd_to_vars,
+        n_jobs=n_threads,
+        registry=registry,
+        tuned_params=tuned_params,
+    )
+
+
+def _contributions_in_worker(pkd_code: str) -> dict | None:
+    return pkd_contributions(pkd_code, **_WORKER_DATA)
+
+
+def compute_attributions(
+    pkd_codes: list[str] | None = None,
+    workers: int | None = None,
+    registry: ModelRegistry | None = None,
+    tuned_params: dict[str, dict] | None = None,
+) -> Attributions:
+    """Contributions of every PKD model across a process pool, assembled into one array."""
+    pkd_to_vars = load_pkd_to_vars()
+    store = load_store()
+    df_target = load_targets()
+    registry = registry or ModelRegistry("xgb")
+    pkd_codes = sorted(pkd_codes if pkd_codes is not None else pkd_to_vars)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(pkd_codes) or 1))
+    n_threads = threads_per_job(workers)
+    print(f"Explaining {len(pkd_codes)} PKD models on {workers} workers x {n_threads} threads.")
+
+    if workers == 1:
+        results = [
+            pkd_contributions(
+                pkd_code,
+                store,
+                df_target,
+                pkd_to_vars,
+                n_jobs=n_threads,
+                registry=registry,
+                tuned_params=tuned_params,
+            )
+            for pkd_code in pkd_codes
+        ]
+    else:
+        with worker_pool(
+            workers, n_threads, _init_worker, (store, df_target, pkd_to_vars, n_threads, registry, tuned_params)
+        ) as pool:
+            futures = [pool.submit(_contributions_in_worker, pkd_code) for pkd_code in pkd_codes]
+            results = [future.result() for future in as_completed(futures)]
+    results = [r for r in results if r is not None]
+    if not results:
+        raise SystemExit("No PKD model to explain.")
+    return assemble(results)
+
+
+def drivers_payload(attributions: Attributions, top: int = TOP_DRIVERS) -> dict:
+    """Top drivers overall and per PKD, in a form the dashboard can fetch as is."""
+    sectors = attributions.sector_rankings()
+    sectors = sectors[sectors["rank"] <= top]
+    return {
+        "years": attributions.years.tolist(),
+        "global": attributions.driver_ranking().head(top)[["feature", "importance"]].round(4).to_dict("records"),
+        "sectors": {
+            pkd: group[["feature", "importance"]].round(4).to_dict("records")
+            for pkd, group in sectors.groupby("pkd", sort=True)
+        },
+    }
+
+
+def summary_specs(attributions: Attributions, out_dir: Path = CHART_DIR, top: int = 20) -> list[ChartSpec]:
+    """shap1.png-style bar summaries: overall and one per PKD."""
+
+    def spec(ranking: pd.DataFrame, name: str, title: str) -> ChartSpec:
+        ranking = ranking.head(top)
+        return ChartSpec(
+            "bars",
+            str(out_dir / f"{name}.png"),
+            {"labels": ranking["feature"].tolist(), "values": (ranking["importance"] * 100).round(4).tolist()},
+            {"title": title, "xlabel": "Share of mean |SHAP value| (%)"},
+        )
+
+    specs = [spec(attributions.driver_ranking(), "global", "Drivers across all PKD models")]
+    sectors = attributions.sector_rankings()
+    for pkd, ranking in sectors.groupby("pkd", sort=True):
+        specs.append(spec(ranking, f"pkd_{pkd}", f"PKD {pkd}: drivers across targets"))
+    return specs
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="TreeSHAP attributions of the per-PKD XGBoost models and their driver rankings."
+    )
+    parser.add_argument(
+        "--pkd",
+        nargs="+",
+        default=None,
+        help="PKD codes to explain (default: every code in pkd_to_variables.json).",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Worker processes (default: one per core; 1 runs in-process).",
+    )
+    parser.add_argument("--output", type=Path, default=SHAP_PATH, help="Attribution array (.npz).")
+    parser.add_argument(
+        "--tuned",
+        action="store_true",
+        help="Explain the models fitted with the tuned hyperparameters (xgb_pipeline.py --tuned).",
+    )
+    parser.add_argument("--top", type=int, default=TOP_DRIVERS, help="Drivers per PKD in the dashboard JSON.")
+    parser.add_argument(
+        "--plot",
+        action="store_true",
+        help=f"Also draw bar summaries into {CHART_DIR.relative_to(BASE_DIR)}/.",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    attributions = compute_attributions(
+        args.pkd, args.workers, tuned_params=load_tuned_params() if args.tuned else None
+    )
+    attributions.save(args.output)
+    print(f"Saved {attributions} to: {args.output.resolve()}")
+
+    attributions.driver_ranking().to_csv(GLOBAL_RANKING_PATH, index=False)
+    attributions.sector_rankings().to_csv(SECTOR_RANKING_PATH, index=False)
+    DRIVERS_PATH.write_text(
+        json.dumps(drivers_payload(attributions, args.top), ensure_ascii=False, indent=2) + "\n",
+        encoding="utf-8",
+    )
+    print(f"Saved driver rankings to: {GLOBAL_RANKING_PATH.resolve()}, {SECTOR_RANKING_PATH.resolve()}")
+    print(f"Saved dashboard drivers to: {DRIVERS_PATH.resolve()}")
+
+    if args.plot:
+        rendered, up_to_date = render_all(
+            summary_specs(attributions), args.workers, manifest_path=CHART_MANIFEST_PATH
+        )
+        print(f"Charts: {rendered} rendered, {up_to_date} up to date.")
+
+
+if __name__ == "__main__":
+    main()
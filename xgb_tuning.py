@@ -0,0 +1,381 @@
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import math
+import os
+import time
+from contextlib import ExitStack
+from pathlib import Path
+
+import numpy as np
+import xgboost
+
+from backtest import PKDMatrices, build_matrices
+from feature_store import load_store
+from model_registry import ModelRegistry, fingerprint
+from xgb_pipeline import (
+    TRAIN_END,
+    TUNED_PARAMS_PATH,
+    load_pkd_to_vars,
+    load_targets,
+    make_xgb_model,
+    threads_per_job,
+    worker_pool,
+)
+
+
+SEARCH_SPACE = {
+    "max_depth": [2, 3, 4, 6],
+    "learning_rate": [0.02, 0.05, 0.1, 0.2],
+    "subsample": [0.7, 0.9, 1.0],
+    "colsample_bytree": [0.6, 0.9, 1.0],
+    "min_child_weight": [1, 2, 4],
+    "reg_lambda": [0.1, 1.0, 10.0],
+}
+# make_xgb_model's defaults, always in the first rung and the reference score.
+BASELINE = {
+    "max_depth": 3,
+    "learning_rate": 0.05,
+    "subsample": 0.9,
+    "colsample_bytree": 0.9,
+    "min_child_weight": 1,
+    "reg_lambda": 1.0,
+}
+BASELINE_ROUNDS = make_xgb_model().get_params()["n_estimators"]
+DEFAULT_CANDIDATES = 16
+MIN_ROUNDS = 25
+MAX_ROUNDS = 400
+HALVING = 2
+DEFAULT_FOLDS = 3
+MIN_TRAIN = 4
+SEED = 42
+
+# Set per worker process by `_init_worker`; jobs only ship (pkd, candidate, rounds).
+_WORKER_DATA: dict = {}
+
+
+def rung_rounds(min_rounds: int = MIN_ROUNDS, max_rounds: int = MAX_ROUNDS, halving: int = HALVING) -> list[int]:
+    """Boosting rounds per rung: min_rounds, x halving, ... up to max_rounds."""
+    rounds = [min_rounds]
+    while rounds[-1] * halving <= max_rounds:
+        rounds.append(rounds[-1] * halving)
+    return rounds
+
+
+def sample_candidates(n: int, seed: int = SEED) -> list[dict]:
+    """The baseline plus `n - 1` distinct random points of SEARCH_SPACE."""
+    keys = list(SEARCH_SPACE)
+    grid = [dict(zip(keys, values)) for values in itertools.product(*SEARCH_SPACE.values())]
+    grid = [point for point in grid if point != BASELINE]
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(grid), size=min(n - 1, len(grid)), replace=False)
+    return [dict(BASELINE)] + [grid[i] for i in sorted(picks)]
+
+
+def tuning_folds(m: PKDMatrices, n_folds: int = DEFAULT_FOLDS, min_train: int = MIN_TRAIN) -> list[tuple]:
+    """
+    Expanding-window folds inside the training period: each of the last
+    `n_folds` training years is predicted from all years before it. The
+    test years (after TRAIN_END) are never seen while tuning.
+    """
+    years = np.unique(m.years[m.years <= TRAIN_END])
+    folds = []
+    for year in years[-n_folds:]:
+        train, val = m.fold(int(year) - 1, 1)
+        if train.sum() >= min_train and val.any():
+            folds.append((train, val))
+    return folds
+
+
+def evaluate_candidate(
+    m: PKDMatrices,
+    folds: list[tuple],
+    params: dict,
+    rounds: int,
+    checkpoints: list[int],
+    n_jobs: int = 1,
+    seed: int = SEED,
+) -> tuple[float, int]:
+    """
+    Cross-validated error of one configuration trained for `rounds`: the
+    mean absolute error over folds and targets, each target scaled by its
+    training standard deviation so revenue and ratio targets weigh alike.
+    The error is read at every checkpoint <= rounds from the same boosters
+    (early stopping on the validation curve); returns (best error, rounds).
+    """
+    booster_params = {
+        **params,
+        "objective": "reg:squarederror",
+        "nthread": n_jobs,
+        "seed": seed,
+        "verbosity": 0,
+    }
+    checkpoints = [r for r in checkpoints if r <= rounds]
+    errors = np.zeros(len(checkpoints))
+    count = 0
+    for train, val in folds:
+        scale = m.Y[train].std(axis=0)
+        scale[scale == 0] = 1.0
+        x_val = xgboost.DMatrix(m.X[val])
+        for j in range(m.Y.shape[1]):
+            booster = xgboost.train(
+                booster_params, xgboost.DMatrix(m.X[train], label=m.Y[train, j]), num_boost_round=rounds
+            )
+            for c, r in enumerate(checkpoints):
+                pred = booster.predict(x_val, iteration_range=(0, r))
+                errors[c] += np.abs(pred - m.Y[val, j]).sum() / scale[j]
+        count += int(val.sum()) * m.Y.shape[1]
+    if not count:
+        return math.inf, rounds
+    errors /= count
+    best = int(np.argmin(errors))
+    return float(errors[best]), checkpoints[best]
+
+
+def search_fingerprint(m: PKDMatrices, folds: list[tuple], config: dict) -> str:
+    """Training-period data, fold layout and search configuration of one PKD."""
+    rows = m.years <= TRAIN_END
+    return fingerprint(
+        m.years[rows],
+        m.X[rows],
+        m.Y[rows],
+        m.feature_cols,
+        m.target_cols,
+        [[m.years[train].tolist(), m.years[val].tolist()] for train, val in folds],
+        config,
+        xgboost.__version__,
+    )
+
+
+def new_state(candidates: list[dict]) -> dict:
+    return {
+        "candidates": candidates,
+        "rung": 0,
+        "alive": list(range(len(candidates))),
+        "scores": {},  # candidate -> (error, best rounds) at its last rung
+        "baseline": None,
+        "done": False,
+    }
+
+
+def advance(state: dict, results: dict, rungs: list[int], halving: int) -> None:
+    """Record one rung's results and keep the best 1/`halving` of the candidates."""
+    state["scores"].update(results)
+    ranked = sorted(state["alive"], key=lambda i: (state["scores"][i][0], i))
+    last = state["rung"] == len(rungs) - 1
+    keep = ranked[:1] if last else ranked[: max(1, math.ceil(len(ranked) / halving))]
+    state["alive"] = keep
+    state["rung"] += 1
+    state["done"] = last
+
+
+def chosen_config(state: dict) -> dict:
+    """Winner of a finished search, or the baseline when it does no better."""
+    best = state["alive"][0]
+    error, rounds = state["scores"][best]
+    baseline_error = state["baseline"]
+    if baseline_error is not None and baseline_error <= error:
+        return {"params": {}, "cv_error": baseline_error, "baseline_cv_error": baseline_error}
+    return {
+        "params": {**state["candidates"][best], "n_estimators": rounds},
+        "cv_error": error,
+        "baseline_cv_error": baseline_error,
+    }
+
+
+def _init_worker(matrices: dict[str, PKDMatrices], folds: dict, n_threads: int, seed: int) -> None:
+    _WORKER_DATA.update(matrices=matrices, folds=folds, n_jobs=n_threads, seed=seed)
+
+
+def _evaluate_in_worker(task: tuple) -> tuple:
+    pkd_code, key, params, rounds, checkpoints = task
+    error, best_rounds = evaluate_candidate(
+        _WORKER_DATA["matrices"][pkd_code],
+        _WORKER_DATA["folds"][pkd_code],
+        params,
+        rounds,
+        checkpoints,
+        n_jobs=_WORKER_DATA["n_jobs"],
+        seed=_WORKER_DATA["seed"],
+    )
+    return pkd_code, key, error, best_rounds
+
+
+def estimated_rounds(n_candidates: int, rungs: list[int], halving: int, fits: int) -> int:
+    """Boosting rounds one PKD's search costs, `fits` = folds x targets."""
+    total, alive = 0, n_candidates
+    for rounds in rungs:
+        total += alive * rounds * fits
+        alive = max(1, math.ceil(alive / halving))
+    return total + BASELINE_ROUNDS * fits
+
+
+def tune(
+    pkd_codes: list[str] | None = None,
+    workers: int | None = None,
+    n_candidates: int = DEFAULT_CANDIDATES,
+    rungs: list[int] | None = None,
+    halving: int = HALVING,
+    n_folds: int = DEFAULT_FOLDS,
+    seed: int = SEED,
+    time_budget: float | None = None,
+    registry: ModelRegistry | None = None,
+    retune: bool = False,
+) -> dict[str, dict]:
+    """
+    Successive halving per PKD code: every candidate is trained for the
+    first rung's rounds on the time-ordered folds, the best 1/`halving`
+    move on to `halving` x more rounds, and so on. All PKDs' candidates of
+    a rung run together across the process pool.
+
+    Search state is stored in the registry after every rung, so a run cut
+    short (or stopped by `time_budget` seconds) resumes where it left off;
+    finished PKDs with unchanged data are not searched again unless
+    `retune`. Returns the chosen configuration of every finished PKD.
+    """
+    rungs = rungs or rung_rounds()
+    registry = registry or ModelRegistry("xgb_tuning")
+    pkd_to_vars = load_pkd_to_vars()
+    pkd_codes = sorted(pkd_codes if pkd_codes is not None else pkd_to_vars)
+    matrices = build_matrices(load_store(), load_targets(), pkd_to_vars, pkd_codes)
+    candidates = sample_candidates(n_candidates, seed)
+    config = {"space": SEARCH_SPACE, "candidates": candidates, "rungs": rungs, "halving": halving, "seed": seed}
+
+    folds, states, fps = {}, {}, {}
+    for pkd_code, m in matrices.items():
+        folds[pkd_code] = tuning_folds(m, n_folds)
+        if not folds[pkd_code]:
+            print(f"[WARN] PKD {pkd_code}: too few training years to tune, skipping.")
+            continue
+        fps[pkd_code] = search_fingerprint(m, folds[pkd_code], config)
+        entry = None if retune else registry.load(pkd_code, fps[pkd_code])
+        states[pkd_code] = entry["state"] if entry is not None else new_state(candidates)
+
+    active = [p for p, s in states.items() if not s["done"]]
+    cost = sum(
+        estimated_rounds(n_candidates, rungs, halving, len(folds[p]) * matrices[p].Y.shape[1]) for p in active
+    )
+    workers = max(1, min(workers or os.cpu_count() or 1, len(active) * n_candidates or 1))
+    n_threads = threads_per_job(workers)
+    print(
+        f"Tuning {len(active)} PKD codes ({len(states) - len(active)} cached): {n_candidates} candidates, "
+        f"rungs {rungs}, ~{cost:,} boosting rounds on {workers} workers x {n_threads} threads."
+    )
+
+    start = time.perf_counter()
+    with ExitStack() as stack:
+        pool = None
+        if workers > 1 and active:
+            pool = stack.enter_context(
+                worker_pool(
+                    workers,
+                    n_threads,
+                    _init_worker,
+                    ({p: matrices[p] for p in active}, {p: folds[p] for p in active}, n_threads, seed),
+                )
+            )
+        else:
+            _init_worker(matrices, folds, n_threads, seed)
+        while active:
+            if time_budget is not None and time.perf_counter() - start > time_budget:
+                print(f"Time budget of {time_budget:.0f}s used up; rerun to resume {len(active)} PKD codes.")
+                break
+            tasks = []
+            for pkd_code in active:
+                state = states[pkd_code]
+                rounds = rungs[state["rung"]]
+                checkpoints = rungs[: state["rung"] + 1]
+                tasks += [(pkd_code, i, candidates[i], rounds, checkpoints) for i in state["alive"]]
+                if state["baseline"] is None:
+                    tasks.append((pkd_code, "baseline", BASELINE, BASELINE_ROUNDS, [BASELINE_ROUNDS]))
+            mapped = pool.map(_evaluate_in_worker, tasks) if pool else map(_evaluate_in_worker, tasks)
+            results: dict = {p: {} for p in active}
+            for pkd_code, key, error, best_rounds in mapped:
+                if key == "baseline":
+                    states[pkd_code]["baseline"] = error
+                else:
+                    results[pkd_code][key] = (error, best_rounds)
+            for pkd_code in active:
+                state = states[pkd_code]
+                advance(state, results[pkd_code], rungs, halving)
+                registry.save(pkd_code, fps[pkd_code], state=state)
+            print(
+                f"Rung done: {len(tasks)} fits in {time.perf_counter() - start:.1f}s, "
+                f"{sum(not states[p]['done'] for p in active)} PKD codes still searching."
+            )
+            active = [p for p in active if not states[p]["done"]]
+
+    return {p: chosen_config(s) for p, s in sorted(states.items()) if s["done"]}
+
+
+def save_tuned_params(chosen: dict[str, dict], path: Path = TUNED_PARAMS_PATH) -> None:
+    """Merge into the tuned-parameter file, keeping PKD codes not tuned in this run."""
+    existing = json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+    existing.update(chosen)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(dict(sorted(existing.items())), indent=2) + "\n", encoding="utf-8")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Per-PKD XGBoost hyperparameter search with successive halving over time-ordered folds."
+    )
+    parser.add_argument(
+        "--pkd",
+        nargs="+",
+        default=None,
+        help="PKD codes to tune (default: every code in pkd_to_variables.json).",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Worker processes (default: one per core; 1 runs in-process).",
+    )
+    parser.add_argument("--candidates", type=int, default=DEFAULT_CANDIDATES, help="Configurations per PKD.")
+    parser.add_argument("--min-rounds", type=int, default=MIN_ROUNDS, help="Boosting rounds of the first rung.")
+    parser.add_argument("--max-rounds", type=int, default=MAX_ROUNDS, help="Boosting rounds cap of the last rung.")
+    parser.add_argument("--halving", type=int, default=HALVING, help="Keep 1/N of the candidates per rung.")
+    parser.add_argument("--folds", type=int, default=DEFAULT_FOLDS, help="Validation years per PKD.")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument(
+        "--time-budget",
+        type=float,
+        default=None,
+        help="Stop starting new rungs after this many seconds; the next run resumes.",
+    )
+    parser.add_argument("--retune", action="store_true", help="Ignore stored search state.")
+    parser.add_argument("--output", type=Path, default=TUNED_PARAMS_PATH, help="Tuned parameter JSON.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    if args.halving < 2:
+        raise SystemExit("--halving must be at least 2.")
+    chosen = tune(
+        pkd_codes=args.pkd,
+        workers=args.workers,
+        n_candidates=args.candidates,
+        rungs=rung_rounds(args.min_rounds, args.max_rounds, args.halving),
+        halving=args.halving,
+        n_folds=args.folds,
+        seed=args.seed,
+        time_budget=args.time_budget,
+        retune=args.retune,
+    )
+    for pkd_code, entry in chosen.items():
+        baseline = entry["baseline_cv_error"]
+        print(
+            f"PKD {pkd_code}: CV error {entry['cv_error']:.4f} (baseline {baseline:.4f}) "
+            f"{entry['params'] or 'default parameters'}"
+        )
+    save_tuned_params(chosen, args.output)
+    print(f"Saved tuned parameters for {len(chosen)} PKD codes to: {args.output.resolve()}")
+    print("Use them with: python xgb_pipeline.py --tuned")
+
+
+if __name__ == "__main__":
+    main()